@@ -13,4 +13,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'e_social_media.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from e_social_media_app import chat, live  # noqa: E402 (cần Django đã setup)
+
+
+async def application(scope, receive, send):
+    # HTTP (kể cả SSE /polls/<id>/results/stream/) do Django xử lý; WebSocket là chat (/ws/rooms/<id>/);
+    # lifespan khởi động / dừng pub/sub
+    if scope['type'] == 'lifespan':
+        await live.lifespan(receive, send)
+    elif scope['type'] == 'websocket':
+        await chat.websocket_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -30,6 +30,20 @@ CKEDITOR_UPLOAD_PATH = 'uploads/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# 'blobs': ảnh người dùng (avatar, ảnh bài, ảnh comment, upload chia nhỏ) lưu theo sha256 nội dung, xem
+# e_social_media_app/storage.py; cùng MEDIA_ROOT / MEDIA_URL với 'default'
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'blobs': {
+        'BACKEND': 'e_social_media_app.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
 
@@ -47,6 +61,10 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'e_social_media_app.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
 # Cấu hình JWT
@@ -121,6 +139,78 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# 'productposts' lưu payload ProductPostSerializer đã render (xem e_social_media_app/caching.py).
+# Chạy nhiều worker thì đổi BACKEND sang cache dùng chung, ví dụ
+# 'django.core.cache.backends.redis.RedisCache' với 'LOCATION': 'redis://127.0.0.1:6379'.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'productposts': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'productposts',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+PRODUCT_POST_CACHE = 'productposts'
+
+# Ghi gộp reaction (reactions.py): bật khi một bài nhận quá nhiều like/unlike, thay đổi được giữ trong bộ nhớ
+# của process và ghi xuống DB bằng bulk_create / bulk_update sau mỗi REACTION_FLUSH_INTERVAL giây
+REACTION_WRITE_BEHIND = False
+REACTION_FLUSH_INTERVAL = 2.0
+REACTION_BUFFER_MAX_SIZE = 1000
+
+# Bản thu nhỏ của ảnh (imaging.py): tạo trong thread nền sau khi lưu, False thì tạo ngay sau khi commit.
+# Ảnh cũ hoặc ảnh còn trong hàng đợi khi process tắt: chạy lệnh generate_image_variants
+IMAGE_VARIANTS_IN_BACKGROUND = True
+IMAGE_VARIANT_FORMAT = 'WEBP'
+IMAGE_VARIANT_QUALITY = 80
+
+# Upload chia nhỏ (uploads.py): các phần được ghi vào CHUNKED_UPLOAD_DIR (nên cùng ổ đĩa với MEDIA_ROOT để
+# finalize chỉ cần đổi tên file); upload chưa finalize được xoá bởi lệnh clean_uploads
+CHUNKED_UPLOAD_DIR = os.path.join(BASE_DIR, 'upload_chunks')
+CHUNKED_UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+CHUNKED_UPLOAD_MAX_CHUNK_SIZE = 5 * 1024 * 1024
+
+# gc_media_blobs chỉ xoá blob không được tham chiếu và không được dùng trong khoảng thời gian này (giờ), để kịp
+# gắn upload vừa finalize hoặc khôi phục bài vừa xoá mềm
+MEDIA_BLOB_GC_GRACE_HOURS = 24
+
+# File trong MEDIA_ROOT được trả bởi e_social_media_app.media.serve_media (ETag, Range, Cache-Control).
+# Chạy sau nginx thì đặt MEDIA_ACCEL_REDIRECT = 'nginx' và khai báo
+#     location /protected-media/ { internal; alias <MEDIA_ROOT>/; }
+# để nginx gửi file thay cho worker; Apache / lighttpd (mod_xsendfile) dùng 'sendfile'
+MEDIA_ACCEL_REDIRECT = None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+MEDIA_CACHE_MAX_AGE = 86400
+
+# Pub/sub cho các kết nối trực tiếp (e_social_media_app/live.py). LocalBackend chỉ chạy trong một process;
+# chạy nhiều process / nhiều máy thì dùng
+#     LIVE_PUBSUB_BACKEND = 'e_social_media_app.live.RedisBackend'
+#     LIVE_PUBSUB_OPTIONS = {'url': 'redis://127.0.0.1:6379/0'}
+LIVE_PUBSUB_BACKEND = 'e_social_media_app.live.LocalBackend'
+LIVE_PUBSUB_OPTIONS = {}
+
+# Kết quả poll qua SSE (/polls/<id>/results/stream/, cần server ASGI): mỗi process đọc số phiếu của các poll
+# vừa đổi tối đa một lần mỗi POLL_RESULTS_INTERVAL giây, dùng chung cho mọi kết nối; heartbeat tính bằng giây
+POLL_RESULTS_INTERVAL = 1.0
+POLL_RESULTS_HEARTBEAT = 15
+
+# Chat WebSocket (e_social_media_app/chat.py, ws://<host>/ws/rooms/<id>/?token=<JWT>): tin nhắn được gom và ghi
+# bằng bulk_create sau mỗi CHAT_FLUSH_INTERVAL giây hoặc khi đủ CHAT_BATCH_SIZE; kết nối có quá
+# CHAT_SEND_QUEUE_SIZE event chưa gửi được thì bị đóng. Kênh của room đi qua LIVE_PUBSUB_BACKEND ở trên
+CHAT_FLUSH_INTERVAL = 0.05
+CHAT_BATCH_SIZE = 500
+CHAT_SEND_QUEUE_SIZE = 256
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -14,12 +14,14 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include, re_path
 from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
 from rest_framework import permissions
 from e_social_media_app.admin import my_admin_site
+from e_social_media_app.media import serve_media
 
 
 schema_view = get_schema_view(
@@ -39,6 +41,7 @@ urlpatterns = [
     path('', include('e_social_media_app.urls')),
     path('admin/', my_admin_site.urls),
     path('__debug__/', include('debug_toolbar.urls')),
+    re_path(r'^%s(?P<path>.+)$' % settings.MEDIA_URL.lstrip('/'), serve_media, name='media'),
     re_path(r'^swagger(?P<format>\.json|\.yaml)$',
             schema_view.without_ui(cache_timeout=0),
             name='schema-json'),
@@ -0,0 +1,75 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import imaging
+from .models import MediaBlob, Upload
+from .storage import blob_storage, is_blob
+
+# Cột trỏ vào blob của từng model: cột ảnh (imaging.IMAGE_FIELDS) và file của upload đã finalize (chưa gắn vào đâu
+# thì blob chỉ còn upload giữ)
+REF_FIELDS = {model: field for model, (field, _) in imaging.IMAGE_FIELDS.items()}
+REF_FIELDS[Upload] = 'file'
+
+
+def change_refs(deltas):
+    # deltas: {tên blob: số tham chiếu thêm (+) / bớt (-)}; tên không phải blob (file cũ) được bỏ qua
+    for name, delta in deltas.items():
+        if not is_blob(name) or not delta:
+            continue
+        q = MediaBlob.objects.filter(name=name)
+        if delta < 0:
+            q.filter(ref_count__gte=-delta).update(ref_count=F('ref_count') + delta, last_used=timezone.now())
+        else:
+            q.update(ref_count=F('ref_count') + delta, last_used=timezone.now())
+
+
+def count_refs():
+    # {tên blob: số dòng active trỏ vào}; đọc toàn bộ các cột trong REF_FIELDS, chỉ dùng cho lệnh bảo trì
+    refs = Counter()
+    for model, field in REF_FIELDS.items():
+        rows = model.objects.filter(active=True, **{field + '__startswith': 'blobs/'}).values_list(field, flat=True)
+        refs.update(rows.iterator(chunk_size=2000))
+    return refs
+
+
+def recount_refs():
+    refs = count_refs()
+    updates = []
+    for blob in MediaBlob.objects.only('name', 'ref_count').iterator(chunk_size=2000):
+        if blob.ref_count != refs.get(blob.name, 0):
+            blob.ref_count = refs.get(blob.name, 0)
+            updates.append(blob)
+    MediaBlob.objects.bulk_update(updates, ['ref_count'], batch_size=1000)
+    return len(updates)
+
+
+def delete_blob_files(name):
+    blob_storage().delete(name)
+    # Bản thu nhỏ của blob (imaging.py) dùng chung cho mọi dòng trỏ vào blob
+    for variant in imaging.VARIANTS:
+        for fmt in imaging.FORMAT_EXTENSIONS:
+            default_storage.delete(imaging.variant_path(variant, name, fmt))
+
+
+def collect_garbage(grace=None):
+    """Xoá blob có ref_count = 0 và không được dùng trong `grace`. Trả về số blob đã xoá."""
+    if grace is None:
+        grace = timedelta(hours=getattr(settings, 'MEDIA_BLOB_GC_GRACE_HOURS', 24))
+    before = timezone.now() - grace
+    deleted = 0
+    for blob_id in MediaBlob.objects.filter(ref_count=0, last_used__lt=before).values_list('id', flat=True):
+        with transaction.atomic():
+            # Kiểm tra lại trên dòng đã khoá: storage.save / signals có thể vừa dùng lại blob
+            blob = MediaBlob.objects.select_for_update().filter(id=blob_id, ref_count=0, last_used__lt=before).first()
+            if blob is None:
+                continue
+            delete_blob_files(blob.name)
+            blob.delete()
+            deleted += 1
+    return deleted
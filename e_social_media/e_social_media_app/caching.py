@@ -0,0 +1,150 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+
+from . import dao
+from .models import Account, Comment, PostPoll, ProductPost, ProductPostReaction
+from .reaction_buffer import buffer as reaction_buffer
+from .serializers import PostPollSerializer, ProductPostSerializer
+
+
+def get_cache():
+    # Backend cấu hình trong settings.CACHES (mặc định locmem, có thể đổi sang redis/memcached dùng chung)
+    return caches[getattr(settings, 'PRODUCT_POST_CACHE', 'default')]
+
+
+def payload_key(post_id, version, variant):
+    return 'productpost:%s:%s:%s' % (post_id, version, variant)
+
+
+def get_versions(post_ids):
+    """
+    {post_id: version} của các bài còn tồn tại. Version là ProductPost.cache_version đọc từ DB, được tăng trong cùng
+    transaction với thay đổi (invalidate_product_posts, hoặc ngay trong câu UPDATE bộ đếm của dao.change_counter),
+    nên mọi worker thấy cùng một version (không phụ thuộc cache cục bộ của từng process).
+    """
+    return dict(ProductPost.objects.filter(id__in=post_ids).values_list('id', 'cache_version'))
+
+
+def invalidate_product_posts(post_ids):
+    # Tăng cache_version của các bài: payload cache cũ và ETag cũ không còn khớp. updated_date giữ nguyên cho lần sửa bài
+    post_ids = list(post_ids)
+    if post_ids:
+        ProductPost.objects.filter(id__in=post_ids).update(cache_version=F('cache_version') + 1)
+
+
+# Cột của Account có trong payload bài (tác giả, comment, reaction); lưu với update_fields không chứa cột nào thì bỏ qua
+ACCOUNT_FIELDS = {'user', 'user_id', 'role', 'role_id', 'avatar', 'avatar_variants'}
+
+
+def invalidate_account(account_id):
+    # Account xuất hiện ở tác giả bài, comment và reaction của bài
+    post_ids = set(ProductPost.objects.filter(account_id=account_id).values_list('id', flat=True))
+    post_ids.update(Comment.objects.filter(account_id=account_id).values_list('post_id', flat=True))
+    post_ids.update(ProductPostReaction.objects.filter(account_id=account_id).values_list('product_post_id', flat=True))
+    invalidate_product_posts(post_ids)
+
+
+# Poll đã đóng không còn thay đổi: payload của PostPollSerializer được cache không hết hạn (polls.close_polls
+# đưa vào ngay khi đóng), xoá khi poll bị sửa / xoá
+def closed_poll_key(poll_id):
+    return 'postpoll:%s:closed' % poll_id
+
+
+def get_closed_poll(poll_id):
+    return get_cache().get(closed_poll_key(poll_id))
+
+
+def set_closed_poll(poll_id, data):
+    get_cache().set(closed_poll_key(poll_id), data, timeout=None)
+
+
+def cache_closed_polls(poll_ids):
+    get_cache().set_many({closed_poll_key(poll.id): PostPollSerializer(poll).data
+                          for poll in PostPoll.objects.filter(id__in=poll_ids, is_closed=True)}, timeout=None)
+
+
+def invalidate_closed_poll(poll_id):
+    transaction.on_commit(lambda: get_cache().delete(closed_poll_key(poll_id)))
+
+
+def get_variant(context):
+    # Mỗi tổ hợp ?fields= / ?expand= cho ra một payload khác nhau
+    request = context.get('request')
+    params = ''
+    if request is not None:
+        params = '%s|%s' % (request.query_params.get('fields', ''), request.query_params.get('expand'))
+    return hashlib.md5(params.encode('utf-8')).hexdigest()[:12]
+
+
+def render_product_posts(post_ids, context):
+    """Trả về payload ProductPostSerializer theo đúng thứ tự post_ids, chỉ serialize các bài chưa có trong cache."""
+    cache = get_cache()
+    variant = get_variant(context)
+    versions = get_versions(post_ids)
+    keys = {payload_key(post_id, versions[post_id], variant): post_id for post_id in post_ids if post_id in versions}
+    payloads = {keys[key]: data for key, data in cache.get_many(keys.keys()).items()}
+
+    missing = [post_id for post_id in post_ids if post_id in versions and post_id not in payloads]
+    if missing:
+        q = dao.load_productpost_feed(ProductPost.objects.filter(id__in=missing),
+                                      ProductPostSerializer(context=context))
+        posts = list(q)
+        data = ProductPostSerializer(posts, many=True, context=context).data
+        rendered = {post.id: dict(item) for post, item in zip(posts, data)}
+        cache.set_many({payload_key(post_id, versions[post_id], variant): item
+                        for post_id, item in rendered.items()})
+        payloads.update(rendered)
+
+    # Bài đã bị xoá giữa lúc phân trang và lúc render thì bỏ qua
+    post_ids = [post_id for post_id in post_ids if post_id in payloads]
+    payloads = add_viewer_state(post_ids, [payloads[post_id] for post_id in post_ids], context)
+    return add_pending_reactions(post_ids, payloads, context)
+
+
+def add_viewer_state(post_ids, payloads, context):
+    # viewer_reaction / viewer_commented khác nhau theo người xem nên không nằm trong cache: một query cho cả trang
+    if not payloads or not ({'viewer_reaction', 'viewer_commented'} & payloads[0].keys()):
+        return payloads
+    user = getattr(context.get('request'), 'user', None)
+    state = dao.load_viewer_state(post_ids, user.id) if user is not None and user.is_authenticated else {}
+    for post_id, payload in zip(post_ids, payloads):
+        reaction, commented = state.get(post_id, (None, False))
+        if 'viewer_reaction' in payload:
+            payload['viewer_reaction'] = reaction
+        if 'viewer_commented' in payload:
+            payload['viewer_commented'] = commented
+    return payloads
+
+
+def add_pending_reactions(post_ids, payloads, context, model=ProductPostReaction):
+    # Chế độ ghi gộp: cộng các reaction đang chờ ghi (ProductPostReaction / PostReaction) vào bộ đếm và trạng thái người xem
+    if not payloads or not len(reaction_buffer):
+        return payloads
+    deltas = reaction_buffer.post_deltas(model, post_ids)
+    viewer = {}
+    user = getattr(context.get('request'), 'user', None)
+    if 'viewer_reaction' in payloads[0] and user is not None and user.is_authenticated:
+        account_id = Account.objects.filter(user_id=user.id).values_list('id', flat=True).first()
+        viewer = reaction_buffer.account_reactions(model, post_ids, account_id)
+
+    for post_id, payload in zip(post_ids, payloads):
+        count, summary = deltas.get(post_id, (0, {}))
+        if count and 'reaction_count' in payload:
+            payload['reaction_count'] += count
+        if summary and 'reaction_summary' in payload:
+            merged = dict(payload['reaction_summary'])
+            for reaction, delta in summary.items():
+                merged[reaction] = merged.get(reaction, 0) + delta
+            payload['reaction_summary'] = {reaction: n for reaction, n in merged.items() if n > 0}
+        if post_id in viewer and 'viewer_reaction' in payload:
+            payload['viewer_reaction'] = viewer[post_id]
+    return payloads
+
+
+def render_product_post(post_id, context):
+    payloads = render_product_posts([post_id], context)
+    return payloads[0] if payloads else None
@@ -0,0 +1,292 @@
+import asyncio
+import contextvars
+import json
+import logging
+import re
+import uuid
+import weakref
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .live import broker, database_sync_to_async
+from .models import Account, Message, Room
+
+logger = logging.getLogger(__name__)
+
+# ws://<host>/ws/rooms/<id>/?token=<JWT access token> (trình duyệt không đặt được header Authorization cho WebSocket)
+ROOM_PATH = re.compile(r'^/ws/rooms/(?P<room_id>\d+)/$')
+MAX_CONTENT_LENGTH = Message._meta.get_field('content').max_length
+
+
+def room_topic(room_id):
+    return 'room:%s' % room_id
+
+
+def encode(event):
+    return json.dumps(event, ensure_ascii=False, separators=(',', ':'))
+
+
+def authorize(room_id, token):
+    """Id account của chủ JWT nếu là một trong hai người của room, không thì None."""
+    if not token:
+        return None
+    auth = JWTAuthentication()
+    try:
+        user = auth.get_user(auth.get_validated_token(token))
+    except AuthenticationFailed:
+        return None
+    room = Room.objects.filter(id=room_id, active=True).values_list('first_user_id', 'second_user_id').first()
+    account_id = Account.objects.filter(user_id=user.id).values_list('id', flat=True).first()
+    if room is None or account_id is None or account_id not in room:
+        return None
+    return account_id
+
+
+def message_event(message):
+    return {'type': 'message', 'id': message.id, 'uuid': str(message.uuid), 'room': message.room_id,
+            'who_sent': message.who_sent_id, 'content': message.content,
+            'created_date': message.created_date.isoformat(), 'updated_date': message.updated_date.isoformat()}
+
+
+def last_senders(room_ids):
+    # {room_id: account gửi tin cuối}, một query cho cả lô
+    last_ids = Message.objects.filter(room_id__in=room_ids, active=True).values('room_id').annotate(last=Max('id')) \
+        .values('last')
+    return dict(Message.objects.filter(id__in=last_ids).values_list('room_id', 'who_sent_id'))
+
+
+def save_batch(events):
+    """
+    Ghi một lô sự kiện chat theo đúng thứ tự nhận:
+        ('message', room_id, account_id, content, uuid) / ('seen', room_id, account_id)
+    Tin nhắn mới vào DB bằng một bulk_create, Room được cập nhật bằng vài câu UPDATE theo trạng thái cuối của lô;
+    sau khi commit mỗi sự kiện được publish (đã encode) vào kênh của room. Trả về {uuid: ack cho người gửi}.
+    """
+    messages = [event for event in events if event[0] == 'message']
+    uuids = {event[4] for event in messages}
+    now = timezone.now()
+    broadcasts = []
+    acks = {}
+
+    with transaction.atomic():
+        # uuid đã có: client gửi lại sau khi mất kết nối, chỉ ack lại, không tạo / gửi lại tin nhắn
+        existing = {row[0]: row for row in Message.objects.filter(uuid__in=uuids)
+                    .values_list('uuid', 'id', 'room_id', 'who_sent_id')}
+        new = {}
+        for _, room_id, account_id, content, message_uuid in messages:
+            if message_uuid not in existing and message_uuid not in new:
+                new[message_uuid] = Message(uuid=message_uuid, room_id=room_id, who_sent_id=account_id, content=content)
+        # ignore_conflicts: process khác vừa ghi cùng uuid. MySQL không trả id sau bulk_create nên đọc lại theo uuid
+        Message.objects.bulk_create(new.values(), ignore_conflicts=True)
+        ids = dict(Message.objects.filter(uuid__in=new).values_list('uuid', 'id'))
+        for message_uuid, message in new.items():
+            message.id = ids.get(message_uuid)
+            existing[message_uuid] = (message_uuid, message.id, message.room_id, message.who_sent_id)
+
+        # Trạng thái cuối của mỗi room: [người gửi tin cuối, đã xem, có tin mới trong lô]
+        seen_rooms = {event[1] for event in events if event[0] == 'seen'}
+        senders = last_senders(seen_rooms) if seen_rooms else {}
+        rooms = {}
+        broadcast_uuids = set()
+        for event in events:
+            room_id, account_id = event[1], event[2]
+            if event[0] == 'message':
+                message = new.get(event[4])
+                if message is not None and event[4] not in broadcast_uuids:
+                    broadcast_uuids.add(event[4])
+                    rooms[room_id] = [account_id, False, True]
+                    broadcasts.append((room_id, encode(message_event(message))))
+            else:
+                state = rooms.setdefault(room_id, [senders.get(room_id), None, False])
+                # Chỉ người nhận mới "xem" được tin nhắn cuối
+                if state[0] is not None and state[0] != account_id and not state[1]:
+                    state[1] = True
+                    broadcasts.append((room_id, encode({'type': 'seen', 'room': room_id, 'account': account_id})))
+
+        groups = {}
+        for room_id, (_, seen, has_message) in rooms.items():
+            if has_message or seen:
+                groups.setdefault((has_message, bool(seen)), []).append(room_id)
+        for (has_message, seen), room_ids in groups.items():
+            values = {'seen': seen, 'updated_date': now}
+            if has_message:
+                values['received_message_date'] = now
+            Room.objects.filter(id__in=room_ids).update(**values)
+
+    for _, room_id, account_id, content, message_uuid in messages:
+        message_uuid, message_id, message_room, who_sent = existing.get(message_uuid, (message_uuid, None, None, None))
+        if message_id is None or message_room != room_id or who_sent != account_id:
+            acks[message_uuid] = {'type': 'error', 'client_id': str(message_uuid), 'detail': 'Message was not saved.'}
+        else:
+            acks[message_uuid] = {'type': 'ack', 'client_id': str(message_uuid), 'id': message_id, 'room': room_id}
+    for room_id, text in broadcasts:
+        broker.publish(room_topic(room_id), text)
+    return acks
+
+
+class ChatWriter:
+    """
+    Gom tin nhắn / 'seen' của mọi kết nối trong event loop rồi ghi theo lô: sau CHAT_FLUSH_INTERVAL giây hoặc khi đủ
+    CHAT_BATCH_SIZE sự kiện. Chỉ dùng trong loop đó nên không cần khoá.
+    """
+
+    def __init__(self, interval, batch_size):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.events = []
+        self.callbacks = {}  # uuid -> [callback(ack)]
+        self.full = asyncio.Event()
+        self.task = None
+
+    def add(self, event, callback=None):
+        self.events.append(event)
+        if callback is not None:
+            self.callbacks.setdefault(event[4], []).append(callback)
+        if len(self.events) >= self.batch_size:
+            self.full.set()
+        if self.task is None:
+            # Context rỗng như polls.PollWatchers: không gắn vào context của kết nối đã mở task
+            self.task = contextvars.Context().run(asyncio.get_running_loop().create_task, self.run())
+
+    async def run(self):
+        try:
+            while self.events:
+                try:
+                    await asyncio.wait_for(self.full.wait(), timeout=self.interval)
+                except asyncio.TimeoutError:
+                    pass
+                events, self.events = self.events[:self.batch_size], self.events[self.batch_size:]
+                if len(self.events) < self.batch_size:
+                    self.full.clear()
+                callbacks = {event[4]: self.callbacks.pop(event[4], []) for event in events if event[0] == 'message'}
+                try:
+                    acks = await database_sync_to_async(save_batch)(events)
+                except Exception:
+                    logger.exception('Cannot save chat messages')
+                    acks = {}
+                for message_uuid, targets in callbacks.items():
+                    ack = acks.get(message_uuid) or {'type': 'error', 'client_id': str(message_uuid),
+                                                     'detail': 'Message was not saved.'}
+                    for callback in targets:
+                        callback(ack)
+        finally:
+            self.task = None
+
+
+writers = weakref.WeakKeyDictionary()  # event loop -> ChatWriter
+
+
+def get_writer():
+    loop = asyncio.get_running_loop()
+    if loop not in writers:
+        writers[loop] = ChatWriter(getattr(settings, 'CHAT_FLUSH_INTERVAL', 0.05),
+                                   getattr(settings, 'CHAT_BATCH_SIZE', 500))
+    return writers[loop]
+
+
+class ChatConnection:
+    """
+    Một WebSocket trong room. Client gửi JSON:
+        {"type": "message", "content": "...", "client_id": "<uuid, tuỳ chọn>"} -> {"type": "ack", "client_id", "id"}
+        {"type": "seen"}                      -> Room.seen = True nếu người gửi tin cuối là người kia
+        {"type": "delivered", "id": <id>}     -> báo cho room là đã nhận tin nhắn (không ghi DB)
+    và nhận các event 'message' / 'seen' / 'delivered' của room. Event đã được encode một lần khi publish,
+    mỗi kết nối chỉ chuyển tiếp chuỗi đó (không đọc DB).
+    """
+
+    def __init__(self, room_id, account_id, send):
+        self.room_id = room_id
+        self.account_id = account_id
+        self.send = send
+        self.outgoing = asyncio.Queue(maxsize=getattr(settings, 'CHAT_SEND_QUEUE_SIZE', 256))
+
+    def push(self, text):
+        try:
+            self.outgoing.put_nowait(text)
+        except asyncio.QueueFull:
+            # Client không đọc kịp: đóng kết nối (client kết nối lại và tải lịch sử qua /rooms/<id>/messages/)
+            while not self.outgoing.empty():
+                self.outgoing.get_nowait()
+            self.outgoing.put_nowait(None)
+
+    def push_event(self, event):
+        self.push(encode(event))
+
+    async def send_loop(self):
+        while True:
+            text = await self.outgoing.get()
+            if text is None:
+                await self.send({'type': 'websocket.close', 'code': 1013})
+                return
+            await self.send({'type': 'websocket.send', 'text': text})
+
+    async def handle(self, text):
+        try:
+            data = json.loads(text)
+        except (TypeError, ValueError):
+            data = None
+        if not isinstance(data, dict):
+            self.push_event({'type': 'error', 'detail': 'Expected a JSON object.'})
+            return
+
+        kind = data.get('type')
+        if kind == 'message':
+            content = data.get('content')
+            if not isinstance(content, str) or not content.strip() or len(content) > MAX_CONTENT_LENGTH:
+                self.push_event({'type': 'error', 'client_id': data.get('client_id'), 'detail': 'Invalid content.'})
+                return
+            try:
+                message_uuid = uuid.UUID(str(data['client_id'])) if data.get('client_id') else uuid.uuid4()
+            except ValueError:
+                self.push_event({'type': 'error', 'client_id': data.get('client_id'), 'detail': 'Invalid client_id.'})
+                return
+            get_writer().add(('message', self.room_id, self.account_id, content, message_uuid), self.push_event)
+        elif kind == 'seen':
+            get_writer().add(('seen', self.room_id, self.account_id))
+        elif kind == 'delivered':
+            event = {'type': 'delivered', 'room': self.room_id, 'account': self.account_id, 'id': data.get('id')}
+            await sync_to_async(broker.publish, thread_sensitive=False)(room_topic(self.room_id), encode(event))
+        else:
+            self.push_event({'type': 'error', 'detail': 'Unknown message type.'})
+
+    async def run(self, receive):
+        token = broker.subscribe(room_topic(self.room_id), self.push)
+        sender = asyncio.ensure_future(self.send_loop())
+        try:
+            while not sender.done():
+                message = await receive()
+                if message['type'] == 'websocket.disconnect':
+                    break
+                if message['type'] == 'websocket.receive':
+                    text = message.get('text')
+                    if text is None and message.get('bytes') is not None:
+                        text = message['bytes'].decode('utf-8', 'replace')
+                    await self.handle(text)
+        finally:
+            broker.unsubscribe(room_topic(self.room_id), token)
+            sender.cancel()
+
+
+async def websocket_application(scope, receive, send):
+    """WebSocket của e_social_media.asgi: chat trong room giữa hai account."""
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    match = ROOM_PATH.match(scope['path'])
+    account_id = None
+    if match is not None:
+        token = parse_qs(scope.get('query_string', b'').decode()).get('token', [None])[0]
+        account_id = await database_sync_to_async(authorize)(int(match['room_id']), token)
+    if account_id is None:
+        # Đóng trước khi accept: server trả 403 cho handshake
+        await send({'type': 'websocket.close', 'code': 4403})
+        return
+    await send({'type': 'websocket.accept'})
+    await ChatConnection(int(match['room_id']), account_id, send).run(receive)
@@ -1,13 +1,20 @@
-from django.db.models import Count
+from django.db.models import Count, Exists, F, OuterRef, Prefetch, Subquery, IntegerField
+from django.db.models.functions import Coalesce
 
-from .models import User, Post, Account,ProductPost
+from . import search
+from .models import User, Post, Account, ProductPost, Comment, ProductPostReaction, PostReaction, \
+    ProductPostReactionSummary
+
+# Số comment mới nhất được nhúng vào mỗi bài trong feed
+COMMENT_PREVIEW_SIZE = 3
 
 def load_user(params={}):
-    q = User.objects.filter(active=True)
+    q = User.objects.filter(is_active=True)
 
     keyword = params.get("keyword")
     if keyword:
-        q = q.filter(username__icontains=keyword)
+        user_ids = search.search_user_ids(keyword)
+        q = q.filter(id__in=user_ids) if user_ids is not None else q
 
     return q
 
@@ -16,7 +23,8 @@ def load_account(params={}):
 
     keyword = params.get("keyword")
     if keyword:
-        q = q.filte(phone_number__icontains=keyword)
+        user_ids = search.search_user_ids(keyword)
+        q = q.filter(user_id__in=user_ids) if user_ids is not None else q
 
     role_id = params.get("role_id")
     if role_id:
@@ -31,7 +39,110 @@ def load_productpost(params={}):
 
     keyword = params.get("keyword")
     if keyword:
-        q = q.filter(productpost_content__icontains=keyword)
+        q = q.filter(id__in=search.search_product_posts(keyword).values('post_id'))
 
     return q
 
+
+def count_subquery(model, fk_name):
+    # Đếm các dòng con còn active bằng subquery (không nhân dòng khi đếm nhiều bảng con cùng lúc)
+    counts = model.objects.filter(**{fk_name: OuterRef('pk')}, active=True).order_by() \
+        .values(fk_name).annotate(c=Count('id')).values('c')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def change_counter(model, pk, field, delta):
+    # UPDATE ... SET field = field + delta, không đọc-sửa-ghi nên không mất cập nhật khi ghi đồng thời
+    q = model.objects.filter(pk=pk)
+    if delta < 0:
+        q = q.filter(**{'%s__gte' % field: -delta})
+    values = {field: F(field) + delta}
+    if model is ProductPost:
+        # Bộ đếm nằm trong payload bài: tăng cache_version trong cùng câu UPDATE
+        values['cache_version'] = F('cache_version') + 1
+    return q.update(**values)
+
+
+def recount_post_counters():
+    # Tính lại toàn bộ bộ đếm bằng một câu UPDATE cho mỗi bảng
+    return {
+        'productpost': ProductPost.objects.update(
+            reaction_count=count_subquery(ProductPostReaction, 'product_post'),
+            comment_count=count_subquery(Comment, 'post'),
+            cache_version=F('cache_version') + 1,
+        ),
+        'post': Post.objects.update(reaction_count=count_subquery(PostReaction, 'post')),
+        'comment': recount_reply_counts(),
+    }
+
+
+def reaction_summary_map(summaries):
+    # {reaction_id: số lượng} từ PostReactionSummary / ProductPostReactionSummary, bỏ các loại đã về 0
+    return {summary.reaction_id: summary.reaction_count for summary in summaries if summary.reaction_count}
+
+
+def recount_reply_counts():
+    # MySQL không cho UPDATE bảng comment với subquery trên chính nó: đếm trước rồi cập nhật theo lô
+    counts = Comment.objects.filter(active=True, parent__isnull=False).values_list('parent_id') \
+        .annotate(c=Count('id')).order_by()
+    Comment.objects.filter(reply_count__gt=0).update(reply_count=0)
+    return Comment.objects.bulk_update([Comment(id=parent_id, reply_count=c) for parent_id, c in counts],
+                                       ['reply_count'], batch_size=1000)
+
+
+def comment_preview_queryset():
+    # Chỉ comment gốc, trả lời xem qua product-posts/<id>/comments/?parent=<comment id>
+    return Comment.objects.filter(active=True, parent__isnull=True).order_by('-created_date', '-id')
+
+
+def load_comment_thread(comment, q=None):
+    """Cả cây con của comment (kể cả chính nó) theo thứ tự path: một query trên index (post, path)."""
+    if q is None:
+        q = Comment.objects.filter(active=True)
+    return q.filter(post_id=comment.post_id, path__startswith=comment.path)
+
+
+def related_paths(serializer, paths, prefix=''):
+    # Chỉ giữ các quan hệ mà serializer (sau ?fields=/?expand=) còn dùng tới
+    wants = getattr(serializer, 'wants', None)
+    return [p.replace('.', '__') for p in paths if wants is None or wants(prefix + p)]
+
+
+def select_related_for(q, serializer, paths, prefix=''):
+    related = related_paths(serializer, paths, prefix)
+    # select_related() không tham số sẽ join mọi khoá ngoại, nên phải bỏ qua khi rỗng
+    return q.select_related(*related) if related else q
+
+
+def load_viewer_state(post_ids, user_id):
+    """{post_id: (reaction_id hoặc None, đã comment hay chưa)} của người xem trên các bài, trong một query."""
+    reaction = ProductPostReaction.objects.filter(product_post=OuterRef('pk'), account__user_id=user_id, active=True) \
+        .values('reaction_id')[:1]
+    commented = Comment.objects.filter(post=OuterRef('pk'), account__user_id=user_id, active=True)
+    rows = ProductPost.objects.filter(id__in=list(post_ids)) \
+        .annotate(viewer_reaction=Subquery(reaction), viewer_commented=Exists(commented)) \
+        .values_list('id', 'viewer_reaction', 'viewer_commented')
+    return {post_id: (reaction_id, commented) for post_id, reaction_id, commented in rows}
+
+
+def load_productpost_feed(q=None, serializer=None):
+    """Queryset ProductPost cho feed: số query mỗi trang cố định, không phụ thuộc số comment/reaction."""
+    if q is None:
+        q = ProductPost.objects.all()
+
+    q = select_related_for(q, serializer, ['account', 'account.user', 'product', 'product.category'])
+
+    wants = getattr(serializer, 'wants', lambda path: True)
+    if wants('comment'):
+        comments = select_related_for(comment_preview_queryset(), serializer,
+                                      ['account', 'account.user'], prefix='comment.')
+        q = q.prefetch_related(Prefetch('comment_set', queryset=comments[:COMMENT_PREVIEW_SIZE],
+                                        to_attr='comment_preview'))
+    if wants('reaction'):
+        reactions = select_related_for(ProductPostReaction.objects.all(), serializer,
+                                       ['account', 'account.user', 'reaction'], prefix='reaction.')
+        q = q.prefetch_related(Prefetch('productpostreaction_set', queryset=reactions))
+    if wants('reaction_summary'):
+        q = q.prefetch_related(Prefetch('reaction_summaries',
+                                        queryset=ProductPostReactionSummary.objects.filter(reaction_count__gt=0)))
+    return q
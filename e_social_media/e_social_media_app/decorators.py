@@ -1,7 +1,13 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.views.decorators.http import condition
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
 
+from . import caching, reaction_buffer
+from .models import Account, ProductPostReaction
 from .serializers import PostReactionSerializer
 
 authorization = swagger_auto_schema(
@@ -17,3 +23,62 @@ authorization = swagger_auto_schema(
     order=['Authorization', 'header']
 )
 
+
+
+# ==== CONDITIONAL GET (ETag / Last-Modified) ====
+# ETag và Last-Modified lấy từ dữ liệu version của model (không băm nội dung response),
+# khớp If-None-Match / If-Modified-Since thì trả 304 mà không chạy view / serializer.
+
+def conditional_get(version_func):
+    """version_func(request, *args, **kwargs) -> (các giá trị version, datetime thay đổi cuối) hoặc (None, None)"""
+
+    def get_version(request, *args, **kwargs):
+        if not hasattr(request, '_model_version'):
+            request._model_version = version_func(request, *args, **kwargs)
+        return request._model_version
+
+    def etag(request, *args, **kwargs):
+        parts, _ = get_version(request, *args, **kwargs)
+        if parts is None:
+            return None
+        # Đường dẫn đầy đủ (kèm ?fields=, ?page=...) cũng là một phần của version
+        return hashlib.md5(repr((request.get_full_path(), parts)).encode('utf-8')).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        return get_version(request, *args, **kwargs)[1]
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+
+def table_version(model):
+    # Số dòng + updated_date lớn nhất: thay đổi khi thêm, sửa hoặc xoá dòng. Chỉ dùng làm ETag: xoá hẳn một dòng
+    # không làm Max(updated_date) tăng nên không thể dùng làm Last-Modified
+    def version(request, *args, **kwargs):
+        info = model.objects.aggregate(count=Count('id'), last=Max('updated_date'))
+        return (model._meta.label, info['count'], info['last']), None
+    return version
+
+
+def current_account_version(request, *args, **kwargs):
+    account = Account.objects.filter(user_id=request.user.id) \
+        .values('id', 'updated_date', 'role_id', 'role__updated_date').first()
+    if account is None:
+        return None, None
+    dates = [d for d in (account['updated_date'], account['role__updated_date']) if d]
+    return tuple(account.values()), max(dates) if dates else None
+
+
+def product_post_version(request, *args, **kwargs):
+    post_id = kwargs.get('product_post_id')
+    if post_id is None:
+        return None, None
+    version = caching.get_versions([post_id]).get(post_id)
+    if version is None:
+        return None, None
+    # Payload có viewer_reaction / viewer_commented nên ETag khác nhau theo người xem (token hoặc session)
+    viewer = request.META.get('HTTP_AUTHORIZATION') or request.user.pk
+    # Reaction đang chờ ghi (chế độ ghi gộp) được cộng vào payload lúc đọc nên cũng là một phần của ETag
+    buffer = reaction_buffer.buffer
+    pending = buffer.post_deltas(ProductPostReaction, [post_id]).get(post_id) if len(buffer) else None
+    # cache_version là số đếm, không phải thời điểm: chỉ dùng làm ETag
+    return ('productpost', post_id, version, viewer, repr(pending)), None
@@ -0,0 +1,140 @@
+from bisect import bisect_right
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, IntegerField, Sum, Value, When
+
+from .models import ProductPost, ProductPostCatalogFacet, ProductPostFacet
+
+# Mốc giá (VNĐ): khoảng i là [PRICE_BUCKETS[i], PRICE_BUCKETS[i + 1]), khoảng cuối không có cận trên.
+# Đổi mốc thì phải chạy lại `manage.py rebuild_product_facets`.
+PRICE_BUCKETS = (0, 1_000_000, 5_000_000, 10_000_000, 20_000_000, 50_000_000)
+# Các cột của ProductPost quyết định bài thuộc dòng ProductPostFacet nào
+KEY_FIELDS = ('category_id', 'price', 'account_id', 'active')
+
+
+def price_bucket(price):
+    return max(bisect_right(PRICE_BUCKETS, price) - 1, 0)
+
+
+def bucket_range(bucket):
+    high = PRICE_BUCKETS[bucket + 1] if bucket + 1 < len(PRICE_BUCKETS) else None
+    return PRICE_BUCKETS[bucket], high
+
+
+def buckets_in_range(min_price=None, max_price=None):
+    # Các khoảng giá giao với [min_price, max_price]; facet chỉ chính xác tới mốc của khoảng
+    first = price_bucket(min_price) if min_price is not None else 0
+    last = price_bucket(max_price) if max_price is not None else len(PRICE_BUCKETS) - 1
+    return list(range(first, last + 1))
+
+
+def facet_key(values):
+    """(category_id, price_bucket, account_id, active) từ dict giá trị của ProductPost, None nếu bài không có sản phẩm."""
+    category_id, price, account_id, active = (values.get(field) for field in KEY_FIELDS)
+    if category_id is None or price is None or account_id is None:
+        return None
+    return category_id, price_bucket(price), account_id, bool(active)
+
+
+def stored_key(post_id):
+    values = ProductPost.objects.filter(id=post_id).values(*KEY_FIELDS).first()
+    return facet_key(values) if values else None
+
+
+def change_count(model, delta, **key):
+    q = model.objects.filter(**key)
+    if delta < 0:
+        q.filter(post_count__gte=-delta).update(post_count=F('post_count') + delta)
+    elif not q.update(post_count=F('post_count') + delta):
+        try:
+            with transaction.atomic():
+                model.objects.create(post_count=delta, **key)
+        except IntegrityError:
+            # Request khác vừa tạo dòng này
+            q.update(post_count=F('post_count') + delta)
+
+
+def change_facets(deltas):
+    # deltas: {facet_key: số bài thêm (+) / bớt (-)}; cập nhật cả dòng theo người đăng lẫn dòng tổng của catalog
+    totals = Counter()
+    for key, delta in deltas.items():
+        if key is None or not delta:
+            continue
+        category_id, bucket, account_id, active = key
+        change_count(ProductPostFacet, delta, category_id=category_id, price_bucket=bucket, account_id=account_id,
+                     active=active)
+        totals[category_id, bucket, active] += delta
+    for (category_id, bucket, active), delta in totals.items():
+        if delta:
+            change_count(ProductPostCatalogFacet, delta, category_id=category_id, price_bucket=bucket, active=active)
+
+
+def move_facets(old_keys, new_keys):
+    deltas = Counter()
+    deltas.subtract(old_keys)
+    deltas.update(new_keys)
+    change_facets(deltas)
+
+
+def rebuild_facets():
+    # GROUP BY trên toàn bảng ProductPost: chỉ dùng cho lệnh bảo trì / migration, không dùng trong request
+    bucket = Case(*[When(price__gte=edge, then=Value(i)) for i, edge in reversed(list(enumerate(PRICE_BUCKETS)))],
+                  default=Value(0), output_field=IntegerField())
+    rows = ProductPost.objects.filter(category__isnull=False, price__isnull=False, account__isnull=False) \
+        .annotate(bucket=bucket).values('category_id', 'bucket', 'account_id', 'active') \
+        .annotate(post_count=Count('id')).order_by()
+    with transaction.atomic():
+        ProductPostFacet.objects.all().delete()
+        ProductPostFacet.objects.bulk_create([
+            ProductPostFacet(category_id=row['category_id'], price_bucket=row['bucket'], account_id=row['account_id'],
+                             active=row['active'], post_count=row['post_count'])
+            for row in rows
+        ], batch_size=1000)
+        ProductPostCatalogFacet.objects.all().delete()
+        ProductPostCatalogFacet.objects.bulk_create([
+            ProductPostCatalogFacet(category_id=row['category_id'], price_bucket=row['price_bucket'],
+                                    active=row['active'], post_count=row['post_count'])
+            for row in ProductPostFacet.objects.values('category_id', 'price_bucket', 'active')
+            .annotate(post_count=Sum('post_count')).order_by()
+        ], batch_size=1000)
+    return ProductPostFacet.objects.count()
+
+
+def get_facets(category_ids=None, min_price=None, max_price=None, active=True, account_id=None):
+    """
+    Facet của catalog, đọc từ ProductPostCatalogFacet (hoặc ProductPostFacet của một người đăng khi lọc theo owner)
+    thay vì GROUP BY trên ProductPost. Các bảng này chỉ có vài dòng cho mỗi danh mục nên đọc hết rồi cộng ở đây.
+    Mỗi facet áp dụng mọi bộ lọc trừ bộ lọc của chính nó (đếm theo danh mục thì bỏ lọc danh mục...).
+    """
+    if account_id is not None:
+        q = ProductPostFacet.objects.filter(account_id=account_id)
+    else:
+        q = ProductPostCatalogFacet.objects.all()
+    q = q.filter(post_count__gt=0)
+    if active is not None:
+        q = q.filter(active=active)
+
+    buckets = set(buckets_in_range(min_price, max_price)) if min_price is not None or max_price is not None else None
+    category_ids = set(category_ids) if category_ids else None
+    by_category = Counter()
+    counts = Counter()
+    names = {}
+    for category_id, name, bucket, post_count in q.values_list('category_id', 'category__category_name',
+                                                               'price_bucket', 'post_count'):
+        names[category_id] = name
+        if buckets is None or bucket in buckets:
+            by_category[category_id] += post_count
+        if category_ids is None or category_id in category_ids:
+            counts[bucket] += post_count
+
+    prices = []
+    for bucket in range(len(PRICE_BUCKETS)):
+        low, high = bucket_range(bucket)
+        prices.append({'bucket': bucket, 'min': low, 'max': high, 'count': counts.get(bucket, 0)})
+
+    return {
+        'categories': [{'id': category_id, 'name': names[category_id], 'count': by_category[category_id]}
+                       for category_id in sorted(by_category)],
+        'prices': prices,
+    }
@@ -0,0 +1,166 @@
+import logging
+import os
+import queue
+import threading
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from . import caching
+from .models import Account, Comment, ProductPost
+
+logger = logging.getLogger(__name__)
+
+# model -> (field ảnh gốc, field JSON lưu các bản thu nhỏ)
+IMAGE_FIELDS = {
+    Account: ('avatar', 'avatar_variants'),
+    ProductPost: ('post_image_url', 'post_image_variants'),
+    Comment: ('comment_image_url', 'comment_image_variants'),
+}
+
+# tên bản -> (kích thước tối đa, cắt vuông); thumbnail dùng cho avatar trong comment, feed cho danh sách bài
+VARIANTS = {
+    'thumbnail': ((160, 160), True),
+    'feed': ((720, 720), False),
+    'full': ((1600, 1600), False),
+}
+
+FORMAT_EXTENSIONS = {'WEBP': 'webp', 'AVIF': 'avif', 'JPEG': 'jpg'}
+
+
+def variant_format():
+    # Pillow build thiếu encoder WEBP/AVIF thì quay về JPEG
+    name = getattr(settings, 'IMAGE_VARIANT_FORMAT', 'WEBP')
+    return name if name == 'JPEG' or features.check(name.lower()) else 'JPEG'
+
+
+def variant_path(variant, name, fmt):
+    return 'variants/%s/%s.%s' % (variant, os.path.splitext(name)[0], FORMAT_EXTENSIONS[fmt])
+
+
+def make_variants(name, storage=default_storage):
+    """Đọc ảnh gốc từ storage, ghi các bản trong VARIANTS (đã bỏ EXIF/ICC/XMP). Trả về dict lưu vào field *_variants."""
+    fmt = variant_format()
+    with storage.open(name, 'rb') as f:
+        image = Image.open(f)
+        # JPEG giải mã thẳng ở tỉ lệ nhỏ hơn nếu ảnh lớn hơn nhiều so với bản lớn nhất
+        image.draft('RGB', max(size for size, _ in VARIANTS.values()))
+        image.load()
+
+    image = ImageOps.exif_transpose(image)
+    has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+    image = image.convert('RGBA' if has_alpha and fmt != 'JPEG' else 'RGB')
+
+    variants = {'source': name}
+    for variant, (size, crop) in VARIANTS.items():
+        if crop:
+            resized = ImageOps.fit(image, size, Image.Resampling.LANCZOS)
+        else:
+            resized = image.copy()
+            resized.thumbnail(size, Image.Resampling.LANCZOS)
+        # Không truyền exif/icc_profile khi lưu và xoá info để không mang metadata của ảnh gốc
+        resized.info = {}
+        buf = BytesIO()
+        resized.save(buf, fmt, quality=getattr(settings, 'IMAGE_VARIANT_QUALITY', 80))
+
+        path = variant_path(variant, name, fmt)
+        default_storage.delete(path)
+        variants[variant] = default_storage.save(path, ContentFile(buf.getvalue()))
+    return variants
+
+
+def process_image(model, pk, force=False):
+    """Tạo bản thu nhỏ cho ảnh của một dòng nếu chưa có (hoặc ảnh đã đổi). Trả về dict variants, None nếu không có ảnh."""
+    field, variants_field = IMAGE_FIELDS[model]
+    row = model.objects.filter(pk=pk).values_list(field, variants_field).first()
+    if row is None or not row[0]:
+        return None
+    name, variants = row
+    if variants and variants.get('source') == name and not force:
+        return variants
+
+    # Ảnh dùng chung một blob (storage.py) với dòng khác đã xử lý thì dùng lại các bản thu nhỏ của dòng đó
+    variants = None if force else existing_variants(name)
+    if variants is None:
+        variants = make_variants(name, model._meta.get_field(field).storage)
+    # Chỉ ghi nếu ảnh chưa bị đổi trong lúc xử lý; ảnh mới đã có lượt xử lý riêng.
+    # Đổi cả updated_date để ETag / Last-Modified của current-account thay đổi theo
+    if model.objects.filter(pk=pk, **{field: name}).update(**{variants_field: variants, 'updated_date': timezone.now()}):
+        invalidate(model, pk)
+    return variants
+
+
+def existing_variants(name):
+    for model, (field, variants_field) in IMAGE_FIELDS.items():
+        for variants in model.objects.filter(**{field: name}).filter(**{variants_field + '__has_key': 'source'}) \
+                .values_list(variants_field, flat=True)[:5]:
+            if variants.get('source') == name and all(variant in variants for variant in VARIANTS):
+                return variants
+    return None
+
+
+def invalidate(model, pk):
+    # update() không gửi signal nên tự xoá cache các bài có hiển thị ảnh này
+    if model is ProductPost:
+        caching.invalidate_product_posts([pk])
+    elif model is Comment:
+        caching.invalidate_product_posts(Comment.objects.filter(pk=pk).values_list('post_id', flat=True))
+    elif model is Account:
+        caching.invalidate_account(pk)
+
+
+def pending_images(model):
+    # (pk, tên ảnh) của các dòng có ảnh nhưng chưa có bản thu nhỏ đúng với ảnh đó
+    field, variants_field = IMAGE_FIELDS[model]
+    rows = model.objects.exclude(**{field: ''}).exclude(**{field + '__isnull': True}) \
+        .values_list('pk', field, variants_field).order_by('pk')
+    for pk, name, variants in rows.iterator(chunk_size=500):
+        if not variants or variants.get('source') != name:
+            yield pk, name
+
+
+# ==== WORKER ====
+# Ảnh được xử lý trong một thread nền của process (không chặn request); settings.IMAGE_VARIANTS_IN_BACKGROUND=False
+# xử lý ngay sau khi commit. Ảnh còn trong hàng đợi khi process tắt sẽ được lệnh generate_image_variants xử lý lại.
+_queue = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def enqueue(model, pk):
+    if not getattr(settings, 'IMAGE_VARIANTS_IN_BACKGROUND', True):
+        process_image(model, pk)
+        return
+    start_worker()
+    _queue.put((model, pk))
+
+
+def start_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=run_worker, name='image-variants', daemon=True)
+            _worker.start()
+
+
+def run_worker():
+    while True:
+        model, pk = _queue.get()
+        try:
+            process_image(model, pk)
+        except Exception:
+            # Ảnh hỏng / không đọc được không được làm dừng worker
+            logger.exception('Cannot create image variants for %s %s', model.__name__, pk)
+        finally:
+            connection.close()
+            _queue.task_done()
+
+
+def wait():
+    # Chờ worker xử lý hết hàng đợi hiện tại
+    _queue.join()
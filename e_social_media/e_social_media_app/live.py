@@ -0,0 +1,157 @@
+import asyncio
+import json
+import logging
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class LocalBackend:
+    """Chỉ trong process: publish gọi thẳng deliver. Đủ cho một process ASGI (và khi chạy thử)."""
+
+    def __init__(self, **options):
+        self.deliver = None
+
+    def start(self, deliver):
+        self.deliver = deliver
+
+    def publish(self, topic, message):
+        self.deliver(topic, message)
+
+    def stop(self):
+        pass
+
+
+class RedisBackend:
+    """
+    Pub/sub của Redis cho nhiều process / nhiều máy: publish gửi lên Redis, mỗi process có một thread nhận mọi topic
+    (psubscribe '<prefix>*') rồi deliver cho subscriber trong process đó. Cần cài redis-py.
+    """
+
+    def __init__(self, url='redis://127.0.0.1:6379/0', prefix='live:'):
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured('RedisBackend cần package redis (pip install redis)')
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.thread = None
+
+    def start(self, deliver):
+        def handle(item):
+            deliver(item['channel'].decode()[len(self.prefix):], json.loads(item['data']))
+
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(**{self.prefix + '*': handle})
+        self.thread = pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+    def publish(self, topic, message):
+        self.client.publish(self.prefix + topic, json.dumps(message))
+
+    def stop(self):
+        if self.thread is not None:
+            self.thread.stop()
+
+
+class Broker:
+    """
+    Pub/sub giữa code đồng bộ (view, signal, lệnh) và các kết nối đang mở trong event loop.
+    Message phải serialize được bằng JSON để backend nào cũng chuyển được. Backend chọn bằng
+    settings.LIVE_PUBSUB_BACKEND / LIVE_PUBSUB_OPTIONS.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = {}  # topic -> {token: (loop, callback)}
+        self.backend = None
+
+    def get_backend(self):
+        with self.lock:
+            if self.backend is None:
+                backend_class = import_string(getattr(settings, 'LIVE_PUBSUB_BACKEND', 'e_social_media_app.live.LocalBackend'))
+                backend = backend_class(**getattr(settings, 'LIVE_PUBSUB_OPTIONS', {}))
+                backend.start(self.deliver)
+                self.backend = backend
+            return self.backend
+
+    def stop(self):
+        with self.lock:
+            backend, self.backend = self.backend, None
+        if backend is not None:
+            backend.stop()
+
+    def publish(self, topic, message=None):
+        try:
+            self.get_backend().publish(topic, message)
+        except Exception:
+            # Không làm hỏng request đã commit chỉ vì không gửi được thông báo
+            logger.exception('Cannot publish to %s', topic)
+
+    def publish_on_commit(self, topic, message=None):
+        transaction.on_commit(lambda: self.publish(topic, message))
+
+    def subscribe(self, topic, callback):
+        # Gọi trong event loop; callback(message) chạy trong chính loop đó. Trả về token để unsubscribe
+        loop = asyncio.get_running_loop()
+        self.get_backend()
+        token = object()
+        with self.lock:
+            self.subscribers.setdefault(topic, {})[token] = (loop, callback)
+        return token
+
+    def unsubscribe(self, topic, token):
+        with self.lock:
+            subscribers = self.subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.pop(token, None)
+                if not subscribers:
+                    del self.subscribers[topic]
+
+    def deliver(self, topic, message):
+        # Có thể được gọi từ bất kỳ thread nào (thread của request, thread nhận của backend)
+        with self.lock:
+            targets = list(self.subscribers.get(topic, {}).values())
+        for loop, callback in targets:
+            try:
+                loop.call_soon_threadsafe(callback, message)
+            except RuntimeError:
+                # Loop đã đóng
+                pass
+
+
+broker = Broker()
+
+
+def database_sync_to_async(func):
+    """
+    sync_to_async cho code chạy ngoài request (task nền, WebSocket): không có request_started / request_finished nên
+    tự đóng kết nối DB cũ / hỏng trước và sau khi gọi, như Django làm cho mỗi request.
+    """
+
+    def inner(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(inner)
+
+
+async def lifespan(receive, send):
+    # ASGI lifespan: khởi động backend trước request đầu tiên, dừng thread nhận khi server tắt
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            broker.get_backend()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            broker.stop()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from e_social_media_app import uploads
+
+
+class Command(BaseCommand):
+    help = 'Xoá các upload chia nhỏ chưa finalize và file tạm của chúng sau một khoảng thời gian không được cập nhật, ' \
+           'cùng các upload đã finalize nhưng chưa được gắn vào đâu'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help='Số giờ không được cập nhật (mặc định 24)')
+        parser.add_argument('--finalized-hours', type=int, default=getattr(settings, 'MEDIA_BLOB_GC_GRACE_HOURS', 24),
+                            help='Số giờ giữ upload đã finalize chưa được gắn (mặc định MEDIA_BLOB_GC_GRACE_HOURS)')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        removed = uploads.clean_stale_uploads(now - timedelta(hours=options['hours']),
+                                              now - timedelta(hours=options['finalized_hours']))
+        self.stdout.write(self.style.SUCCESS(f'{removed} stale uploads removed'))
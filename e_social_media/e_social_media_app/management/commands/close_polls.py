@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from e_social_media_app import polls
+
+
+class Command(BaseCommand):
+    help = ('Đóng các poll có end_time đã qua và chốt kết quả. Chạy theo lịch (cron), hoặc với --every để tự lặp '
+            'như một scheduler nhẹ')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--every', type=float, default=0, help='Lặp lại sau mỗi số giây này (0: chạy một lần)')
+
+    def handle(self, *args, **options):
+        while True:
+            closed = polls.close_due_polls(options['batch_size'])
+            if closed or not options['every']:
+                self.stdout.write(f'Closed {closed} polls')
+            if not options['every']:
+                return
+            time.sleep(options['every'])
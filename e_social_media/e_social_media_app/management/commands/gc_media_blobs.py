@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from e_social_media_app import blobs
+
+
+class Command(BaseCommand):
+    help = 'Tính lại số tham chiếu của blob ảnh và xoá các blob không còn account / bài / comment / upload (active) nào trỏ vào'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=getattr(settings, 'MEDIA_BLOB_GC_GRACE_HOURS', 24),
+                            help='Chỉ xoá blob không được dùng trong số giờ này')
+
+    def handle(self, *args, **options):
+        recounted = blobs.recount_refs()
+        self.stdout.write(self.style.SUCCESS(f'{recounted} blob reference counts corrected'))
+        deleted = blobs.collect_garbage(timedelta(hours=options['hours']))
+        self.stdout.write(self.style.SUCCESS(f'{deleted} unreferenced blobs deleted'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from e_social_media_app import imaging
+
+
+class Command(BaseCommand):
+    help = 'Tạo bản thu nhỏ (thumbnail / feed / full) cho avatar, ảnh bài và ảnh comment chưa được xử lý'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Tạo lại cả các ảnh đã có bản thu nhỏ')
+
+    def handle(self, *args, **options):
+        for model, (field, variants_field) in imaging.IMAGE_FIELDS.items():
+            if options['force']:
+                rows = model.objects.exclude(**{field: ''}).exclude(**{field + '__isnull': True}) \
+                    .values_list('pk', field).order_by('pk').iterator(chunk_size=500)
+            else:
+                rows = imaging.pending_images(model)
+
+            done = failed = 0
+            for pk, name in rows:
+                try:
+                    imaging.process_image(model, pk, force=options['force'])
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'{model.__name__} {pk} ({name}): {e}')
+            self.stdout.write(self.style.SUCCESS(f'{model._meta.model_name}: {done} images processed, {failed} failed'))
@@ -0,0 +1,84 @@
+import random
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from e_social_media_app import polls
+from e_social_media_app.models import Account, PollOption, PollResponse, Post, PostPoll, User
+
+
+class Command(BaseCommand):
+    help = ('Nhiều thread bỏ phiếu / đổi phiếu cùng lúc trên một poll tạm, rồi kiểm tra vote_count khớp với số '
+            'PollResponse. Chạy trên MySQL (SQLite khoá cả file khi ghi nên không đo được tranh chấp thật)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--voters', type=int, default=1000)
+        parser.add_argument('--threads', type=int, default=32)
+        parser.add_argument('--options', type=int, default=4)
+        parser.add_argument('--changes', type=float, default=0.5, help='Tỉ lệ người bỏ phiếu đổi phiếu một lần nữa')
+        parser.add_argument('--keep', action='store_true', help='Không xoá poll và tài khoản tạm sau khi chạy')
+
+    def handle(self, *args, **options):
+        prefix = 'pollload_%s_' % uuid.uuid4().hex[:8]
+        today = timezone.localdate()
+        post = Post.objects.create(post_content='Poll load test')
+        poll = PostPoll.objects.create(title=prefix, start_time=today, end_time=today + timedelta(days=1), post=post)
+        option_ids = [PollOption.objects.create(poll=poll, option_text='Option %d' % i).id
+                      for i in range(options['options'])]
+
+        # bulk_create không gửi signal tạo Account cho User nên tạo Account ngay sau đó
+        User.objects.bulk_create([User(username='%s%d' % (prefix, i)) for i in range(options['voters'])])
+        Account.objects.bulk_create([Account(user=user) for user in User.objects.filter(username__startswith=prefix)])
+        account_ids = list(Account.objects.filter(user__username__startswith=prefix).values_list('id', flat=True))
+
+        errors = []
+        casts = [0]
+        lock = threading.Lock()
+
+        def vote(account_chunk):
+            rng = random.Random()
+            done = 0
+            try:
+                for account_id in account_chunk:
+                    polls.cast_vote(poll.id, rng.choice(option_ids), account_id)
+                    done += 1
+                    if rng.random() < options['changes']:
+                        polls.cast_vote(poll.id, rng.choice(option_ids), account_id)
+                        done += 1
+            except Exception as e:
+                errors.append(e)
+            finally:
+                with lock:
+                    casts[0] += done
+                connection.close()
+
+        threads = [threading.Thread(target=vote, args=(account_ids[i::options['threads']],))
+                   for i in range(options['threads'])]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        tallies = dict(PollOption.objects.filter(poll=poll).values_list('id', 'vote_count'))
+        responses = PollResponse.objects.filter(poll=poll, active=True).count()
+        mismatches = polls.tally_mismatches(poll.id)
+        self.stdout.write(f'{casts[0]} votes cast by {len(account_ids)} accounts in {elapsed:.2f}s '
+                          f'({casts[0] / elapsed if elapsed else 0:.0f} votes/s), {len(errors)} errors')
+        self.stdout.write(f'tallies {tallies}, total {sum(tallies.values())}, responses {responses}')
+
+        if not options['keep']:
+            post.delete()
+            User.objects.filter(username__startswith=prefix).delete()
+
+        if errors:
+            raise CommandError(f'{len(errors)} voting threads failed, first error: {errors[0]!r}')
+        if mismatches or sum(tallies.values()) != responses or responses != len(account_ids):
+            raise CommandError(f'Tallies do not match PollResponse rows: {mismatches}')
+        self.stdout.write(self.style.SUCCESS('vote_count matches PollResponse rows for every option'))
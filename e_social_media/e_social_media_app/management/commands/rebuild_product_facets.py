@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from e_social_media_app import facets
+
+
+class Command(BaseCommand):
+    help = 'Tính lại bảng ProductPostFacet / ProductPostCatalogFacet (số bài theo danh mục / khoảng giá) từ ProductPost'
+
+    def handle(self, *args, **options):
+        count = facets.rebuild_facets()
+        self.stdout.write(self.style.SUCCESS(f'{count} facet rows rebuilt'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from e_social_media_app import search
+
+
+class Command(BaseCommand):
+    help = 'Dựng lại chỉ mục full-text (ProductPostSearch) cho toàn bộ ProductPost'
+
+    def handle(self, *args, **options):
+        count = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'{count} product posts indexed'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from e_social_media_app import search
+
+
+class Command(BaseCommand):
+    help = 'Dựng lại bảng token tìm kiếm (UserSearchToken) cho toàn bộ User'
+
+    def handle(self, *args, **options):
+        count = search.rebuild_user_index()
+        self.stdout.write(self.style.SUCCESS(f'{count} users indexed'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from e_social_media_app import dao, reactions
+
+
+class Command(BaseCommand):
+    help = 'Tính lại reaction_count / comment_count và bảng tổng hợp reaction theo loại của Post và ProductPost'
+
+    def handle(self, *args, **options):
+        updated = dao.recount_post_counters()
+        for table, rows in updated.items():
+            self.stdout.write(self.style.SUCCESS(f'{table}: {rows} rows recounted'))
+        for table, rows in reactions.rebuild_summaries().items():
+            self.stdout.write(self.style.SUCCESS(f'{table}: {rows} rows rebuilt'))
@@ -0,0 +1,150 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+from .storage import BLOB_DIR
+
+READ_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Blob có tên là sha256 của nội dung nên không bao giờ đổi
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def is_inline(content_type):
+    # Chỉ ảnh được hiển thị trực tiếp; SVG chạy được script nên cũng như file thường
+    return content_type.startswith('image/') and content_type != 'image/svg+xml'
+
+
+def parse_range(header, size):
+    """
+    'bytes=a-b' / 'bytes=a-' / 'bytes=-n' -> (start, end) (end tính cả byte cuối).
+    Không có hoặc không hiểu được (nhiều khoảng) thì None: trả về cả file; ngoài kích thước file thì ValueError.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    elif last:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        return None
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+def read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(READ_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def file_etag(path, stat):
+    name = os.path.basename(path)
+    if path.startswith(os.path.join(settings.MEDIA_ROOT, BLOB_DIR) + os.sep):
+        return quote_etag(os.path.splitext(name)[0])
+    return quote_etag('%x-%x' % (stat.st_mtime_ns, stat.st_size))
+
+
+def offload(response, path, relative_path):
+    # Trả file qua proxy phía trước: worker chỉ gửi header, proxy tự đọc file (và xử lý Range)
+    mode = getattr(settings, 'MEDIA_ACCEL_REDIRECT', None)
+    if mode == 'nginx':
+        response['X-Accel-Redirect'] = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/') + quote(relative_path)
+    elif mode == 'sendfile':
+        response['X-Sendfile'] = path
+    else:
+        return False
+    return True
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    File trong MEDIA_ROOT với ETag / Last-Modified / Cache-Control dài hạn và HTTP Range (một khoảng).
+    settings.MEDIA_ACCEL_REDIRECT = 'nginx' | 'sendfile' thì giao việc gửi file cho proxy.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('File not found')
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404('File not found')
+    if not os.path.isfile(full_path):
+        raise Http404('File not found')
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+
+    etag = file_etag(full_path, stat)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': IMMUTABLE if path.startswith(BLOB_DIR + '/')
+        else 'public, max-age=%d' % getattr(settings, 'MEDIA_CACHE_MAX_AGE', 86400),
+        'Accept-Ranges': 'bytes',
+    }
+    if not is_inline(content_type):
+        # File không phải ảnh (HTML, SVG...) cùng origin với API: tải về, không cho trình duyệt hiển thị / chạy script
+        headers['Content-Disposition'] = 'attachment'
+        headers['Content-Security-Policy'] = 'sandbox'
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        for name, value in headers.items():
+            not_modified[name] = value
+        return not_modified
+
+    response = HttpResponse(content_type=content_type)
+    if offload(response, full_path, path):
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    size = stat.st_size
+    byte_range = None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    # If-Range khác ETag hiện tại: file đã đổi, trả cả file
+    if not if_range or if_range == etag:
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */%d' % size
+            return response
+
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+        response['Content-Length'] = str(size)
+    elif byte_range is None:
+        # FileResponse dùng wsgi.file_wrapper (sendfile) nếu server hỗ trợ
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(read_range(full_path, start, end - start + 1), status=206,
+                                         content_type=content_type)
+        response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+        response['Content-Length'] = str(end - start + 1)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    for name, value in headers.items():
+        response[name] = value
+    return response
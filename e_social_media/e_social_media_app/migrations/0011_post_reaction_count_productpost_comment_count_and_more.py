@@ -0,0 +1,51 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:15
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(model, fk_name):
+    counts = model.objects.filter(**{fk_name: OuterRef('pk')}, active=True).order_by() \
+        .values(fk_name).annotate(c=Count('id')).values('c')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def backfill_counters(apps, schema_editor):
+    Post = apps.get_model('e_social_media_app', 'Post')
+    PostReaction = apps.get_model('e_social_media_app', 'PostReaction')
+    ProductPost = apps.get_model('e_social_media_app', 'ProductPost')
+    ProductPostReaction = apps.get_model('e_social_media_app', 'ProductPostReaction')
+    Comment = apps.get_model('e_social_media_app', 'Comment')
+
+    ProductPost.objects.update(
+        reaction_count=count_subquery(ProductPostReaction, 'product_post'),
+        comment_count=count_subquery(Comment, 'post'),
+    )
+    Post.objects.update(reaction_count=count_subquery(PostReaction, 'post'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('e_social_media_app', '0010_alter_postpoll_end_time_alter_postpoll_start_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='reaction_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='productpost',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='productpost',
+            name='reaction_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
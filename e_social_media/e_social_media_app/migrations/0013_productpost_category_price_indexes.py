@@ -0,0 +1,49 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_category_and_price(apps, schema_editor):
+    Product = apps.get_model('e_social_media_app', 'Product')
+    ProductPost = apps.get_model('e_social_media_app', 'ProductPost')
+
+    product = Product.objects.filter(pk=OuterRef('product_id'))
+    ProductPost.objects.update(
+        category_id=Subquery(product.values('category_id')[:1]),
+        price=Subquery(product.values('price')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('e_social_media_app', '0012_alter_updated_date_datetime'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productpost',
+            name='category',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='e_social_media_app.category'),
+        ),
+        migrations.AddField(
+            model_name='productpost',
+            name='price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.RunPython(copy_category_and_price, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='productpost',
+            index=models.Index(fields=['category', 'active', '-created_date', '-id'], name='productpost_cat_newest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productpost',
+            index=models.Index(fields=['category', 'active', 'price', 'id'], name='productpost_cat_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productpost',
+            index=models.Index(fields=['category', 'active', '-reaction_count', '-id'], name='productpost_cat_popular_idx'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:00
+
+import html
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils.html import strip_tags
+
+TABLE = 'e_social_media_app_productpostsearch'
+FTS_TABLE = TABLE + '_fts'
+
+SQLITE_CREATE = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(document, content='{TABLE}', content_rowid='post_id', "
+    f"tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER {TABLE}_ai AFTER INSERT ON {TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, document) VALUES (new.post_id, new.document); END",
+    f"CREATE TRIGGER {TABLE}_ad AFTER DELETE ON {TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, document) VALUES ('delete', old.post_id, old.document); END",
+    f"CREATE TRIGGER {TABLE}_au AFTER UPDATE ON {TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, document) VALUES ('delete', old.post_id, old.document); "
+    f"INSERT INTO {FTS_TABLE}(rowid, document) VALUES (new.post_id, new.document); END",
+]
+SQLITE_DROP = [
+    f"DROP TRIGGER IF EXISTS {TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+MYSQL_CREATE = [f"ALTER TABLE {TABLE} ADD FULLTEXT INDEX productpostsearch_document_ft (document)"]
+MYSQL_DROP = [f"ALTER TABLE {TABLE} DROP INDEX productpostsearch_document_ft"]
+
+
+def run_sql(schema_editor, statements):
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def create_fulltext_index(apps, schema_editor):
+    run_sql(schema_editor, {'sqlite': SQLITE_CREATE, 'mysql': MYSQL_CREATE})
+
+    ProductPost = apps.get_model('e_social_media_app', 'ProductPost')
+    ProductPostSearch = apps.get_model('e_social_media_app', 'ProductPostSearch')
+    documents = []
+    for post in ProductPost.objects.select_related('product__category').iterator(chunk_size=1000):
+        parts = [html.unescape(strip_tags(post.post_content or ''))]
+        if post.product is not None:
+            parts += [post.product.product_name, post.product.description, post.product.category.category_name]
+        documents.append(ProductPostSearch(post_id=post.id, document='\n'.join(p for p in parts if p)))
+    ProductPostSearch.objects.bulk_create(documents, batch_size=1000)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    run_sql(schema_editor, {'sqlite': SQLITE_DROP, 'mysql': MYSQL_DROP})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('e_social_media_app', '0013_productpost_category_price_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPostSearch',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='e_social_media_app.productpost')),
+                ('document', models.TextField()),
+            ],
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:26
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text.lower().replace('đ', 'd'))
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def fill_user_tokens(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Account = apps.get_model('e_social_media_app', 'Account')
+    UserSearchToken = apps.get_model('e_social_media_app', 'UserSearchToken')
+
+    phones = dict(Account.objects.values_list('user_id', 'phone_number'))
+    tokens = []
+    for user in User.objects.only('username', 'first_name', 'last_name').iterator():
+        values = (user.username, user.first_name, user.last_name, phones.get(user.id))
+        words = {word[:64] for value in values if value for word in re.findall(r'\w+', normalize(value))}
+        tokens += [UserSearchToken(user_id=user.id, token=word) for word in words]
+    UserSearchToken.objects.bulk_create(tokens, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('e_social_media_app', '0014_productpostsearch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('token', 'user'), name='usersearchtoken_token_user_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_user_tokens, migrations.RunPython.noop),
+    ]
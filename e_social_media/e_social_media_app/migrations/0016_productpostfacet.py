@@ -0,0 +1,50 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, Count, IntegerField, Value, When
+
+# Giống facets.PRICE_BUCKETS lúc tạo migration
+PRICE_BUCKETS = (0, 1_000_000, 5_000_000, 10_000_000, 20_000_000, 50_000_000)
+
+
+def fill_facets(apps, schema_editor):
+    ProductPost = apps.get_model('e_social_media_app', 'ProductPost')
+    ProductPostFacet = apps.get_model('e_social_media_app', 'ProductPostFacet')
+
+    bucket = Case(*[When(price__gte=edge, then=Value(i)) for i, edge in reversed(list(enumerate(PRICE_BUCKETS)))],
+                  default=Value(0), output_field=IntegerField())
+    rows = ProductPost.objects.filter(category__isnull=False, price__isnull=False, account__isnull=False) \
+        .annotate(bucket=bucket).values('category_id', 'bucket', 'account_id', 'active') \
+        .annotate(post_count=Count('id')).order_by()
+    ProductPostFacet.objects.bulk_create([
+        ProductPostFacet(category_id=row['category_id'], price_bucket=row['bucket'], account_id=row['account_id'],
+                         active=row['active'], post_count=row['post_count'])
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('e_social_media_app', '0015_usersearchtoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPostFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price_bucket', models.PositiveSmallIntegerField()),
+                ('active', models.BooleanField()),
+                ('post_count', models.PositiveIntegerField(default=0)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='e_social_media_app.account')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='e_social_media_app.category')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['account', 'active'], name='productpostfacet_account_idx')],
+                'constraints': [models.UniqueConstraint(fields=('category', 'price_bucket', 'account', 'active'), name='productpostfacet_key_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_facets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:32
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_reactions(apps, schema_editor):
+    # Giữ reaction mới nhất của mỗi cặp (bài, account), xoá các dòng trùng do toggle_like cũ tạo ra
+    ProductPost = apps.get_model('e_social_media_app', 'ProductPost')
+    ProductPostReaction = apps.get_model('e_social_media_app', 'ProductPostReaction')
+
+    duplicates = ProductPostReaction.objects.filter(account__isnull=False).values('product_post_id', 'account_id') \
+        .annotate(keep_id=Max('id'), rows=Count('id')).filter(rows__gt=1).order_by()
+    post_ids = set()
+    for row in duplicates:
+        ProductPostReaction.objects.filter(product_post_id=row['product_post_id'], account_id=row['account_id']) \
+            .exclude(id=row['keep_id']).delete()
+        post_ids.add(row['product_post_id'])
+
+    if post_ids:
+        count = ProductPostReaction.objects.filter(product_post=OuterRef('pk'), active=True) \
+            .order_by().values('product_post').annotate(c=Count('id')).values('c')
+        ProductPost.objects.filter(id__in=post_ids).update(
+            reaction_count=Coalesce(Subquery(count, output_field=IntegerField()), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('e_social_media_app', '0016_productpostfacet'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_reactions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='productpostreaction',
+            constraint=models.UniqueConstraint(fields=('product_post', 'account'), name='productpostreaction_post_account_uniq'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_summaries(apps, schema_editor):
+    for reaction_name, summary_name, fk_name in [('PostReaction', 'PostReactionSummary', 'post_id'),
+                                                 ('ProductPostReaction', 'ProductPostReactionSummary', 'product_post_id')]:
+        reaction_model = apps.get_model('e_social_media_app', reaction_name)
+        summary_model = apps.get_model('e_social_media_app', summary_name)
+        rows = reaction_model.objects.filter(active=True).values(fk_name, 'reaction_id') \
+            .annotate(c=Count('id')).order_by()
+        summary_model.objects.bulk_create([
+            summary_model(**{fk_name: row[fk_name], 'reaction_id': row['reaction_id'], 'reaction_count': row['c']})
+            for row in rows
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('e_social_media_app', '0017_productpostreaction_post_account_uniq'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostReactionSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reaction_count', models.PositiveIntegerField(default=0)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reaction_summaries', to='e_social_media_app.post')),
+                ('reaction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='e_social_media_app.reaction')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('post', 'reaction'), name='postreactionsummary_post_reaction_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductPostReactionSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reaction_count', models.PositiveIntegerField(default=0)),
+                ('product_post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reaction_summaries', to='e_social_media_app.productpost')),
+                ('reaction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='e_social_media_app.reaction')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product_post', 'reaction'), name='productpostreactionsummary_post_reaction_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('e_social_media_app', '0019_comment_threads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='avatar_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='comment_image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='productpost',
+            name='post_image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:40
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('e_social_media_app', '0020_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Upload',
+            fields=[
+                ('created_date', models.DateField(auto_now_add=True, null=True)),
+                ('updated_date', models.DateTimeField(auto_now=True, null=True)),
+                ('deleted_date', models.DateField(blank=True, null=True)),
+                ('active', models.BooleanField(default=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('file_name', models.CharField(max_length=255)),
+                ('total_size', models.PositiveBigIntegerField()),
+                ('received_size', models.PositiveBigIntegerField(default=0)),
+                ('file', models.FileField(blank=True, null=True, upload_to='uploads/%Y/%m')),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to='e_social_media_app.account')),
+            ],
+            options={
+                'ordering': ['-id'],
+                'abstract': False,
+            },
+        ),
+    ]
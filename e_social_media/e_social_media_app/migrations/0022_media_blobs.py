@@ -0,0 +1,48 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:05
+
+import e_social_media_app.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('e_social_media_app', '0021_upload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='account',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, storage=e_social_media_app.storage.blob_storage, upload_to='images/accounts/avatar/%Y/%m'),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='comment_image_url',
+            field=models.ImageField(blank=True, null=True, storage=e_social_media_app.storage.blob_storage, upload_to='images/comments/%Y/%m'),
+        ),
+        migrations.AlterField(
+            model_name='productpost',
+            name='post_image_url',
+            field=models.ImageField(blank=True, null=True, storage=e_social_media_app.storage.blob_storage, upload_to='images/product_post_images/%Y/%m'),
+        ),
+        migrations.AlterField(
+            model_name='upload',
+            name='file',
+            field=models.FileField(blank=True, null=True, storage=e_social_media_app.storage.blob_storage, upload_to='uploads/%Y/%m'),
+        ),
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.PositiveBigIntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('last_used', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ref_count', 'last_used'], name='mediablob_unused_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:30
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicate_votes(apps, schema_editor):
+    # Giữ phiếu mới nhất của mỗi cặp (poll, account), rồi tính lại vote_count từ các phiếu còn lại
+    PollOption = apps.get_model('e_social_media_app', 'PollOption')
+    PollResponse = apps.get_model('e_social_media_app', 'PollResponse')
+
+    duplicates = PollResponse.objects.values('poll_id', 'account_id') \
+        .annotate(keep_id=Max('id'), rows=Count('id')).filter(rows__gt=1).order_by()
+    for row in duplicates:
+        PollResponse.objects.filter(poll_id=row['poll_id'], account_id=row['account_id']) \
+            .exclude(id=row['keep_id']).delete()
+
+    votes = dict(PollResponse.objects.filter(active=True).values('option_id').annotate(c=Count('id'))
+                 .order_by().values_list('option_id', 'c'))
+    options = list(PollOption.objects.only('id', 'vote_count'))
+    for option in options:
+        option.vote_count = votes.get(option.id, 0)
+    PollOption.objects.bulk_update(options, ['vote_count'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('e_social_media_app', '0022_media_blobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_votes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='pollresponse',
+            constraint=models.UniqueConstraint(fields=('poll', 'account'), name='pollresponse_poll_account_uniq'),
+        ),
+    ]
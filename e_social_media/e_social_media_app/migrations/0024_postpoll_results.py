@@ -0,0 +1,22 @@
+# Generated by Django 5.1.1 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('e_social_media_app', '0023_pollresponse_poll_account_uniq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='postpoll',
+            name='results',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='postpoll',
+            index=models.Index(fields=['is_closed', 'end_time'], name='postpoll_due_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:10
+
+import uuid
+
+from django.db import migrations, models
+
+
+def fill_message_uuids(apps, schema_editor):
+    # Mỗi tin nhắn cũ một uuid riêng trước khi thêm ràng buộc unique
+    Message = apps.get_model('e_social_media_app', 'Message')
+    messages = list(Message.objects.filter(uuid__isnull=True).only('id'))
+    for message in messages:
+        message.uuid = uuid.uuid4()
+    Message.objects.bulk_update(messages, ['uuid'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('e_social_media_app', '0024_postpoll_results'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='uuid',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_message_uuids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='message',
+            name='uuid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+    ]
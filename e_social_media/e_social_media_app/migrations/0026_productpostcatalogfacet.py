@@ -0,0 +1,42 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_catalog_facets(apps, schema_editor):
+    ProductPostFacet = apps.get_model('e_social_media_app', 'ProductPostFacet')
+    ProductPostCatalogFacet = apps.get_model('e_social_media_app', 'ProductPostCatalogFacet')
+
+    rows = ProductPostFacet.objects.values('category_id', 'price_bucket', 'active') \
+        .annotate(post_count=Sum('post_count')).order_by()
+    ProductPostCatalogFacet.objects.bulk_create([
+        ProductPostCatalogFacet(category_id=row['category_id'], price_bucket=row['price_bucket'],
+                                active=row['active'], post_count=row['post_count'])
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('e_social_media_app', '0025_message_uuid'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPostCatalogFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price_bucket', models.PositiveSmallIntegerField()),
+                ('active', models.BooleanField()),
+                ('post_count', models.PositiveIntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='e_social_media_app.category')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('category', 'price_bucket', 'active'), name='productpostcatalogfacet_key_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_catalog_facets, migrations.RunPython.noop),
+    ]
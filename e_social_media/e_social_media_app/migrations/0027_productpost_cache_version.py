@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('e_social_media_app', '0026_productpostcatalogfacet'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productpost',
+            name='cache_version',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -1,12 +1,16 @@
+import uuid
+
 from django.contrib.auth.models import AbstractUser, Permission, Group
 from django.db import models
 from ckeditor.fields import RichTextField
 
+from .storage import blob_storage
+
 
 
 class BaseModel(models.Model):
     created_date = models.DateField(auto_now_add=True, null=True)
-    updated_date = models.DateField(auto_now=True, null=True)
+    updated_date = models.DateTimeField(auto_now=True, null=True)
     deleted_date = models.DateField(null=True, blank=True)
     active = models.BooleanField(default=True)
 
@@ -47,11 +51,24 @@ class User(AbstractUser):
         return self.username
 
 
+class UserSearchToken(models.Model):
+    # Token đã chuẩn hoá (chữ thường, bỏ dấu) của username, họ tên, số điện thoại; tìm theo tiền tố, xem search.py
+    token = models.CharField(max_length=64)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_tokens')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['token', 'user'], name='usersearchtoken_token_user_uniq'),
+        ]
+
+
 class Account(BaseModel):
     id = models.AutoField(primary_key=True)
     phone_number = models.CharField(max_length=255, unique=True, null=True)
     date_of_birth = models.DateField(null=True)
-    avatar = models.ImageField(upload_to="images/accounts/avatar/%Y/%m", null=True, blank=True)
+    avatar = models.ImageField(upload_to="images/accounts/avatar/%Y/%m", storage=blob_storage, null=True, blank=True)
+    # Các bản thu nhỏ của ảnh do imaging.py tạo trong background: {'source': tên ảnh gốc, 'thumbnail': ..., ...}
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
     account_status = models.BooleanField(default=False)
     gender = models.BooleanField(default=True, null=True)
     user = models.OneToOneField(User, on_delete=models.CASCADE, null=True)
@@ -60,6 +77,33 @@ class Account(BaseModel):
     def __str__(self):
         return self.user.username
 
+class Upload(BaseModel):
+    # Upload chia nhỏ (uploads.py): các phần được ghi nối tiếp vào file tạm, finalize chuyển file vào storage.
+    # Id ngẫu nhiên để client giữ lại và gửi tiếp sau khi mất kết nối
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='uploads')
+    file_name = models.CharField(max_length=255)
+    total_size = models.PositiveBigIntegerField()
+    received_size = models.PositiveBigIntegerField(default=0)
+    # Có giá trị khi đã finalize; gắn vào avatar / ảnh bài / ảnh comment bằng tên file này (upload bị xoá khi gắn)
+    file = models.FileField(upload_to='uploads/%Y/%m', storage=blob_storage, null=True, blank=True)
+
+    @property
+    def completed(self):
+        return bool(self.file)
+
+class MediaBlob(models.Model):
+    # Một file ảnh theo sha256 nội dung (storage.py); ref_count là số dòng active (account, bài, comment, upload)
+    # trỏ vào file, được cập nhật trong signals.py và tính lại bởi lệnh gc_media_blobs
+    digest = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    last_used = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['ref_count', 'last_used'], name='mediablob_unused_idx')]
+
 class Category(BaseModel):
     category_name = models.TextField()
 
@@ -76,6 +120,8 @@ class Product(BaseModel):
 class PostBase(BaseModel):
     post_content = RichTextField()
     account = models.ForeignKey(Account, on_delete=models.CASCADE, null=True)
+    # Bộ đếm phi chuẩn hoá, được cập nhật bằng F() trong signals.py
+    reaction_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         abstract = True
@@ -107,30 +153,138 @@ class PostReaction(ReactionBase):
 
 class ProductPost(PostBase):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True)
-    post_image_url = models.ImageField(upload_to="images/product_post_images/%Y/%m", null=True, blank=True)
+    post_image_url = models.ImageField(upload_to="images/product_post_images/%Y/%m", storage=blob_storage, null=True,
+                                       blank=True)
+    post_image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    comment_count = models.PositiveIntegerField(default=0)
+    # Sao chép từ product (signals.py) để lọc theo danh mục và sắp xếp chỉ bằng index của bảng này
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, editable=False)
+    price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=False)
+    # Version của payload cache / ETag (caching.py), tăng mỗi khi nội dung hiển thị của bài đổi; updated_date chỉ đổi khi sửa bài
+    cache_version = models.PositiveBigIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['category', 'active', '-created_date', '-id'], name='productpost_cat_newest_idx'),
+            models.Index(fields=['category', 'active', 'price', 'id'], name='productpost_cat_price_idx'),
+            models.Index(fields=['category', 'active', '-reaction_count', '-id'], name='productpost_cat_popular_idx'),
+        ]
 
 class ProductPostReaction(ReactionBase):
     product_post = models.ForeignKey(ProductPost, on_delete=models.CASCADE)
 
+    class Meta:
+        # Mỗi tài khoản có một reaction trên mỗi bài, toggle_like dựa vào ràng buộc này để không tạo dòng trùng
+        constraints = [
+            models.UniqueConstraint(fields=['product_post', 'account'], name='productpostreaction_post_account_uniq'),
+        ]
+
     @property
     def reactions(self):
         return self.productpostreaction_set.all()
 
+class ReactionSummaryBase(models.Model):
+    # Số reaction (active) của một bài theo từng loại, được cập nhật trong signals.py / reactions.py
+    reaction = models.ForeignKey(Reaction, on_delete=models.CASCADE)
+    reaction_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+class PostReactionSummary(ReactionSummaryBase):
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='reaction_summaries')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'reaction'], name='postreactionsummary_post_reaction_uniq'),
+        ]
+
+class ProductPostReactionSummary(ReactionSummaryBase):
+    product_post = models.ForeignKey(ProductPost, on_delete=models.CASCADE, related_name='reaction_summaries')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product_post', 'reaction'],
+                                    name='productpostreactionsummary_post_reaction_uniq'),
+        ]
+
 class Comment(BaseModel):
+    # Mỗi cấp trong path là id dài PATH_STEP ký tự + '/', ví dụ '0000000012/0000000045/'
+    PATH_STEP = 10
+    MAX_DEPTH = 20
+
     comment_content = models.TextField()
-    comment_image_url = models.ImageField(upload_to="images/comments/%Y/%m", null=True, blank=True)
+    comment_image_url = models.ImageField(upload_to="images/comments/%Y/%m", storage=blob_storage, null=True, blank=True)
+    comment_image_variants = models.JSONField(default=dict, blank=True, editable=False)
     account = models.ForeignKey(Account, on_delete=models.CASCADE, null=True)
     post = models.ForeignKey(ProductPost, on_delete=models.CASCADE)
+    # Trả lời comment khác; path (materialized path) và depth được gán trong signals.py khi tạo
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
+    path = models.CharField(max_length=(PATH_STEP + 1) * (MAX_DEPTH + 1), default='', editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    reply_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta(BaseModel.Meta):
+        indexes = [
+            # Trang comment gốc của bài (keyset theo created_date, id) và cả cây con theo tiền tố path
+            models.Index(fields=['post', 'parent', '-created_date', '-id'], name='comment_post_top_idx'),
+            models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+        ]
+
+    @classmethod
+    def path_segment(cls, comment_id):
+        return '%0*d/' % (cls.PATH_STEP, comment_id)
 
     def __str__(self):
         return self.comment_content
 
+class ProductPostSearch(models.Model):
+    # Văn bản thuần của bài (nội dung, tên/mô tả sản phẩm, danh mục) cho full-text search, xem search.py
+    post = models.OneToOneField(ProductPost, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    document = models.TextField()
+
+class ProductPostFacet(models.Model):
+    # Số bài (có sản phẩm) theo từng (danh mục, khoảng giá, người đăng, active), được cập nhật trong signals.py, xem facets.py
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    price_bucket = models.PositiveSmallIntegerField()
+    account = models.ForeignKey(Account, on_delete=models.CASCADE)
+    active = models.BooleanField()
+    post_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'price_bucket', 'account', 'active'],
+                                    name='productpostfacet_key_uniq'),
+        ]
+        indexes = [models.Index(fields=['account', 'active'], name='productpostfacet_account_idx')]
+
+class ProductPostCatalogFacet(models.Model):
+    # Tổng của ProductPostFacet trên mọi người đăng: (danh mục, khoảng giá, active), dùng khi không lọc theo người đăng
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    price_bucket = models.PositiveSmallIntegerField()
+    active = models.BooleanField()
+    post_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'price_bucket', 'active'],
+                                    name='productpostcatalogfacet_key_uniq'),
+        ]
+
 class PostPoll(BaseModel):
     title = models.CharField(max_length=255)
     start_time = models.DateField()
     end_time = models.DateField()
     is_closed = models.BooleanField(default=False)
     post = models.OneToOneField(Post, on_delete=models.CASCADE)
+    # Kết quả chốt lúc đóng poll (polls.close_polls): {'closed_date', 'total', 'options': [{id, option_text, vote_count}]}
+    results = models.JSONField(null=True, blank=True, editable=False)
+
+    class Meta(BaseModel.Meta):
+        indexes = [
+            # Lệnh close_polls tìm poll chưa đóng đã hết hạn: is_closed=False AND end_time < hôm nay
+            models.Index(fields=['is_closed', 'end_time'], name='postpoll_due_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -138,6 +292,7 @@ class PostPoll(BaseModel):
 class PollOption(BaseModel):
     poll = models.ForeignKey(PostPoll, on_delete=models.CASCADE, related_name='options')
     option_text = models.CharField(max_length=255)
+    # Số phiếu (PollResponse active), được cập nhật bằng F() trong signals.py / polls.py
     vote_count = models.IntegerField(default=0)
 
     def __str__(self):
@@ -148,6 +303,12 @@ class PollResponse(BaseModel):
     option = models.ForeignKey(PollOption, on_delete=models.CASCADE)
     account = models.ForeignKey(Account, on_delete=models.CASCADE)
 
+    class Meta(BaseModel.Meta):
+        # Mỗi tài khoản một phiếu trên mỗi poll; polls.cast_vote dựa vào ràng buộc này để đổi phiếu thay vì tạo thêm
+        constraints = [
+            models.UniqueConstraint(fields=['poll', 'account'], name='pollresponse_poll_account_uniq'),
+        ]
+
     def __str__(self):
         return f"{self.account.user.username} voted for {self.option.option_text} in poll {self.poll.title}"
 
@@ -168,6 +329,8 @@ class Message(BaseModel):
     who_sent = models.ForeignKey(Account, on_delete=models.CASCADE, null=True)
     content = models.CharField(max_length=10000)
     room = models.ForeignKey(Room, on_delete=models.CASCADE, null=True)
+    # Id phía client (chat.py): gửi lại sau khi mất kết nối không tạo tin nhắn trùng; cũng dùng để lấy id sau bulk_create
+    uuid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
 
     def __str__(self):
         return self.content
@@ -1,5 +1,132 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from collections import OrderedDict
+
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class MyPageSize(PageNumberPagination):
-    page_size = 5
\ No newline at end of file
+    page_size = 5
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Phân trang theo con trỏ (keyset): không COUNT(*), không OFFSET.
+    Con trỏ là giá trị (mã hoá base64) của các cột trong `ordering` ở dòng cuối trang trước,
+    trang tiếp theo được lọc bằng WHERE (created_date, id) < (..., ...).
+    Cột cuối cùng trong `ordering` phải là khoá duy nhất (thường là id).
+    Cột cho phép NULL (created_date, price...): NULL được xếp như giá trị nhỏ nhất (cuối khi giảm dần, đầu khi tăng dần),
+    trùng với thứ tự mặc định của MySQL nên không cần biểu thức phụ và vẫn dùng được index.
+    """
+    page_size = 5
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+    cursor_query_param = 'cursor'
+    ordering = ('-created_date', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.get_order_by(queryset.model))
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(position, queryset.model))
+
+        # Lấy dư 1 dòng để biết còn trang sau hay không
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return min(page_size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        position = []
+        for field in self.ordering:
+            model_field = last._meta.get_field(field.lstrip('-'))
+            value = model_field.value_from_object(last)
+            position.append(None if value is None else model_field.value_to_string(last))
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(position))
+
+    def get_order_by(self, model):
+        order_by = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            if not model._meta.get_field(name).null:
+                order_by.append(field)
+            elif field.startswith('-'):
+                order_by.append(F(name).desc(nulls_last=True))
+            else:
+                order_by.append(F(name).asc(nulls_first=True))
+        return order_by
+
+    def get_keyset_filter(self, position, model):
+        # (a, b) < (x, y)  <=>  a < x OR (a = x AND b < y); NULL nhỏ hơn mọi giá trị khác
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            descending = field.startswith('-')
+            if value is None:
+                # Giảm dần: sau NULL chỉ còn các NULL khác. Tăng dần: mọi giá trị khác NULL đứng sau
+                after = None if descending else Q(**{'%s__isnull' % name: False})
+                same = {'%s__isnull' % name: True}
+            else:
+                after = Q(**{('%s__lt' if descending else '%s__gt') % name: value})
+                if descending and model._meta.get_field(name).null:
+                    after |= Q(**{'%s__isnull' % name: True})
+                same = {name: value}
+            if after is not None:
+                condition |= Q(**equal) & after
+            equal.update(same)
+        return condition
+
+    @staticmethod
+    def encode_cursor(position):
+        return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            if not isinstance(position, list) or len(position) != len(self.ordering):
+                raise ValueError
+            return [model._meta.get_field(field.lstrip('-')).to_python(value)
+                    for field, value in zip(self.ordering, position)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
@@ -34,7 +34,7 @@ class PostReactionOwner(permissions.IsAuthenticated):
 
 class PollResponseOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        return request.user == obj.user
+        return obj.account.user_id == request.user.id
 
 class PollOptionOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
@@ -50,7 +50,7 @@ class PostPollOwner(permissions.BasePermission):
 
 class PollResponseOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        return request.user == obj.user
+        return obj.account.user_id == request.user.id
 
 class PollOptionOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
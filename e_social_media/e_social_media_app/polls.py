@@ -0,0 +1,299 @@
+import asyncio
+import contextvars
+import logging
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, Q, When
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from .live import broker, database_sync_to_async
+from .models import PollOption, PollResponse, PostPoll
+from .renderers import FastJSONRenderer
+
+logger = logging.getLogger(__name__)
+
+
+def change_votes(deltas):
+    # deltas: {option_id: số phiếu thêm (+) / bớt (-)}; một câu UPDATE cho mọi option để các dòng luôn được khoá
+    # theo cùng thứ tự (đổi phiếu A -> B và B -> A cùng lúc không deadlock)
+    deltas = {option_id: delta for option_id, delta in deltas.items() if option_id is not None and delta}
+    if not deltas:
+        return
+    PollOption.objects.filter(id__in=deltas).update(vote_count=Case(
+        *[When(id=option_id, then=F('vote_count') + delta) for option_id, delta in deltas.items()],
+        default=F('vote_count')))
+
+
+def cast_vote(poll_id, option_id, account_id):
+    """
+    Bỏ phiếu hoặc đổi phiếu của account trên poll. Trả về (PollResponse, option_id cũ hoặc None nếu là phiếu mới).
+    vote_count được cập nhật bởi signals của PollResponse.
+    """
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                return PollResponse.objects.create(poll_id=poll_id, option_id=option_id, account_id=account_id), None
+        except IntegrityError:
+            # Đã có phiếu (hoặc request khác vừa tạo): khoá dòng rồi đổi phiếu
+            response = PollResponse.objects.select_for_update().get(poll_id=poll_id, account_id=account_id)
+            previous = response.option_id if response.active else None
+            if previous != option_id:
+                response.option_id = option_id
+                response.active = True
+                response.save(update_fields=['option', 'active', 'updated_date'])
+            return response, previous
+
+
+def tally_mismatches(poll_id=None):
+    """[(option_id, vote_count, số PollResponse active)] của các option có vote_count lệch với số phiếu thực tế."""
+    options = PollOption.objects.all() if poll_id is None else PollOption.objects.filter(poll_id=poll_id)
+    options = options.annotate(rows=Count('pollresponse', filter=Q(pollresponse__active=True))).order_by('id')
+    return [(option.id, option.vote_count, option.rows) for option in options if option.vote_count != option.rows]
+
+
+# ==== ĐÓNG POLL HẾT HẠN ====
+# Lệnh close_polls (chạy theo lịch, hoặc --every để tự lặp) đóng các poll có end_time đã qua theo từng lô
+# (index postpoll_due_idx), chốt số phiếu vào PostPoll.results và đưa payload vào cache: từ đó mọi lần đọc poll đã
+# đóng (GET /polls/<id>/, stream kết quả) lấy từ cache, không đọc DB.
+
+def close_polls(polls):
+    """Đánh dấu đóng và chốt kết quả của các PostPoll; gọi trong transaction đã khoá các dòng này."""
+    # caching import serializers, serializers import polls: import ở đây để tránh vòng
+    from . import caching
+
+    poll_ids = [poll.id for poll in polls]
+    results = {poll_id: {'total': 0, 'options': []} for poll_id in poll_ids}
+    options = PollOption.objects.filter(poll_id__in=poll_ids, active=True).order_by('id') \
+        .values_list('poll_id', 'id', 'option_text', 'vote_count')
+    for poll_id, option_id, option_text, vote_count in options:
+        results[poll_id]['options'].append({'id': option_id, 'option_text': option_text, 'vote_count': vote_count})
+        results[poll_id]['total'] += vote_count
+
+    now = timezone.now()
+    for poll in polls:
+        poll.is_closed = True
+        poll.results = dict(results[poll.id], closed_date=now.isoformat())
+        poll.updated_date = now
+    # bulk_update không gửi signal: tự báo cho stream kết quả và cache
+    PostPoll.objects.bulk_update(polls, ['is_closed', 'results', 'updated_date'])
+    for poll_id in poll_ids:
+        results_changed(poll_id)
+    transaction.on_commit(lambda: caching.cache_closed_polls(poll_ids))
+
+
+def close_due_polls(batch_size=500, today=None):
+    """Đóng các poll có end_time trước hôm nay, mỗi lô một transaction. Trả về số poll đã đóng."""
+    today = today or timezone.localdate()
+    closed = 0
+    while True:
+        with transaction.atomic():
+            # skip_locked: nhiều scheduler chạy cùng lúc không đóng trùng, không chờ nhau
+            batch = list(PostPoll.objects.select_for_update(skip_locked=True)
+                         .filter(is_closed=False, end_time__lt=today).order_by('end_time', 'id')[:batch_size])
+            if not batch:
+                return closed
+            close_polls(batch)
+        closed += len(batch)
+
+
+# ==== KẾT QUẢ TRỰC TIẾP (SSE) ====
+# Ghi phiếu chỉ publish 'poll:<id>' (không kèm số liệu); mỗi event loop có một PollWatchers gom các poll bị đổi và
+# cứ POLL_RESULTS_INTERVAL giây đọc số phiếu của tất cả các poll đó bằng một câu SELECT, rồi gửi cùng một
+# snapshot đã encode cho mọi kết nối đang xem poll.
+
+def results_topic(poll_id):
+    return 'poll:%s' % poll_id
+
+
+def results_changed(poll_id):
+    broker.publish_on_commit(results_topic(poll_id))
+
+
+def closed_snapshot(poll_id, results):
+    # Poll đã đóng: kết quả đã chốt, không lấy vote_count hiện tại
+    return {'poll': poll_id, 'is_closed': True, 'total': results['total'], 'options': results['options']}
+
+
+def read_results(poll_ids):
+    """{poll_id: snapshot} của các poll còn active; poll không còn thì không có trong kết quả."""
+    rows = PostPoll.objects.filter(id__in=poll_ids, active=True) \
+        .values_list('id', 'is_closed', 'results', 'options__id', 'options__vote_count', 'options__active') \
+        .order_by('id', 'options__id')
+    snapshots = {}
+    for poll_id, is_closed, results, option_id, vote_count, option_active in rows:
+        if is_closed and results:
+            snapshots[poll_id] = closed_snapshot(poll_id, results)
+            continue
+        snapshot = snapshots.setdefault(poll_id, {'poll': poll_id, 'is_closed': is_closed, 'total': 0, 'options': []})
+        if option_id is not None and option_active:
+            snapshot['options'].append({'id': option_id, 'vote_count': vote_count})
+            snapshot['total'] += vote_count
+    return snapshots
+
+
+def cached_closed_results(poll_id):
+    from . import caching
+
+    payload = caching.get_closed_poll(poll_id)
+    if payload is None or not payload.get('results'):
+        return None
+    return closed_snapshot(poll_id, payload['results'])
+
+
+def encode_event(event_id, snapshot):
+    return b'id: %s\nevent: results\ndata: %s\n\n' % (str(event_id).encode(), FastJSONRenderer().render(snapshot))
+
+
+def push(queue, event):
+    # Mỗi kết nối chỉ giữ snapshot mới nhất: client chậm bỏ qua các snapshot ở giữa
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+class PollWatchers:
+    """Các kết nối SSE của một event loop, theo poll. Chỉ dùng trong loop đó nên không cần khoá."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.queues = {}  # poll_id -> set(asyncio.Queue)
+        self.tokens = {}  # poll_id -> token subscribe của broker
+        self.events = {}  # poll_id -> (snapshot, event đã encode) gần nhất
+        self.dirty = set()
+        self.sequence = 0
+        self.task = None
+
+    def watch(self, poll_id):
+        queue = asyncio.Queue(maxsize=1)
+        if poll_id not in self.queues:
+            self.queues[poll_id] = set()
+            self.tokens[poll_id] = broker.subscribe(results_topic(poll_id), lambda message: self.mark_dirty(poll_id))
+            self.dirty.add(poll_id)
+        self.queues[poll_id].add(queue)
+        if poll_id in self.events:
+            push(queue, self.events[poll_id])
+        if self.task is None:
+            # Task chạy trong context rỗng: không dính vào thread của request đã mở nó (sync_to_async thread_sensitive
+            # sẽ chờ thread đó mãi khi request kết thúc)
+            self.task = contextvars.Context().run(asyncio.get_running_loop().create_task, self.run())
+        return queue
+
+    def unwatch(self, poll_id, queue):
+        queues = self.queues.get(poll_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.queues[poll_id]
+            broker.unsubscribe(results_topic(poll_id), self.tokens.pop(poll_id))
+            self.events.pop(poll_id, None)
+            self.dirty.discard(poll_id)
+
+    def mark_dirty(self, poll_id):
+        if poll_id in self.queues:
+            self.dirty.add(poll_id)
+
+    def encode(self, snapshot):
+        self.sequence += 1
+        return encode_event(self.sequence, snapshot)
+
+    async def run(self):
+        try:
+            while self.queues:
+                if self.dirty:
+                    poll_ids, self.dirty = self.dirty, set()
+                    try:
+                        snapshots = await database_sync_to_async(read_results)(poll_ids)
+                    except Exception:
+                        logger.exception('Cannot read poll results')
+                        self.dirty |= poll_ids
+                        snapshots = None
+                    if snapshots is not None:
+                        for poll_id in poll_ids:
+                            if poll_id not in self.queues:
+                                continue
+                            snapshot = snapshots.get(poll_id)
+                            # Poll đã bị xoá: gửi None để kết nối tự đóng
+                            event = None if snapshot is None else (snapshot, self.encode(snapshot))
+                            self.events[poll_id] = event
+                            for queue in self.queues[poll_id]:
+                                push(queue, event)
+                await asyncio.sleep(self.interval)
+        finally:
+            self.task = None
+
+
+watchers = weakref.WeakKeyDictionary()  # event loop -> PollWatchers
+
+
+def get_watchers():
+    loop = asyncio.get_running_loop()
+    if loop not in watchers:
+        watchers[loop] = PollWatchers(getattr(settings, 'POLL_RESULTS_INTERVAL', 1.0))
+    return watchers[loop]
+
+
+async def poll_results_stream(request, poll_id):
+    """
+    GET /polls/<id>/results/stream/: text/event-stream, mỗi event 'results' là
+    {"poll", "is_closed", "total", "options": [{"id", "vote_count"}]}, gửi khi số phiếu thay đổi (tối đa một lần
+    mỗi POLL_RESULTS_INTERVAL giây). Cần chạy bằng server ASGI (uvicorn / daphne với e_social_media.asgi).
+    """
+    if request.method != 'GET':
+        return HttpResponse(status=405, headers={'Allow': 'GET'})
+
+    heartbeat = getattr(settings, 'POLL_RESULTS_HEARTBEAT', 15)
+    reconnect = 'HTTP_LAST_EVENT_ID' in request.META
+
+    # Poll đã đóng và có trong cache: trả kết quả đã chốt rồi kết thúc, không theo dõi
+    closed = await sync_to_async(cached_closed_results)(poll_id)
+    if closed is not None:
+        if reconnect:
+            return HttpResponse(status=204)
+        response = HttpResponse(b'retry: %d\n\n' % (heartbeat * 1000) + encode_event('closed', closed),
+                                content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    poll_watchers = get_watchers()
+    queue = poll_watchers.watch(poll_id)
+    try:
+        # Snapshot đầu tiên cũng đến từ tick chung (hoặc bản gần nhất đã có), không đọc DB riêng cho kết nối này
+        event = await queue.get()
+    except BaseException:
+        poll_watchers.unwatch(poll_id, queue)
+        raise
+    if event is None:
+        poll_watchers.unwatch(poll_id, queue)
+        raise Http404('Poll not found')
+    if event[0]['is_closed'] and reconnect:
+        # EventSource kết nối lại vào poll đã đóng: 204 để trình duyệt thôi kết nối lại
+        poll_watchers.unwatch(poll_id, queue)
+        return HttpResponse(status=204)
+
+    async def events(event):
+        try:
+            yield b'retry: %d\n\n' % (heartbeat * 1000)
+            yield event[1]
+            while not event[0]['is_closed']:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    # Comment SSE giữ kết nối qua proxy
+                    yield b': keep-alive\n\n'
+                    continue
+                if event is None:
+                    break
+                yield event[1]
+        finally:
+            poll_watchers.unwatch(poll_id, queue)
+
+    response = StreamingHttpResponse(events(event), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Tắt buffer của nginx cho response này
+    response['X-Accel-Buffering'] = 'no'
+    return response
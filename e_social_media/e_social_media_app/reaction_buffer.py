@@ -0,0 +1,77 @@
+import threading
+
+from django.conf import settings
+
+
+def enabled():
+    return getattr(settings, 'REACTION_WRITE_BEHIND', False)
+
+
+class ReactionBuffer:
+    """
+    Reaction chờ ghi, khoá theo (model reaction, id bài, id account); chỉ giữ trạng thái cuối cùng.
+    Mỗi phần tử là (stored, reaction_id): stored là (reaction_id, active) của dòng trong DB lúc bắt đầu chờ
+    (None nếu chưa có dòng), dùng để cộng phần chênh lệch vào bộ đếm khi đọc.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+
+    def __len__(self):
+        return len(self.pending)
+
+    def get(self, model, post_id, account_id):
+        with self.lock:
+            return self.pending.get((model, post_id, account_id))
+
+    def put(self, model, post_id, account_id, stored, reaction_id):
+        with self.lock:
+            key = (model, post_id, account_id)
+            if key in self.pending:
+                stored = self.pending[key][0]
+            self.pending[key] = (stored, reaction_id)
+            return len(self.pending)
+
+    def drain(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        return pending
+
+    def restore(self, pending):
+        # Đưa lại các phần tử drain() ra mà chưa ghi được; khoá đã có phần tử mới thì giữ reaction mới, stored cũ
+        with self.lock:
+            for key, (stored, reaction_id) in pending.items():
+                if key in self.pending:
+                    reaction_id = self.pending[key][1]
+                self.pending[key] = (stored, reaction_id)
+            return len(self.pending)
+
+    def account_reactions(self, model, post_ids, account_id):
+        # {post_id: reaction_id đang chờ} của một account
+        post_ids = set(post_ids)
+        with self.lock:
+            return {post_id: reaction_id for (m, post_id, account), (_, reaction_id) in self.pending.items()
+                    if m is model and account == account_id and post_id in post_ids}
+
+    def post_deltas(self, model, post_ids):
+        # {post_id: (chênh lệch reaction_count, {reaction_id: chênh lệch})} của các reaction đang chờ
+        post_ids = set(post_ids)
+        with self.lock:
+            entries = [(post_id, stored, reaction_id) for (m, post_id, _), (stored, reaction_id) in self.pending.items()
+                       if m is model and post_id in post_ids]
+
+        deltas = {}
+        for post_id, stored, reaction_id in entries:
+            count, summary = deltas.get(post_id, (0, {}))
+            if stored is None or not stored[1]:
+                # Chưa có dòng, hoặc dòng đã xoá mềm (được khôi phục khi flush)
+                count += 1
+            else:
+                summary[stored[0]] = summary.get(stored[0], 0) - 1
+            summary[reaction_id] = summary.get(reaction_id, 0) + 1
+            deltas[post_id] = (count, summary)
+        return deltas
+
+
+buffer = ReactionBuffer()
@@ -0,0 +1,280 @@
+import atexit
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, Count, F, Value, When
+from django.utils import timezone
+
+from . import caching, dao
+from .reaction_buffer import buffer
+from .models import Account, Reaction, ProductPost, ProductPostReaction, PostReaction, ProductPostReactionSummary, \
+    PostReactionSummary
+
+LIKE = 'Like'
+UNLIKE = 'Unlike'
+
+# reaction_name -> id, nạp một lần từ bảng Reaction; signals.py xoá khi bảng Reaction thay đổi
+_reaction_ids = {}
+
+# model reaction -> (bảng tổng hợp theo loại, tên khoá ngoại tới bài)
+SUMMARIES = {
+    ProductPostReaction: (ProductPostReactionSummary, 'product_post_id'),
+    PostReaction: (PostReactionSummary, 'post_id'),
+}
+
+
+def reaction_id(name):
+    if name not in _reaction_ids:
+        _reaction_ids.clear()
+        _reaction_ids.update(Reaction.objects.values_list('reaction_name', 'id'))
+    try:
+        return _reaction_ids[name]
+    except KeyError:
+        raise Reaction.DoesNotExist(f'Reaction "{name}" does not exist')
+
+
+def clear_reaction_ids():
+    _reaction_ids.clear()
+
+
+def change_summary(reaction_model, post_id, deltas):
+    # deltas: {reaction_id: số reaction thêm (+) / bớt (-)} của một bài
+    summary_model, fk_name = SUMMARIES[reaction_model]
+    for reaction, delta in deltas.items():
+        if reaction is None or not delta:
+            continue
+        q = summary_model.objects.filter(**{fk_name: post_id, 'reaction_id': reaction})
+        if delta < 0:
+            q.filter(reaction_count__gte=-delta).update(reaction_count=F('reaction_count') + delta)
+        elif not q.update(reaction_count=F('reaction_count') + delta):
+            try:
+                with transaction.atomic():
+                    summary_model.objects.create(**{fk_name: post_id, 'reaction_id': reaction,
+                                                    'reaction_count': delta})
+            except IntegrityError:
+                # Request khác vừa tạo dòng này
+                q.update(reaction_count=F('reaction_count') + delta)
+
+
+def rebuild_summaries():
+    # GROUP BY trên toàn bảng reaction: chỉ dùng cho lệnh bảo trì, không dùng trong request
+    rebuilt = {}
+    for reaction_model, (summary_model, fk_name) in SUMMARIES.items():
+        rows = reaction_model.objects.filter(active=True).values(fk_name, 'reaction_id') \
+            .annotate(c=Count('id')).order_by()
+        with transaction.atomic():
+            summary_model.objects.all().delete()
+            summary_model.objects.bulk_create([
+                summary_model(**{fk_name: row[fk_name], 'reaction_id': row['reaction_id'], 'reaction_count': row['c']})
+                for row in rows
+            ], batch_size=1000)
+        rebuilt[summary_model._meta.model_name] = summary_model.objects.count()
+    return rebuilt
+
+
+def toggle_like(post_id, account_id):
+    """
+    Đổi Like <-> Unlike của account trên bài, chưa có reaction (hoặc reaction đã bị xoá mềm) thì là Like.
+    Trả về (ProductPostReaction, created).
+    """
+    like_id, unlike_id = reaction_id(LIKE), reaction_id(UNLIKE)
+    q = ProductPostReaction.objects.filter(product_post_id=post_id, account_id=account_id)
+
+    if buffer.get(ProductPostReaction, post_id, account_id) is not None:
+        # Còn thay đổi đang chờ ghi (vừa tắt chế độ ghi gộp): ghi xuống trước để toggle đúng trạng thái
+        flush_reactions()
+
+    with transaction.atomic():
+        # Đổi trạng thái trong chính câu UPDATE (không đọc rồi ghi), dòng bị khoá tới hết transaction
+        if q.filter(active=True, reaction_id__in=[like_id, unlike_id]).update(
+                reaction_id=Case(When(reaction_id=like_id, then=Value(unlike_id)), default=Value(like_id)),
+                updated_date=timezone.now()):
+            reaction = q.get()
+            old_id = like_id if reaction.reaction_id == unlike_id else unlike_id
+            change_summary(ProductPostReaction, post_id, {old_id: -1, reaction.reaction_id: 1})
+            caching.invalidate_product_posts([post_id])
+            return reaction, False
+
+        try:
+            with transaction.atomic():
+                reaction = ProductPostReaction.objects.create(product_post_id=post_id, account_id=account_id,
+                                                              reaction_id=like_id)
+            # Bộ đếm, bảng tổng hợp và cache được cập nhật bởi signals của create()
+            return reaction, True
+        except IntegrityError:
+            # Đã có reaction loại khác / đã xoá mềm, hoặc request khác vừa tạo: khoá dòng rồi lưu qua model để signals
+            # cập nhật bộ đếm và bảng tổng hợp (xoá mềm thì được khôi phục thành Like, như cast_vote khôi phục phiếu)
+            reaction = q.select_for_update().get()
+            reaction.reaction_id = unlike_id if reaction.active and reaction.reaction_id == like_id else like_id
+            reaction.active = True
+            reaction.save(update_fields=['reaction', 'active', 'updated_date'])
+            return reaction, False
+
+
+# ==== GHI GỘP (WRITE-BEHIND) ====
+# settings.REACTION_WRITE_BEHIND: toggle_like / tạo PostReaction chỉ ghi vào reaction_buffer.buffer,
+# flush_reactions() ghi trạng thái cuối của mỗi (bài, account) bằng bulk_create / bulk_update.
+# Buffer nằm trong bộ nhớ process: thay đổi chưa flush sẽ mất nếu process bị kill (atexit vẫn flush khi tắt bình thường).
+_flush_timer = None
+_flush_timer_lock = threading.Lock()
+
+
+def stored_reaction(model, post_id, account_id):
+    fk_name = SUMMARIES[model][1]
+    return model.objects.filter(**{fk_name: post_id, 'account_id': account_id}).order_by('-id') \
+        .values_list('reaction_id', 'active').first()
+
+
+def buffer_reaction(model, post_id, account_id, reaction):
+    entry = buffer.get(model, post_id, account_id)
+    stored = entry[0] if entry is not None else stored_reaction(model, post_id, account_id)
+    size = buffer.put(model, post_id, account_id, stored, reaction)
+    if size >= getattr(settings, 'REACTION_BUFFER_MAX_SIZE', 1000):
+        flush_reactions()
+    else:
+        schedule_flush()
+
+
+def buffered_toggle_like(post_id, account_id):
+    """toggle_like khi bật ghi gộp: trạng thái hiện tại là trạng thái đang chờ, không có thì đọc từ DB. Trả về reaction_id mới."""
+    like_id, unlike_id = reaction_id(LIKE), reaction_id(UNLIKE)
+    entry = buffer.get(ProductPostReaction, post_id, account_id)
+    if entry is not None:
+        current = entry[1]
+    else:
+        stored = stored_reaction(ProductPostReaction, post_id, account_id)
+        if stored is None and not (ProductPost.objects.filter(id=post_id).exists()
+                                   and Account.objects.filter(id=account_id).exists()):
+            # Kiểm tra khoá ngoại ngay, không để một reaction lỗi làm hỏng cả lần flush
+            raise ProductPostReaction.DoesNotExist('ProductPost or account not found')
+        current = stored[0] if stored is not None and stored[1] else None
+    new_id = unlike_id if current == like_id else like_id
+    buffer_reaction(ProductPostReaction, post_id, account_id, new_id)
+    return new_id
+
+
+def schedule_flush():
+    global _flush_timer
+    with _flush_timer_lock:
+        if _flush_timer is None:
+            _flush_timer = threading.Timer(getattr(settings, 'REACTION_FLUSH_INTERVAL', 2.0), flush_in_background)
+            _flush_timer.daemon = True
+            _flush_timer.start()
+
+
+def flush_in_background():
+    try:
+        flush_reactions()
+    finally:
+        # Thread của Timer có kết nối DB riêng, đóng lại sau mỗi lần flush
+        connection.close()
+
+
+def flush_reactions():
+    global _flush_timer
+    with _flush_timer_lock:
+        if _flush_timer is not None:
+            _flush_timer.cancel()
+            _flush_timer = None
+
+    pending = buffer.drain()
+    count = len(pending)
+    try:
+        for model in SUMMARIES:
+            entries = {(post_id, account_id): reaction for (m, post_id, account_id), (_, reaction) in pending.items()
+                       if m is model}
+            if entries:
+                write_reactions(model, entries)
+            pending = {key: value for key, value in pending.items() if key[0] is not model}
+    except Exception:
+        # Ghi lỗi (transaction đã rollback): đưa phần chưa ghi lại vào buffer cho lần flush sau, không mất cả lô
+        buffer.restore(pending)
+        schedule_flush()
+        raise
+    return count
+
+
+def write_reactions(model, entries):
+    # entries: {(post_id, account_id): reaction_id}; bộ đếm, bảng tổng hợp và cache được cập nhật theo phần chênh lệch
+    summary_model, fk_name = SUMMARIES[model]
+    post_model = model._meta.get_field(fk_name[:-len('_id')]).related_model
+    post_ids = {post_id for post_id, _ in entries}
+    now = timezone.now()
+
+    with transaction.atomic():
+        existing = {}
+        rows = model.objects.select_for_update().filter(**{fk_name + '__in': post_ids,
+                                                           'account_id__in': {account for _, account in entries}})
+        for row in rows.order_by('-id'):
+            existing.setdefault((getattr(row, fk_name), row.account_id), row)
+
+        updates, creates, summaries, reactivated = [], [], {}, {}
+        for (post_id, account_id), reaction in entries.items():
+            row = existing.get((post_id, account_id))
+            if row is None:
+                creates.append(model(**{fk_name: post_id, 'account_id': account_id, 'reaction_id': reaction}))
+            elif row.reaction_id != reaction or not row.active:
+                deltas = summaries.setdefault(post_id, {})
+                if row.active:
+                    deltas[row.reaction_id] = deltas.get(row.reaction_id, 0) - 1
+                else:
+                    # Reaction đã xoá mềm được khôi phục
+                    reactivated[post_id] = reactivated.get(post_id, 0) + 1
+                deltas[reaction] = deltas.get(reaction, 0) + 1
+                row.reaction_id = reaction
+                row.active = True
+                row.updated_date = now
+                updates.append(row)
+
+        model.objects.bulk_update(updates, ['reaction', 'active', 'updated_date'], batch_size=500)
+        for post_id, delta in reactivated.items():
+            dao.change_counter(post_model, post_id, 'reaction_count', delta)
+        counted = set(reactivated)
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(creates, batch_size=500)
+        except IntegrityError:
+            # Process khác vừa tạo reaction cho một cặp (bài, account), hoặc bài / account vừa bị xoá:
+            # ghi từng dòng qua model, signals cập nhật bộ đếm
+            for obj in creates:
+                write_reaction(model, getattr(obj, fk_name), obj.account_id, obj.reaction_id)
+        else:
+            counts = {}
+            for obj in creates:
+                post_id = getattr(obj, fk_name)
+                counts[post_id] = counts.get(post_id, 0) + 1
+                deltas = summaries.setdefault(post_id, {})
+                deltas[obj.reaction_id] = deltas.get(obj.reaction_id, 0) + 1
+            for post_id, delta in counts.items():
+                dao.change_counter(post_model, post_id, 'reaction_count', delta)
+            counted.update(counts)
+
+        for post_id, deltas in summaries.items():
+            change_summary(model, post_id, deltas)
+        if post_model is ProductPost:
+            # Bài đã đổi bộ đếm thì cache_version đã tăng trong câu UPDATE đó
+            caching.invalidate_product_posts(post_ids - counted)
+
+
+def write_reaction(model, post_id, account_id, reaction):
+    # PostReaction không có ràng buộc unique (bài, account): có dòng trùng thì sửa dòng mới nhất như stored_reaction
+    fk_name = SUMMARIES[model][1]
+    q = model.objects.filter(**{fk_name: post_id, 'account_id': account_id}).order_by('-id')
+    for _ in range(2):
+        row = q.select_for_update().first()
+        if row is not None:
+            row.reaction_id = reaction
+            row.active = True
+            row.save(update_fields=['reaction', 'active', 'updated_date'])
+            return row
+        try:
+            with transaction.atomic():
+                return model.objects.create(**{fk_name: post_id, 'account_id': account_id, 'reaction_id': reaction})
+        except IntegrityError:
+            # Lần đầu: request khác vừa tạo dòng, đọc lại. Lần sau: bài / account không còn, bỏ qua reaction này
+            pass
+    return None
+
+
+atexit.register(flush_reactions)
@@ -0,0 +1,69 @@
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # orjson là tuỳ chọn, không có thì dùng JSONRenderer của DRF
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer dùng orjson, cho ra cùng byte với JSONRenderer mặc định (compact, UNICODE_JSON).
+    Kiểu orjson không tự xử lý (date/datetime, Decimal, QuerySet, lazy string...) đi qua encoder của DRF.
+    Khác biệt duy nhất: số float dạng mũ (1e-05 / 1e+16) được ghi là 0.00001 / 1e16 — API hiện không có field float.
+    """
+    if orjson is not None:
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.ensure_ascii or not self.compact \
+                or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        except TypeError:
+            # Số nguyên > 64 bit, chuỗi lỗi surrogate...: để JSONRenderer xử lý (hoặc báo lỗi) như cũ
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Giống JSONRenderer: escape U+2028 / U+2029 để nhúng được vào JavaScript
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class StreamingJSONRenderer(FastJSONRenderer):
+    def render_stream(self, items, renderer_context=None):
+        # '[' + item + ',' + item + ... + ']' — giống hệt render() của cả danh sách
+        yield b'['
+        for index, item in enumerate(items):
+            chunk = b'null' if item is None else self.render(item, renderer_context=renderer_context)
+            yield chunk if index == 0 else b',' + chunk
+        yield b']'
+
+
+async def iterate_in_thread(chunks, batch_size):
+    # Chạy generator đồng bộ (đọc DB) trong thread của request, mỗi lần lấy batch_size phần rồi gửi thành một khối
+    next_batch = sync_to_async(lambda: b''.join(islice(chunks, batch_size)), thread_sensitive=True)
+    while True:
+        data = await next_batch()
+        if not data:
+            return
+        yield data
+
+
+def streaming_json_response(items, status=200, request=None, batch_size=500):
+    """
+    StreamingHttpResponse ghi danh sách JSON trong lúc đọc `items`. Chạy qua ASGI (request là ASGIRequest) thì body là
+    async iterator: Django không phải đọc hết generator đồng bộ vào bộ nhớ trước khi gửi.
+    """
+    renderer = StreamingJSONRenderer()
+    chunks = renderer.render_stream(items)
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        chunks = iterate_in_thread(chunks, batch_size)
+    return StreamingHttpResponse(chunks, content_type=renderer.media_type, status=status)
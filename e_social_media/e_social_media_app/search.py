@@ -0,0 +1,174 @@
+import html
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import F, Func, Q, Value, FloatField
+from django.utils.html import strip_tags
+
+from .models import ProductPost, ProductPostSearch, User, Account, UserSearchToken
+
+# Bảng ProductPostSearch là chỉ mục: MySQL dùng FULLTEXT index trên cột document,
+# SQLite dùng bảng ảo FTS5 (external content) đồng bộ bằng trigger — cả hai được tạo trong migration 0014.
+SEARCH_TABLE = ProductPostSearch._meta.db_table
+FTS_TABLE = SEARCH_TABLE + '_fts'
+MAX_TERMS = 10
+TOKEN_RE = re.compile(r'\w+')
+
+
+def build_document(post):
+    parts = [html.unescape(strip_tags(post.post_content or ''))]
+    product = post.product
+    if product is not None:
+        parts += [product.product_name, product.description]
+        if product.category is not None:
+            parts.append(product.category.category_name)
+    return '\n'.join(part for part in parts if part)
+
+
+def index_product_posts(post_ids):
+    posts = ProductPost.objects.filter(id__in=list(post_ids)).select_related('product__category')
+    documents = [ProductPostSearch(post=post, document=build_document(post)) for post in posts]
+    if not documents:
+        return 0
+
+    kwargs = {'update_conflicts': True, 'update_fields': ['document']}
+    if connection.features.supports_update_conflicts_with_target:
+        kwargs['unique_fields'] = ['post']
+    ProductPostSearch.objects.bulk_create(documents, **kwargs)
+    return len(documents)
+
+
+def rebuild_index(batch_size=1000):
+    post_ids = list(ProductPost.objects.values_list('id', flat=True))
+    for start in range(0, len(post_ids), batch_size):
+        index_product_posts(post_ids[start:start + batch_size])
+    return len(post_ids)
+
+
+class MatchScore(Func):
+    """Điểm liên quan của ProductPostSearch với câu truy vấn (càng lớn càng liên quan, NULL/0 là không khớp)."""
+    output_field = FloatField()
+
+    def __init__(self, query, **extra):
+        super().__init__(F('post_id'), F('document'), Value(query), **extra)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        document_sql, document_params = compiler.compile(self.source_expressions[1])
+        query_sql, query_params = compiler.compile(self.source_expressions[2])
+        sql = 'MATCH (%s) AGAINST (%s IN NATURAL LANGUAGE MODE)' % (document_sql, query_sql)
+        return sql, (*document_params, *query_params)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        post_sql, post_params = compiler.compile(self.source_expressions[0])
+        query_sql, query_params = compiler.compile(self.source_expressions[2])
+        sql = '(SELECT -bm25({fts}) FROM {fts} WHERE {fts} MATCH {query} AND {fts}.rowid = {post})'.format(
+            fts=FTS_TABLE, query=query_sql, post=post_sql)
+        return sql, (*query_params, *post_params)
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query.lower())[:MAX_TERMS]
+
+
+def search_product_posts(query):
+    """QuerySet ProductPostSearch của các bài active khớp query, có field score, xếp theo độ liên quan."""
+    terms = tokenize(query)
+    q = ProductPostSearch.objects.filter(post__active=True)
+    if not terms:
+        return q.none()
+
+    if connection.vendor == 'mysql':
+        q = q.annotate(score=MatchScore(' '.join(terms))).filter(score__gt=0)
+    elif connection.vendor == 'sqlite':
+        q = q.annotate(score=MatchScore(' OR '.join('"%s"' % term for term in terms))).filter(score__isnull=False)
+    else:
+        # Backend không có full-text index: lọc tuần tự, không xếp hạng
+        condition = Q()
+        for term in terms:
+            condition |= Q(document__icontains=term)
+        q = q.filter(condition).annotate(score=Value(0.0, output_field=FloatField()))
+
+    return q.order_by('-score', '-post_id')
+
+
+# ==== TÌM NGƯỜI DÙNG (TIỀN TỐ) ====
+# Mỗi user có vài dòng UserSearchToken; "ngu va" khớp user có một token bắt đầu bằng "ngu" và một token
+# bắt đầu bằng "va". Truy vấn là range scan trên index (token, user) nên không quét cả bảng.
+USER_TOKEN_MAX_LENGTH = UserSearchToken._meta.get_field('token').max_length
+
+
+def normalize(text):
+    # "Nguyễn Đức" -> "nguyen duc"
+    text = unicodedata.normalize('NFKD', text.lower().replace('đ', 'd'))
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def user_tokens(*values):
+    tokens = set()
+    for value in values:
+        if value:
+            tokens.update(token[:USER_TOKEN_MAX_LENGTH] for token in TOKEN_RE.findall(normalize(value)))
+    return tokens
+
+
+def index_users(user_ids):
+    user_ids = list(user_ids)
+    phones = dict(Account.objects.filter(user_id__in=user_ids).values_list('user_id', 'phone_number'))
+    tokens = [UserSearchToken(user_id=user.id, token=token)
+              for user in User.objects.filter(id__in=user_ids).only('username', 'first_name', 'last_name')
+              for token in user_tokens(user.username, user.first_name, user.last_name, phones.get(user.id))]
+
+    UserSearchToken.objects.filter(user_id__in=user_ids).delete()
+    UserSearchToken.objects.bulk_create(tokens, ignore_conflicts=True)
+    return len(tokens)
+
+
+def rebuild_user_index(batch_size=1000):
+    user_ids = list(User.objects.values_list('id', flat=True))
+    for start in range(0, len(user_ids), batch_size):
+        index_users(user_ids[start:start + batch_size])
+    return len(user_ids)
+
+
+def matching_user_tokens(query):
+    """UserSearchToken khớp từ cuối của query, của những user khớp mọi từ còn lại (None nếu query rỗng)."""
+    terms = TOKEN_RE.findall(normalize(query))[:MAX_TERMS]
+    if not terms:
+        return None
+
+    q = UserSearchToken.objects.filter(token__istartswith=terms[-1][:USER_TOKEN_MAX_LENGTH])
+    for term in terms[:-1]:
+        q = q.filter(user_id__in=UserSearchToken.objects.filter(token__istartswith=term[:USER_TOKEN_MAX_LENGTH])
+                     .values('user_id'))
+    return q
+
+
+def search_user_ids(query):
+    # Subquery id user dùng cho filter(id__in=...)
+    tokens = matching_user_tokens(query)
+    return None if tokens is None else tokens.values('user_id')
+
+
+def autocomplete_users(query, limit=10):
+    # Từ cuối là từ đang gõ: đi theo thứ tự index (token, user), mỗi lần vài chục dòng, tới khi đủ `limit` user
+    tokens = matching_user_tokens(query)
+    if tokens is None:
+        return []
+
+    tokens = tokens.filter(user__is_active=True).order_by('token', 'user_id').values_list('user_id', flat=True)
+    batch_size = limit * 4
+    user_ids = []
+    start = 0
+    while len(user_ids) < limit:
+        rows = list(tokens[start:start + batch_size])
+        for user_id in rows:
+            if user_id not in user_ids:
+                user_ids.append(user_id)
+        if len(rows) < batch_size:
+            break
+        start += batch_size
+    user_ids = user_ids[:limit]
+
+    users = User.objects.in_bulk(user_ids)
+    return [users[user_id] for user_id in user_ids if user_id in users]
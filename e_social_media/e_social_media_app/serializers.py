@@ -1,19 +1,155 @@
+import uuid
+
+from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
 
+from . import dao, polls
 from .models import *
 
-class RoleSerializer(serializers.ModelSerializer):
+
+def parse_field_spec(value):
+    # 'id,product.price,account.user' -> {'id': {}, 'product': {'price': {}}, 'account': {'user': {}}}
+    spec = {}
+    for path in value.split(','):
+        node = spec
+        for part in path.strip().split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    return spec
+
+
+class FieldSpec:
+    """
+    ?fields=id,product.price  -> chỉ giữ các field được liệt kê (field lồng nhau viết bằng dấu chấm)
+    ?expand=account,comment   -> chỉ mở rộng các field trong Meta.expandable_fields được liệt kê,
+                                 field lồng nhau còn lại trả về khoá chính, method field bị bỏ.
+    Không truyền tham số thì giữ nguyên toàn bộ như cũ, trừ Meta.opt_in_fields: chỉ trả về khi được
+    nêu tên trong ?fields= hoặc ?expand=.
+    """
+
+    def __init__(self, fields=None, expand=None):
+        self.fields = parse_field_spec(fields) if fields else None
+        self.expand = parse_field_spec(expand) if expand is not None else None
+
+    @classmethod
+    def from_request(cls, request):
+        if request is None or request.method not in ('GET', 'HEAD'):
+            return cls()
+        return cls(request.query_params.get('fields'), request.query_params.get('expand'))
+
+    def includes(self, path):
+        node = self.fields
+        for part in path:
+            if not node:
+                return True
+            if part not in node:
+                return False
+            node = node[part]
+        return True
+
+    def names(self, path):
+        for node in (self.fields, self.expand):
+            for part in path:
+                if not node or part not in node:
+                    node = None
+                    break
+                node = node[part]
+            if node is not None:
+                return True
+        return False
+
+    def expands(self, path):
+        node = self.expand
+        for part in path:
+            if node is None:
+                return True
+            if part not in node:
+                return False
+            node = node[part]
+        return True
+
+
+class DynamicFieldsMixin:
+    def get_field_spec(self):
+        root = self.root
+        if not hasattr(root, '_field_spec'):
+            root._field_spec = FieldSpec.from_request(self.context.get('request'))
+        return root._field_spec
+
+    def get_field_path(self):
+        path = []
+        node = self
+        while node.parent is not None:
+            if node.field_name:
+                path.append(node.field_name)
+            node = node.parent
+        return tuple(self.context.get('field_path', ())) + tuple(reversed(path))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        spec = self.get_field_spec()
+        path = self.get_field_path()
+        for name in getattr(self.Meta, 'opt_in_fields', []):
+            if name in fields and not spec.names(path + (name,)):
+                del fields[name]
+        if spec.fields is None and spec.expand is None:
+            return fields
+
+        expandable = getattr(self.Meta, 'expandable_fields', [])
+        for name in list(fields):
+            field = fields[name]
+            if not spec.includes(path + (name,)):
+                del fields[name]
+            elif name in expandable and not spec.expands(path + (name,)):
+                if isinstance(field, serializers.Serializer):
+                    # Chỉ trả khoá chính, đọc từ cột <name>_id nên không query bảng liên quan
+                    fields[name] = serializers.PrimaryKeyRelatedField(read_only=True, source=field.source)
+                else:
+                    del fields[name]
+        return fields
+
+    def nested_context(self, field_name):
+        # Context cho serializer lồng bên trong SerializerMethodField
+        return dict(self.context, field_path=self.get_field_path() + (field_name,))
+
+    def wants(self, path):
+        # 'account.user' -> field còn được serialize (dạng lồng đầy đủ) sau khi áp dụng fields/expand hay không
+        parts = path.split('.')
+        fields = self.fields
+        for i, part in enumerate(parts):
+            field = fields.get(part)
+            if field is None:
+                return False
+            field = getattr(field, 'child', field)
+            if i == len(parts) - 1:
+                return True
+            if isinstance(field, serializers.SerializerMethodField):
+                # Serializer lồng trong method field: chỉ kiểm tra được theo tham số của request
+                spec = self.get_field_spec()
+                full_path = self.get_field_path() + tuple(parts)
+                return spec.includes(full_path) and spec.expands(full_path)
+            if not isinstance(field, serializers.Serializer):
+                return False
+            fields = field.fields
+        return True
+
+
+class ModelSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    pass
+
+class RoleSerializer(ModelSerializer):
     class Meta:
         model = Role
         fields = '__all__'
 
-class ConfirmStatusSerializer(serializers.ModelSerializer):
+class ConfirmStatusSerializer(ModelSerializer):
     class Meta:
         model = ConfirmStatus
         fields = '__all__'
 
 # ====USER====
-class CreateUserSerializer(serializers.ModelSerializer):
+class CreateUserSerializer(ModelSerializer):
     id  = serializers.IntegerField(source='pk',read_only=True)
 
     class Meta:
@@ -27,7 +163,7 @@ class CreateUserSerializer(serializers.ModelSerializer):
         user.save()
         return user
 
-class UpdateUserSerializer(serializers.ModelSerializer):
+class UpdateUserSerializer(ModelSerializer):
     id = serializers.IntegerField(source='pk',read_only=True)
 
     class Meta:
@@ -40,7 +176,7 @@ class UpdateUserSerializer(serializers.ModelSerializer):
             instance.set_password(password)
         return super().update(instance, validate_data)
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(ModelSerializer):
     class Meta:
         model = User
         fields = ['id','username','first_name','last_name','email']
@@ -59,19 +195,65 @@ class UserSerializer(serializers.ModelSerializer):
             instance.set_password(password)
         return super().update(instance, validated_data)
 
-class UserSerializerForSearch(serializers.ModelSerializer):
+class UserSerializerForSearch(ModelSerializer):
     class Meta:
         model = User
         fields = ['id','username','first_name','last_name','email']
 
-class UserSerializerForComment(serializers.ModelSerializer):
+class UserSerializerForComment(ModelSerializer):
     class Meta:
         model = User
         fields = ['id','username']
 
 # ====ACCOUNT====
 
-class AccountSerializerForUser(serializers.ModelSerializer):
+def image_variant_url(image, variants, variant):
+    # Bản thu nhỏ do imaging.py tạo (thumbnail / feed / full) nếu đã xử lý xong đúng ảnh hiện tại, chưa có thì dùng ảnh gốc
+    if not image:
+        return None
+    if variants and variants.get('source') == image.name and variant in variants:
+        return variants[variant]
+    return image.name
+
+
+class UploadField(serializers.PrimaryKeyRelatedField):
+    # Id upload đã finalize (uploads.py) của chính người gửi request
+    def get_queryset(self):
+        request = self.context.get('request')
+        if request is None or not request.user.is_authenticated:
+            return Upload.objects.none()
+        return Upload.objects.filter(account__user=request.user, active=True).exclude(file='').exclude(file__isnull=True)
+
+    def to_internal_value(self, data):
+        try:
+            uuid.UUID(str(data))
+        except ValueError:
+            self.fail('does_not_exist', pk_value=data)
+        return super().to_internal_value(data)
+
+
+class AttachUploadMixin:
+    # Gán file của field `upload` vào Meta.upload_field (chỉ gán tên file, không chép lại dữ liệu).
+    # Upload bị xoá sau khi lưu: dòng vừa gán giữ tham chiếu tới blob, upload không còn giữ blob lại mãi
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        upload = attrs.pop('upload', None)
+        if upload is not None:
+            attrs[self.Meta.upload_field] = upload.file.name
+        self._attached_upload = upload
+        return attrs
+
+    def save(self, **kwargs):
+        upload = getattr(self, '_attached_upload', None)
+        with transaction.atomic():
+            instance = super().save(**kwargs)
+            if upload is not None:
+                # Xoá qua queryset: request khác đã dùng upload này thì không bớt tham chiếu lần nữa
+                Upload.objects.filter(id=upload.id).delete()
+        return instance
+
+
+class AccountSerializerForUser(ModelSerializer):
     user = UserSerializerForSearch()
     role = RoleSerializer()
 
@@ -84,20 +266,18 @@ class AccountSerializerForUser(serializers.ModelSerializer):
 
     @staticmethod
     def get_avatar(account):
-        if account.avatar:
-            return account.avatar.name
+        return image_variant_url(account.avatar, account.avatar_variants, 'thumbnail')
 
     class Meta:
         model = Account
         fields = ['user', 'avatar', 'phone_number','role']
 
-class AccountSerializerForComment(serializers.ModelSerializer):
+class AccountSerializerForComment(ModelSerializer):
     avatar = serializers.SerializerMethodField(source='avatar')
 
     @staticmethod
     def get_avatar(account):
-        if account.avatar:
-            return account.avatar.name
+        return image_variant_url(account.avatar, account.avatar_variants, 'thumbnail')
 
     @staticmethod
     def get_user(account):
@@ -107,14 +287,13 @@ class AccountSerializerForComment(serializers.ModelSerializer):
         model = Account
         fields = '__all__'
 
-class AccountSerializerForComment2(serializers.ModelSerializer):
+class AccountSerializerForComment2(ModelSerializer):
     user = UserSerializerForComment()
     avatar = serializers.SerializerMethodField(source='avatar')
 
     @staticmethod
     def get_avatar(account):
-        if account.avatar:
-            return account.avatar.name
+        return image_variant_url(account.avatar, account.avatar_variants, 'thumbnail')
 
     # def get_avatar(self, account):
     #     if account.avatar:
@@ -126,46 +305,72 @@ class AccountSerializerForComment2(serializers.ModelSerializer):
     class Meta:
         model = Account
         fields = ['id', 'user', 'role', 'avatar']
+        expandable_fields = ['user']
 
 
 # ====POST====
 
-class CreatePostSerializer(serializers.ModelSerializer):
+class CreatePostSerializer(ModelSerializer):
     id = serializers.IntegerField(source='pk', read_only=True)
 
     class Meta:
         model = Post
         fields = ['id','post_content', 'account']
 
-class UpdatePostSerializer(serializers.ModelSerializer):
+class UpdatePostSerializer(ModelSerializer):
     id = serializers.IntegerField(source='pk', read_only=True)
 
     class Meta:
         model = Post
         fields = ['id', 'post_content', 'comment_lock']
 
-class PostSerializer(serializers.ModelSerializer):
+class PostSerializer(ModelSerializer):
+    reaction_summary = serializers.SerializerMethodField()
+
     class Meta:
         model = Post
         fields = '__all__'
+        read_only_fields = ['reaction_count']
+
+    def get_reaction_summary(self, obj):
+        return dao.reaction_summary_map(obj.reaction_summaries.all())
 
 
-class PostSerializerForList(serializers.ModelSerializer):
+class PostSerializerForList(ModelSerializer):
     account = AccountSerializerForComment()
 
     class Meta:
         model = Post
         fields = '__all__'
+        read_only_fields = ['reaction_count']
+
+
 
+def validate_comment_parent(parent, post_id):
+    # Trả lời phải cùng bài với comment cha và không sâu quá Comment.MAX_DEPTH
+    if parent is None:
+        return parent
+    if parent.post_id != int(post_id):
+        raise serializers.ValidationError('Parent comment belongs to another post.')
+    if parent.depth >= Comment.MAX_DEPTH:
+        raise serializers.ValidationError('Thread is too deep.')
+    return parent
 
 
-class CommentSerializerForPost(serializers.ModelSerializer):
+class CommentSerializerForPost(AttachUploadMixin, ModelSerializer):
     account = AccountSerializerForComment(read_only=True)  # Để field này chỉ có thể đọc
  # Trả về None nếu không có hình ảnh
+    parent = serializers.PrimaryKeyRelatedField(queryset=Comment.objects.filter(active=True), required=False,
+                                                allow_null=True)
+    upload = UploadField(write_only=True, required=False, allow_null=True)
 
     class Meta:
         model = Comment
-        fields = ['comment_content','account']
+        fields = ['comment_content','account', 'parent', 'upload']
+        upload_field = 'comment_image_url'
+
+    def validate_parent(self, parent):
+        return validate_comment_parent(parent, self.context['request'].parser_context['kwargs']['post_id'])
 
     def create(self, validated_data):
         # Lấy account từ request.user
@@ -180,33 +385,35 @@ class CommentSerializerForPost(serializers.ModelSerializer):
         return comment
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(ModelSerializer):
     class Meta:
         model = Category
         fields = ['id','category_name']
 
-class UserSerializerForPostProduct(serializers.ModelSerializer):
+class UserSerializerForPostProduct(ModelSerializer):
     class Meta:
         model = User
         fields = ['id','username']
 
-class AccountSerializerForPostProduct(serializers.ModelSerializer):
+class AccountSerializerForPostProduct(ModelSerializer):
     user = UserSerializerForPostProduct()
 
     class Meta:
         model = Account
         fields = ['id','user']
+        expandable_fields = ['user']
 
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(ModelSerializer):
     category = CategorySerializer()
     class Meta:
         model = Product
         fields = ['id', 'product_name', 'description', 'price','category']
+        expandable_fields = ['category']
 
 
-class ProductSerializerForPost(serializers.ModelSerializer):
+class ProductSerializerForPost(ModelSerializer):
     category = CategorySerializer()
 
     class Meta:
@@ -234,11 +441,14 @@ class ProductSerializerForPost(serializers.ModelSerializer):
         product = Product.objects.create(category=category, owner=owner, **validated_data)
         return product
 
-class ProductPostSerializer2(serializers.ModelSerializer):
+class ProductPostSerializer2(AttachUploadMixin, ModelSerializer):
     product = ProductSerializerForPost()
+    upload = UploadField(write_only=True, required=False)
+
     class Meta:
         model = ProductPost
-        fields = ['post_content', 'account', 'product']
+        fields = ['post_content', 'account', 'product', 'upload']
+        upload_field = 'post_image_url'
 
     def create(self, validated_data):
         product_data = validated_data.pop('product')
@@ -255,14 +465,14 @@ class ProductPostSerializer2(serializers.ModelSerializer):
 
 # ====REACTION====
 
-class ReactionSerializer(serializers.ModelSerializer):
+class ReactionSerializer(ModelSerializer):
     class Meta:
         model = Reaction
         fields = '__all__'
 
 
 # ====POST-REACTION====
-class AccountSerializerForPostReaction(serializers.ModelSerializer):
+class AccountSerializerForPostReaction(ModelSerializer):
     role = serializers.SerializerMethodField()
     user = serializers.SerializerMethodField()
 
@@ -276,31 +486,31 @@ class AccountSerializerForPostReaction(serializers.ModelSerializer):
     def get_user(self, obj):
         return 'id:' + str(UserSerializer(obj.user).data['id']) + '/username:' + UserSerializer(obj.user).data['username']
 
-class ReactionSerializerForPostReaction(serializers.ModelSerializer):
+class ReactionSerializerForPostReaction(ModelSerializer):
     class Meta:
         model = Reaction
         fields = ['id','reaction_name']
 
-class PostSerializerForPostReaction(serializers.ModelSerializer):
+class PostSerializerForPostReaction(ModelSerializer):
     class Meta:
         model = Post
         fields = ['id','post_content']
 
-class CreatePostReactionSerializer(serializers.ModelSerializer):
+class CreatePostReactionSerializer(ModelSerializer):
     id = serializers.IntegerField(source='pk', read_only=True)
 
     class Meta:
         model = PostReaction
         fields = ['id','reaction','post','account']
 
-class UpdatePostReactionSerializer(serializers.ModelSerializer):
+class UpdatePostReactionSerializer(ModelSerializer):
     id = serializers.IntegerField(source='pk', read_only=True)
 
     class Meta:
         model = PostReaction
         fields = ['id', 'reaction', 'post']
 
-class PostReactionSerializer(serializers.ModelSerializer):
+class PostReactionSerializer(ModelSerializer):
     account = AccountSerializerForPostReaction()
     reaction = ReactionSerializerForPostReaction()
     post = PostSerializerForPostReaction()
@@ -308,44 +518,47 @@ class PostReactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = PostReaction
         fields = '__all__'
+        expandable_fields = ['account', 'reaction', 'post']
 
-class TempSerializer(serializers.ModelSerializer):
+class TempSerializer(ModelSerializer):
     class Meta:
         model = PostReaction
         fields = ['id']
 
-class AccountSerializer(serializers.ModelSerializer):
+class AccountSerializer(AttachUploadMixin, ModelSerializer):
     avatar = serializers.SerializerMethodField(source='avatar')
+    upload = UploadField(write_only=True, required=False)
     role = RoleSerializer()
     user = UserSerializer()
 
     @staticmethod
     def get_avatar(account):
-        if account.avatar:
-            return account.avatar.name
+        return image_variant_url(account.avatar, account.avatar_variants, 'full')
 
     class Meta:
         model = Account
         fields = '__all__'
+        expandable_fields = ['role', 'user']
+        upload_field = 'avatar'
 
 
 # ====PRODUCT-POST-REACTION====
 
-class ProductPostReactionSerializer(serializers.ModelSerializer):
+class ProductPostReactionSerializer(ModelSerializer):
     account = AccountSerializerForPostProduct()
     reaction = ReactionSerializerForPostReaction()
 
     class Meta:
         model = ProductPostReaction
         fields = '__all__'
-class CommentSerializerForPostProduct(serializers.ModelSerializer):
+        expandable_fields = ['account', 'reaction']
+class CommentSerializerForPostProduct(ModelSerializer):
     comment_image_url = serializers.SerializerMethodField(source='comment_image_url')
     account = AccountSerializerForComment2()
 
     @staticmethod
     def get_comment_image_url(comment):
-        if comment.comment_image_url:
-            return comment.comment_image_url.name
+        return image_variant_url(comment.comment_image_url, comment.comment_image_variants, 'feed')
 
     @staticmethod
     def get_user(account):
@@ -354,9 +567,10 @@ class CommentSerializerForPostProduct(serializers.ModelSerializer):
     class Meta:
         model = Comment
         fields = '__all__'
+        expandable_fields = ['account']
 
 
-class PostProductPostSerializer(serializers.ModelSerializer):
+class PostProductPostSerializer(ModelSerializer):
     account = AccountSerializerForPostProduct()
     product = ProductSerializer()
 
@@ -372,29 +586,54 @@ class PostProductPostSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Account not found.")
 
 
-class ProductPostSerializer(serializers.ModelSerializer):
+class ProductPostSerializer(ModelSerializer):
     account = AccountSerializerForPostProduct()
     product = ProductSerializer()
+    post_image_url = serializers.SerializerMethodField()
     comment = serializers.SerializerMethodField()
     reaction = serializers.SerializerMethodField()
-    reaction_count = serializers.SerializerMethodField()
-    comment_count = serializers.SerializerMethodField()
+    reaction_summary = serializers.SerializerMethodField()
+    viewer_reaction = serializers.SerializerMethodField()
+    viewer_commented = serializers.SerializerMethodField()
 
     class Meta:
         model = ProductPost
-        fields = ['id', 'created_date', 'updated_date', 'deleted_date', 'active', 'post_content', 'account', 'product', 'comment', 'reaction','reaction_count','comment_count']
+        fields = ['id', 'created_date', 'updated_date', 'deleted_date', 'active', 'post_content', 'post_image_url', 'account', 'product', 'comment', 'reaction','reaction_count','comment_count', 'reaction_summary', 'viewer_reaction', 'viewer_commented']
+        read_only_fields = ['reaction_count', 'comment_count']
+        expandable_fields = ['account', 'product', 'comment', 'reaction']
+        # Danh sách reaction đầy đủ chỉ trả về khi ?expand=reaction (hoặc ?fields=reaction), mặc định dùng viewer_reaction
+        opt_in_fields = ['reaction']
+
+    @staticmethod
+    def get_post_image_url(obj):
+        return image_variant_url(obj.post_image_url, obj.post_image_variants, 'feed')
 
     def get_comment(self, obj):
-        return CommentSerializerForPostProduct(obj.comment_set.all(), many=True).data
+        # Chỉ nhúng vài comment mới nhất, phần còn lại lấy qua product-posts/<id>/comments/
+        if hasattr(obj, 'comment_preview'):
+            comments = obj.comment_preview
+        else:
+            comments = dao.comment_preview_queryset().select_related('account__user') \
+                .filter(post=obj)[:dao.COMMENT_PREVIEW_SIZE]
+        return CommentSerializerForPostProduct(comments, many=True, context=self.nested_context('comment')).data
 
     def get_reaction(self, obj):
-        return ProductPostReactionSerializer(obj.productpostreaction_set.all(), many=True).data
+        return ProductPostReactionSerializer(obj.productpostreaction_set.all(), many=True,
+                                             context=self.nested_context('reaction')).data
 
-    def get_reaction_count(self, obj):
-        return obj.productpostreaction_set.count()
+    def get_reaction_summary(self, obj):
+        # {reaction_id: số lượng} từ bảng tổng hợp, không đọc từng reaction
+        return dao.reaction_summary_map(obj.reaction_summaries.all())
 
-    def get_comment_count(self, obj):
-        return obj.comment_set.count()
+    # Trạng thái của người xem không nằm trong payload (payload được cache chung cho mọi người xem):
+    # caching.add_viewer_state điền hai field này theo từng request, ở đây chỉ là giá trị mặc định
+    @staticmethod
+    def get_viewer_reaction(obj):
+        return None
+
+    @staticmethod
+    def get_viewer_commented(obj):
+        return False
 
     def add_reaction(self, post_id, account_id, reaction_name):
         reaction = Reaction.objects.create(reaction_name=reaction_name, account_id=account_id, post_id=post_id)
@@ -418,7 +657,7 @@ class ProductPostSerializer(serializers.ModelSerializer):
 
 # ====ACCOUNT====
 
-class CreateAccountSerializer(serializers.ModelSerializer):
+class CreateAccountSerializer(ModelSerializer):
     id = serializers.IntegerField(source='pk', read_only=True)
 
     user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
@@ -430,16 +669,18 @@ class CreateAccountSerializer(serializers.ModelSerializer):
         fields = ['id', 'phone_number', 'gender', 'date_of_birth', 'avatar','account_status', 'user',
                   'role']
 
-class UpdateAccountSerializer(serializers.ModelSerializer):
+class UpdateAccountSerializer(AttachUploadMixin, ModelSerializer):
     id = serializers.IntegerField(source='pk', read_only=True)
+    upload = UploadField(write_only=True, required=False)
 
     class Meta:
         model = Account
-        fields = ['id', 'phone_number', 'date_of_birth', 'avatar', 'account_status', 'role']
+        fields = ['id', 'phone_number', 'date_of_birth', 'avatar', 'account_status', 'role', 'upload']
+        upload_field = 'avatar'
 
 
 
-class PostReactionSerializerForAccount(serializers.ModelSerializer):
+class PostReactionSerializerForAccount(ModelSerializer):
     class Meta:
         model = PostReaction
         fields = ['reaction_id']
@@ -447,110 +688,177 @@ class PostReactionSerializerForAccount(serializers.ModelSerializer):
 
 # ====COMMENT====
 
-class CreateCommentSerializer(serializers.ModelSerializer):
+class CreateCommentSerializer(AttachUploadMixin, ModelSerializer):
     id = serializers.IntegerField(source='pk', read_only=True)
+    upload = UploadField(write_only=True, required=False)
 
     class Meta:
         model = Comment
-        fields = ['id', 'comment_content', 'comment_image_url', 'account', 'post']
+        fields = ['id', 'comment_content', 'comment_image_url', 'account', 'post', 'parent', 'upload']
+        upload_field = 'comment_image_url'
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        try:
+            validate_comment_parent(attrs.get('parent'), attrs['post'].id)
+        except serializers.ValidationError as e:
+            raise serializers.ValidationError({'parent': e.detail})
+        return attrs
 
 
-class UpdateCommentSerializer(serializers.ModelSerializer):
+class UpdateCommentSerializer(AttachUploadMixin, ModelSerializer):
     id = serializers.IntegerField(source='pk', read_only=True)
+    upload = UploadField(write_only=True, required=False)
 
     class Meta:
         model = Comment
-        fields = ['id', 'comment_content', 'comment_image_url']
+        fields = ['id', 'comment_content', 'comment_image_url', 'upload']
+        upload_field = 'comment_image_url'
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(ModelSerializer):
     comment_image_url = serializers.SerializerMethodField(source='comment_image_url')
 
     @staticmethod
     def get_comment_image_url(comment):
-        if comment.comment_image_url:
-            return comment.comment_image_url.name
+        return image_variant_url(comment.comment_image_url, comment.comment_image_variants, 'full')
 
     class Meta:
         model = Comment
         fields = '__all__'
 
+# ====UPLOAD====
+
+class UploadSerializer(ModelSerializer):
+    completed = serializers.BooleanField(read_only=True)
+    file = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Upload
+        fields = ['id', 'file_name', 'total_size', 'received_size', 'completed', 'file']
+        read_only_fields = ['received_size']
+
+    @staticmethod
+    def get_file(upload):
+        if upload.file:
+            return upload.file.name
+
+    def validate_total_size(self, value):
+        limit = settings.CHUNKED_UPLOAD_MAX_SIZE
+        if not 0 < value <= limit:
+            raise serializers.ValidationError(f'File size must be between 1 and {limit} bytes.')
+        return value
+
 # ====POLL====
 
-class CreatePostPollSerializer(serializers.ModelSerializer):
+class CreatePostPollSerializer(ModelSerializer):
     id = serializers.IntegerField(source='pk', read_only=True)
 
     class Meta:
         model = PostPoll
         fields = ['id','title', 'start_time', 'end_time', 'post']
 
-class UpdatePostPollSerializer(serializers.ModelSerializer):
+class UpdatePostPollSerializer(ModelSerializer):
     id = serializers.IntegerField(source='pk', read_only=True)
 
     class Meta:
         model = PostPoll
         fields =  ['title', 'start_time', 'end_time', 'post']
 
-class PostPollSerializer(serializers.ModelSerializer):
+class PostPollSerializer(ModelSerializer):
     class Meta:
         model = PostPoll
         fields = '__all__'
 
 # ====POLL-OPTION====
 
-class CreatePollOptionSerializer(serializers.ModelSerializer):
+class CreatePollOptionSerializer(ModelSerializer):
     id = serializers.IntegerField(source='pk', read_only=True)
 
     class Meta:
         model = PollOption
         fields = ['id', 'option_text', 'poll']
 
-class UpdatePollOptionSerializer(serializers.ModelSerializer):
+class UpdatePollOptionSerializer(ModelSerializer):
     id = serializers.IntegerField(source='pk', read_only=True)
 
     class Meta:
         model = PollOption
         fields = ['id', 'option_text']
 
-class PollOptionSerializer(serializers.ModelSerializer):
+class PollOptionSerializer(ModelSerializer):
     class Meta:
         model = PollOption
         fields = '__all__'
 
 # ====POLL-RESPONSE====
 
-class CreatePollResponseSerializer(serializers.ModelSerializer):
+def validate_poll_option(option, poll):
+    if option.poll_id != poll.id:
+        raise serializers.ValidationError('Option does not belong to this poll.')
+    if poll.is_closed:
+        raise serializers.ValidationError('Poll is closed.')
+    return option
+
+
+class CreatePollResponseSerializer(ModelSerializer):
     id = serializers.IntegerField(source='pk', read_only=True)
 
     class Meta:
         model = PollResponse
-        fields = ['id', 'poll_option', 'account']
+        fields = ['id', 'poll', 'option', 'account']
+        # Bỏ UniqueTogetherValidator của ràng buộc (poll, account): phiếu trùng được xử lý trong create()
+        validators = []
+
+    def validate(self, attrs):
+        try:
+            validate_poll_option(attrs['option'], attrs['poll'])
+        except serializers.ValidationError as e:
+            raise serializers.ValidationError({'option': e.detail})
+        return attrs
+
+    def create(self, validated_data):
+        # Đã bỏ phiếu trên poll này thì đổi phiếu, không tạo dòng thứ hai
+        return polls.cast_vote(validated_data['poll'].id, validated_data['option'].id, validated_data['account'].id)[0]
+
+
+class PollVoteSerializer(serializers.Serializer):
+    # Poll lấy từ URL, đặt trong context['poll']
+    option = serializers.PrimaryKeyRelatedField(queryset=PollOption.objects.filter(active=True))
 
-class PollResponseSerializer(serializers.ModelSerializer):
+    def validate_option(self, option):
+        return validate_poll_option(option, self.context['poll'])
+
+class PollResponseSerializer(ModelSerializer):
     class Meta:
         model = PollResponse
         fields = '__all__'
 
-class UpdatePollResponseSerializer(serializers.ModelSerializer):
+class UpdatePollResponseSerializer(ModelSerializer):
+    # Chỉ đổi option trong cùng poll; poll / account cố định theo ràng buộc (poll, account)
     class Meta:
         model = PollResponse
-        fields = '__all__'
+        fields = ['id', 'poll', 'option', 'account']
+        read_only_fields = ['poll', 'account']
+
+    def validate_option(self, option):
+        return validate_poll_option(option, self.instance.poll)
 
 # ====ROOM-CHAT====
 
-class CreateRoomSerializer(serializers.ModelSerializer):
+class CreateRoomSerializer(ModelSerializer):
     class Meta:
         model = Room
         fields = ['first_user', 'second_user']
 
 
-class UpdateRoomSerializer(serializers.ModelSerializer):
+class UpdateRoomSerializer(ModelSerializer):
     class Meta:
         model = Room
         fields = ['seen']
 
 
-class RoomSerializer(serializers.ModelSerializer):
+class RoomSerializer(ModelSerializer):
     first_user = AccountSerializerForComment()
     second_user = AccountSerializerForComment()
 
@@ -560,12 +868,12 @@ class RoomSerializer(serializers.ModelSerializer):
 
 # ====MESSAGE====
 
-class MessageSerializer(serializers.ModelSerializer):
+class MessageSerializer(ModelSerializer):
     class Meta:
         model = Message
         fields = '__all__'
 
-class CurrentAccountSerializer(serializers.ModelSerializer):
+class CurrentAccountSerializer(ModelSerializer):
     class Meta:
         model = Account
         fields = ['id', 'user','role']
@@ -575,3 +883,20 @@ class ProductPostStatisticSerializer(serializers.Serializer):
     month = serializers.IntegerField()
     year = serializers.IntegerField()
     post_count = serializers.IntegerField()
+
+
+class ProductCatalogQuerySerializer(serializers.Serializer):
+    # Tham số query của /product-posts/catalog/
+    category = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    active = serializers.ChoiceField(choices=['true', 'false', 'all'], default='true')
+    owner = serializers.IntegerField(min_value=1, required=False)
+    sort = serializers.ChoiceField(choices=['newest', 'price', 'popular'], default='newest')
+
+    def validate(self, attrs):
+        if attrs.get('min_price') is not None and attrs.get('max_price') is not None \
+                and attrs['min_price'] > attrs['max_price']:
+            raise serializers.ValidationError({'max_price': 'Must be greater than or equal to min_price.'})
+        attrs['active'] = {'true': True, 'false': False, 'all': None}[attrs['active']]
+        return attrs
@@ -1,6 +1,10 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, post_init, pre_save
+from django.db import transaction
+from django.db.models import F
 from django.dispatch import receiver
-from .models import Account, Role, User
+from . import dao, caching, search, facets, reactions, imaging, blobs, polls
+from .models import Account, Role, User, Comment, ProductPost, ProductPostReaction, Post, PostReaction, Product, \
+    Category, Reaction, PollResponse, PollOption, PostPoll, Upload
 
 @receiver(post_save, sender=User)
 def create_account_for_new_user(sender, instance, created, **kwargs):
@@ -11,4 +15,405 @@ def create_account_for_new_user(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=User)
 def save_account_for_user(sender, instance, **kwargs):
-    instance.account.save()
+    instance.account.save(update_fields=['updated_date'])
+
+
+# ==== BỘ ĐẾM REACTION / COMMENT ====
+# model con -> [(model cha, tên khoá ngoại, tên cột đếm)]
+COUNTERS = {
+    Comment: [(ProductPost, 'post_id', 'comment_count'), (Comment, 'parent_id', 'reply_count')],
+    ProductPostReaction: [(ProductPost, 'product_post_id', 'reaction_count')],
+    PostReaction: [(Post, 'post_id', 'reaction_count')],
+}
+
+
+def change_counters(sender, instance, delta):
+    for parent_model, fk_name, field in COUNTERS[sender]:
+        parent_id = getattr(instance, fk_name)
+        if parent_id is not None and dao.change_counter(parent_model, parent_id, field, delta) \
+                and parent_model is ProductPost:
+            # Câu UPDATE bộ đếm đã tăng cache_version của bài, các receiver invalidate phía dưới không cần UPDATE lần nữa
+            instance._post_version_bumped = True
+
+
+@receiver(post_init, sender=Comment)
+@receiver(post_init, sender=ProductPostReaction)
+@receiver(post_init, sender=PostReaction)
+def remember_active(sender, instance, **kwargs):
+    # Đọc từ __dict__ để không kích hoạt query khi field active bị defer
+    instance._counted_active = instance.__dict__.get('active')
+
+
+@receiver(pre_save, sender=Comment)
+@receiver(pre_save, sender=ProductPostReaction)
+@receiver(pre_save, sender=PostReaction)
+def claim_active_change(sender, instance, update_fields=None, **kwargs):
+    # (active trong DB trước, sau lần lưu này). Xoá mềm / khôi phục dùng UPDATE có điều kiện: chỉ request đổi được
+    # active trong DB mới cộng / trừ bộ đếm, hai request cùng xoá mềm một dòng không trừ hai lần
+    old, active = instance._counted_active, instance.__dict__.get('active')
+    if update_fields is not None and 'active' not in update_fields:
+        active = old
+    elif not instance._state.adding and None not in (old, active) and old != active:
+        if not sender.objects.filter(pk=instance.pk, active=old).update(active=active):
+            # Request khác đã đổi trước
+            old = active
+    instance._active_saved = (old, active)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=ProductPostReaction)
+@receiver(post_save, sender=PostReaction)
+def count_on_save(sender, instance, created, **kwargs):
+    if created:
+        active = instance.__dict__.get('active')
+        delta = 1 if active else 0
+    else:
+        old, active = instance._active_saved
+        # Xoá mềm (active=False) hoặc khôi phục (active=True)
+        delta = 0 if None in (old, active) or old == active else (1 if active else -1)
+    instance._counted_active = active
+
+    if delta:
+        change_counters(sender, instance, delta)
+
+
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=ProductPostReaction)
+@receiver(post_delete, sender=PostReaction)
+def count_on_delete(sender, instance, **kwargs):
+    if instance.active:
+        change_counters(sender, instance, -1)
+
+
+# ==== CÂY COMMENT (MATERIALIZED PATH) ====
+@receiver(post_save, sender=Comment)
+def set_comment_path(sender, instance, created, **kwargs):
+    # Cần id của comment nên gán sau khi INSERT; path/depth không đổi sau khi tạo
+    if not created:
+        return
+    parent = instance.parent if instance.parent_id else None
+    instance.path = (parent.path if parent else '') + Comment.path_segment(instance.id)
+    instance.depth = parent.depth + 1 if parent else 0
+    Comment.objects.filter(id=instance.id).update(path=instance.path, depth=instance.depth)
+
+
+# ==== BẢN THU NHỎ CỦA ẢNH ====
+@receiver(post_init, sender=Account)
+@receiver(post_init, sender=ProductPost)
+@receiver(post_init, sender=Comment)
+def remember_image(sender, instance, **kwargs):
+    field = imaging.IMAGE_FIELDS[sender][0]
+    instance._image_name = getattr(instance, field).name if field in instance.__dict__ else None
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_save, sender=ProductPost)
+@receiver(post_save, sender=Comment)
+def queue_image_variants(sender, instance, **kwargs):
+    field = imaging.IMAGE_FIELDS[sender][0]
+    if field not in instance.__dict__:
+        return
+    name = getattr(instance, field).name
+    if name and name != instance._image_name:
+        # Xử lý sau khi commit để worker đọc được dòng và file đã lưu
+        transaction.on_commit(lambda: imaging.enqueue(sender, instance.pk))
+    instance._image_name = name
+
+
+# ==== SỐ THAM CHIẾU BLOB ẢNH ====
+# Dòng active có ảnh / upload có file là blob (storage.py) tính một tham chiếu; xoá mềm / xoá hẳn / đổi ảnh thì bớt
+# tham chiếu cũ
+@receiver(post_init, sender=Account)
+@receiver(post_init, sender=ProductPost)
+@receiver(post_init, sender=Comment)
+@receiver(post_init, sender=Upload)
+def remember_blob_ref(sender, instance, **kwargs):
+    instance._blob_ref = blob_ref(sender, instance)
+
+
+def blob_ref(sender, instance):
+    # (đọc được không, tên ảnh đang được tham chiếu); không đọc được khi cột ảnh hoặc active bị defer
+    field = blobs.REF_FIELDS[sender]
+    if field not in instance.__dict__ or 'active' not in instance.__dict__:
+        return False, None
+    return True, (getattr(instance, field).name or None) if instance.active else None
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_save, sender=ProductPost)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Upload)
+def count_blob_ref_on_save(sender, instance, created, **kwargs):
+    old_known, old = (True, None) if created else instance._blob_ref
+    new_known, new = blob_ref(sender, instance)
+    # Không biết trạng thái cũ / mới thì bỏ qua, gc_media_blobs tính lại từ DB
+    if old_known and new_known and old != new:
+        blobs.change_refs({name: delta for name, delta in ((old, -1), (new, 1)) if name})
+    instance._blob_ref = (new_known, new)
+
+
+@receiver(post_delete, sender=Account)
+@receiver(post_delete, sender=ProductPost)
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Upload)
+def count_blob_ref_on_delete(sender, instance, **kwargs):
+    known, name = instance._blob_ref
+    if known and name:
+        blobs.change_refs({name: -1})
+
+
+# ==== DANH MỤC / GIÁ SAO CHÉP SANG PRODUCT POST ====
+@receiver(pre_save, sender=ProductPost)
+def copy_product_fields(sender, instance, **kwargs):
+    product = instance.product if instance.product_id else None
+    instance.category_id = product.category_id if product else None
+    instance.price = product.price if product else None
+
+
+@receiver(post_save, sender=Product)
+def sync_product_fields(sender, instance, created, **kwargs):
+    if not created:
+        posts = ProductPost.objects.filter(product_id=instance.id)
+        old_keys = [facets.facet_key(values) for values in posts.values(*facets.KEY_FIELDS)]
+        posts.update(category_id=instance.category_id, price=instance.price)
+        new_keys = [facets.facet_key(values) for values in posts.values(*facets.KEY_FIELDS)]
+        facets.move_facets(old_keys, new_keys)
+
+
+# ==== REACTION ====
+@receiver(post_save, sender=Reaction)
+@receiver(post_delete, sender=Reaction)
+def clear_reaction_ids(sender, **kwargs):
+    reactions.clear_reaction_ids()
+
+
+# Bảng tổng hợp theo loại reaction: nhớ (active, reaction_id) lúc nạp để biết dòng nào cần đổi khi lưu
+@receiver(post_init, sender=ProductPostReaction)
+@receiver(post_init, sender=PostReaction)
+def remember_reaction(sender, instance, **kwargs):
+    instance._summarized = (instance.__dict__.get('active'), instance.__dict__.get('reaction_id'))
+
+
+@receiver(post_save, sender=ProductPostReaction)
+@receiver(post_save, sender=PostReaction)
+def summarize_on_save(sender, instance, created, **kwargs):
+    old_active, old_reaction = (False, None) if created else instance._summarized
+    active, reaction = instance.__dict__.get('active'), instance.__dict__.get('reaction_id')
+    if not created:
+        # active trước / sau theo DB (claim_active_change): request khác đã xoá mềm dòng này thì chỉ tính đổi loại
+        old_active, active = instance._active_saved
+    if None in (old_active, active, reaction) or (old_active and old_reaction is None):
+        # Có field bị defer: không biết trạng thái cũ/mới, bỏ qua như bộ đếm reaction_count
+        return
+
+    deltas = {}
+    if old_active:
+        deltas[old_reaction] = deltas.get(old_reaction, 0) - 1
+    if active:
+        deltas[reaction] = deltas.get(reaction, 0) + 1
+    reactions.change_summary(sender, getattr(instance, reactions.SUMMARIES[sender][1]), deltas)
+    instance._summarized = (active, reaction)
+
+
+@receiver(post_delete, sender=ProductPostReaction)
+@receiver(post_delete, sender=PostReaction)
+def summarize_on_delete(sender, instance, **kwargs):
+    if instance.active:
+        reactions.change_summary(sender, getattr(instance, reactions.SUMMARIES[sender][1]), {instance.reaction_id: -1})
+
+
+# ==== PHIẾU BẦU POLL ====
+# Nhớ (active, option_id) lúc nạp; đổi phiếu thì bớt option cũ, thêm option mới trong cùng một câu UPDATE
+@receiver(post_init, sender=PollResponse)
+def remember_vote(sender, instance, **kwargs):
+    instance._counted_vote = (instance.__dict__.get('active'), instance.__dict__.get('option_id'))
+
+
+@receiver(post_save, sender=PollResponse)
+def count_vote_on_save(sender, instance, created, **kwargs):
+    old_active, old_option = (False, None) if created else instance._counted_vote
+    active, option = instance.__dict__.get('active'), instance.__dict__.get('option_id')
+    if None in (old_active, active, option) or (old_active and old_option is None):
+        # Có field bị defer: không biết trạng thái cũ / mới
+        return
+
+    deltas = {}
+    if old_active:
+        deltas[old_option] = deltas.get(old_option, 0) - 1
+    if active:
+        deltas[option] = deltas.get(option, 0) + 1
+    polls.change_votes(deltas)
+    instance._counted_vote = (active, option)
+    if any(deltas.values()):
+        polls.results_changed(instance.poll_id)
+
+
+@receiver(post_delete, sender=PollResponse)
+def count_vote_on_delete(sender, instance, **kwargs):
+    if instance.active:
+        polls.change_votes({instance.option_id: -1})
+        polls.results_changed(instance.poll_id)
+
+
+# Thêm / xoá option, đóng / xoá poll: báo cho các kết nối đang xem kết quả (polls.poll_results_stream)
+@receiver(post_save, sender=PollOption)
+@receiver(post_delete, sender=PollOption)
+def publish_poll_options(sender, instance, **kwargs):
+    polls.results_changed(instance.poll_id)
+    caching.invalidate_closed_poll(instance.poll_id)
+
+
+@receiver(post_save, sender=PostPoll)
+@receiver(post_delete, sender=PostPoll)
+def publish_poll(sender, instance, **kwargs):
+    polls.results_changed(instance.id)
+    caching.invalidate_closed_poll(instance.id)
+
+
+@receiver(post_save, sender=PostPoll)
+def freeze_closed_poll(sender, instance, **kwargs):
+    # Đóng tay (admin / PATCH is_closed) cũng chốt kết quả như lệnh close_polls
+    if instance.is_closed and instance.results is None:
+        polls.close_polls([instance])
+
+
+# ==== FACET CATALOG ====
+# Khoá facet lúc nạp từ DB; UNKNOWN khi có cột bị defer (đọc lại từ DB trước khi lưu)
+UNKNOWN = object()
+
+
+@receiver(post_init, sender=ProductPost)
+def remember_facet_key(sender, instance, **kwargs):
+    loaded = all(field in instance.__dict__ for field in facets.KEY_FIELDS)
+    instance._facet_key = facets.facet_key(instance.__dict__) if loaded else UNKNOWN
+
+
+@receiver(pre_save, sender=ProductPost)
+def load_facet_key(sender, instance, **kwargs):
+    if instance._facet_key is UNKNOWN:
+        instance._facet_key = None if instance._state.adding else facets.stored_key(instance.id)
+
+
+@receiver(post_save, sender=ProductPost)
+def count_facet_on_save(sender, instance, **kwargs):
+    loaded = all(field in instance.__dict__ for field in facets.KEY_FIELDS)
+    new_key = facets.facet_key(instance.__dict__) if loaded else facets.stored_key(instance.id)
+    if new_key != instance._facet_key:
+        facets.move_facets([instance._facet_key], [new_key])
+        instance._facet_key = new_key
+
+
+@receiver(post_delete, sender=ProductPost)
+def count_facet_on_delete(sender, instance, **kwargs):
+    if instance._facet_key is not UNKNOWN:
+        facets.move_facets([instance._facet_key], [])
+
+
+# ==== CHỈ MỤC TÌM KIẾM ====
+@receiver(post_save, sender=ProductPost)
+def index_product_post(sender, instance, **kwargs):
+    search.index_product_posts([instance.id])
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, created, **kwargs):
+    if not created:
+        search.index_product_posts(ProductPost.objects.filter(product_id=instance.id).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Category)
+def index_category(sender, instance, created, **kwargs):
+    if not created:
+        search.index_product_posts(ProductPost.objects.filter(category_id=instance.id).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Account)
+def index_user(sender, instance, **kwargs):
+    # Lưu User cũng lưu lại Account (save_account_for_user) nên chỉ cần nghe Account
+    search.index_users([instance.user_id])
+
+
+# ==== CACHE PRODUCT POST ====
+@receiver(pre_save, sender=ProductPost)
+def bump_product_post_version(sender, instance, update_fields=None, **kwargs):
+    # Tăng cache_version ngay trong câu UPDATE của lần lưu (bài mới bắt đầu từ 0, bài bị xoá không còn version)
+    if not instance._state.adding and (update_fields is None or 'cache_version' in update_fields):
+        instance.cache_version = F('cache_version') + 1
+
+
+@receiver(post_save, sender=ProductPost)
+def invalidate_product_post(sender, instance, created, **kwargs):
+    if hasattr(instance.__dict__.get('cache_version'), 'resolve_expression'):
+        # Bỏ biểu thức F() khỏi instance, lần đọc sau nạp lại giá trị từ DB
+        del instance.__dict__['cache_version']
+    elif not created:
+        # Lưu với update_fields không có cache_version
+        caching.invalidate_product_posts([instance.id])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product(sender, instance, **kwargs):
+    caching.invalidate_product_posts(ProductPost.objects.filter(product_id=instance.id).values_list('id', flat=True))
+
+
+# category_name nằm trong payload qua ProductSerializer
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category(sender, instance, **kwargs):
+    caching.invalidate_product_posts(ProductPost.objects.filter(product__category_id=instance.id)
+                                     .values_list('id', flat=True))
+
+
+# reaction_name nằm trong payload qua ProductPostReactionSerializer
+@receiver(post_save, sender=Reaction)
+@receiver(post_delete, sender=Reaction)
+def invalidate_reaction(sender, instance, created=False, **kwargs):
+    if not created:
+        caching.invalidate_product_posts(ProductPostReaction.objects.filter(reaction_id=instance.id).order_by()
+                                         .values_list('product_post_id', flat=True).distinct())
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment(sender, instance, **kwargs):
+    if not consume_version_bump(instance):
+        caching.invalidate_product_posts([instance.post_id])
+
+
+@receiver(post_save, sender=ProductPostReaction)
+@receiver(post_delete, sender=ProductPostReaction)
+def invalidate_product_post_reaction(sender, instance, **kwargs):
+    if not consume_version_bump(instance):
+        caching.invalidate_product_posts([instance.product_post_id])
+
+
+def consume_version_bump(instance):
+    # True nếu bộ đếm của lần lưu / xoá này đã tăng cache_version của bài (change_counters)
+    bumped = getattr(instance, '_post_version_bumped', False)
+    instance._post_version_bumped = False
+    return bumped
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+def invalidate_account(sender, instance, update_fields=None, **kwargs):
+    if kwargs.get('created'):
+        return
+    if update_fields is not None and not caching.ACCOUNT_FIELDS.intersection(update_fields):
+        return
+    caching.invalidate_account(instance.id)
+
+
+# Payload bài chỉ có username của User (UserSerializerForComment)
+@receiver(post_init, sender=User)
+def remember_username(sender, instance, **kwargs):
+    instance._cached_username = instance.__dict__.get('username')
+
+
+@receiver(post_save, sender=User)
+def invalidate_user(sender, instance, created, **kwargs):
+    username = instance.__dict__.get('username')
+    if not created and username != instance._cached_username:
+        caching.invalidate_account(instance.account.id)
+    instance._cached_username = username
@@ -0,0 +1,85 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, storages
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+BLOB_DIR = 'blobs'
+
+
+def blob_storage():
+    # Storage của các ImageField ảnh người dùng tải lên, cấu hình trong settings.STORAGES['blobs']
+    return storages['blobs']
+
+
+def blob_path(digest, ext):
+    # Chia thư mục theo 4 ký tự đầu để mỗi thư mục không có quá nhiều file
+    return '%s/%s/%s/%s%s' % (BLOB_DIR, digest[:2], digest[2:4], digest, ext.lower())
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_DIR + '/')
+
+
+def content_digest(content):
+    # sha256 và kích thước, đọc theo từng chunk của File
+    sha = hashlib.sha256()
+    size = 0
+    for chunk in content.chunks():
+        sha.update(chunk)
+        size += len(chunk)
+    if content.seekable():
+        content.seek(0)
+    return sha.hexdigest(), size
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Lưu file theo sha256 của nội dung ('blobs/ab/cd/<sha256>.<ext>'): cùng một ảnh tải lên nhiều lần chỉ có một file,
+    các ImageField trỏ chung vào file đó. Mỗi file có một dòng MediaBlob, ref_count được cập nhật trong signals.py,
+    lệnh gc_media_blobs xoá file không còn được tham chiếu.
+    """
+
+    def __init__(self, **kwargs):
+        # Hai request cùng ghi một blob thì nội dung giống nhau, ghi đè không sao
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(**kwargs)
+
+    def save(self, name, content, max_length=None):
+        from .models import MediaBlob
+
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest, size = content_digest(content)
+
+        # Đã có blob cùng nội dung (kể cả khác đuôi file): dùng lại và đánh dấu vừa được dùng,
+        # để gc_media_blobs không xoá trong lúc dòng tham chiếu chưa được lưu
+        blob = MediaBlob.objects.filter(digest=digest).first()
+        if blob is not None:
+            MediaBlob.objects.filter(id=blob.id).update(last_used=timezone.now())
+            if not self.exists(blob.name):
+                # File bị mất: ghi lại
+                super().save(blob.name, content, max_length=max_length)
+            return blob.name
+
+        name = super().save(blob_path(digest, os.path.splitext(name)[1]), content, max_length=max_length)
+        try:
+            with transaction.atomic():
+                MediaBlob.objects.create(digest=digest, name=name, size=size)
+        except IntegrityError:
+            # Request khác vừa lưu cùng nội dung; nếu khác đuôi file thì dùng blob của request đó
+            existing = MediaBlob.objects.get(digest=digest).name
+            if existing != name:
+                self.delete(name)
+            name = existing
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # Tên blob là nội dung, không thêm hậu tố ngẫu nhiên như FileSystemStorage
+        if is_blob(name):
+            return name
+        return super().get_available_name(name, max_length=max_length)
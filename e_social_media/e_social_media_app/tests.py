@@ -1,3 +1,291 @@
-from django.test import TestCase
+import io
+import shutil
+import tempfile
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from . import blobs, caching, dao, polls, reactions, uploads
+from .models import Comment, ConfirmStatus, MediaBlob, PollOption, PollResponse, Post, PostPoll, PostReaction, \
+    ProductPost, ProductPostReaction, Reaction, Role, Upload, User
+from .paginators import KeysetCursorPagination
+
+
+class ToggleLikeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Role.objects.create(role_name='User')
+        ConfirmStatus.objects.bulk_create([ConfirmStatus(id=i, confirm_status_value=str(i)) for i in range(1, 4)])
+        cls.like = Reaction.objects.create(reaction_name=reactions.LIKE)
+        cls.unlike = Reaction.objects.create(reaction_name=reactions.UNLIKE)
+        cls.haha = Reaction.objects.create(reaction_name='Haha')
+        cls.account = User.objects.create(username='buyer').account
+        cls.post = ProductPost.objects.create(post_content='iPhone', account=cls.account)
+
+    def setUp(self):
+        reactions.clear_reaction_ids()
+
+    def assertCounters(self, reaction_count, summary):
+        post = ProductPost.objects.get(id=self.post.id)
+        self.assertEqual(post.reaction_count, reaction_count)
+        self.assertEqual(dao.reaction_summary_map(post.reaction_summaries.all()), summary)
+
+    def test_creates_like(self):
+        reaction, created = reactions.toggle_like(self.post.id, self.account.id)
+
+        self.assertTrue(created)
+        self.assertEqual(reaction.reaction_id, self.like.id)
+        self.assertCounters(1, {self.like.id: 1})
+
+    def test_flips_like_and_unlike(self):
+        reactions.toggle_like(self.post.id, self.account.id)
+
+        reaction, created = reactions.toggle_like(self.post.id, self.account.id)
+        self.assertFalse(created)
+        self.assertEqual(reaction.reaction_id, self.unlike.id)
+        self.assertCounters(1, {self.unlike.id: 1})
+
+        reaction, created = reactions.toggle_like(self.post.id, self.account.id)
+        self.assertFalse(created)
+        self.assertEqual(reaction.reaction_id, self.like.id)
+        self.assertCounters(1, {self.like.id: 1})
+        self.assertEqual(ProductPostReaction.objects.filter(product_post=self.post).count(), 1)
+
+    def test_other_reaction_becomes_like(self):
+        ProductPostReaction.objects.create(product_post=self.post, account=self.account, reaction=self.haha)
+        self.assertCounters(1, {self.haha.id: 1})
+
+        reaction, created = reactions.toggle_like(self.post.id, self.account.id)
+        self.assertFalse(created)
+        self.assertEqual(reaction.reaction_id, self.like.id)
+        self.assertCounters(1, {self.like.id: 1})
+
+        reaction, created = reactions.toggle_like(self.post.id, self.account.id)
+        self.assertEqual(reaction.reaction_id, self.unlike.id)
+        self.assertCounters(1, {self.unlike.id: 1})
+
+    def test_soft_deleted_reaction_is_restored_as_like(self):
+        reaction, _ = reactions.toggle_like(self.post.id, self.account.id)
+        reaction.active = False
+        reaction.save()
+        self.assertCounters(0, {})
+
+        reaction, created = reactions.toggle_like(self.post.id, self.account.id)
+        self.assertFalse(created)
+        self.assertTrue(reaction.active)
+        self.assertEqual(reaction.reaction_id, self.like.id)
+        self.assertCounters(1, {self.like.id: 1})
+
+        reaction, _ = reactions.toggle_like(self.post.id, self.account.id)
+        self.assertEqual(reaction.reaction_id, self.unlike.id)
+        self.assertCounters(1, {self.unlike.id: 1})
+        self.assertEqual(ProductPostReaction.objects.filter(product_post=self.post).count(), 1)
+
+    def test_like_changes_cache_version_not_updated_date(self):
+        updated_date = ProductPost.objects.get(id=self.post.id).updated_date
+        versions = [caching.get_versions([self.post.id])[self.post.id]]
+        for _ in range(2):
+            reactions.toggle_like(self.post.id, self.account.id)
+            versions.append(caching.get_versions([self.post.id])[self.post.id])
+
+        self.assertEqual(versions, sorted(set(versions)))
+        self.assertEqual(ProductPost.objects.get(id=self.post.id).updated_date, updated_date)
+
+        post = ProductPost.objects.get(id=self.post.id)
+        post.post_content = 'iPhone 16'
+        post.save()
+        self.assertGreater(caching.get_versions([post.id])[post.id], versions[-1])
+        self.assertGreater(post.cache_version, versions[-1])
+
+    @override_settings(REACTION_WRITE_BEHIND=True)
+    def test_buffered_toggle_restores_soft_deleted_reaction(self):
+        reaction, _ = reactions.toggle_like(self.post.id, self.account.id)
+        reaction.active = False
+        reaction.save()
+
+        reactions.buffered_toggle_like(self.post.id, self.account.id)
+        reactions.flush_reactions()
+        reaction.refresh_from_db()
+        self.assertTrue(reaction.active)
+        self.assertEqual(reaction.reaction_id, self.like.id)
+        self.assertCounters(1, {self.like.id: 1})
+
+
+class ReactionFlushTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Role.objects.create(role_name='User')
+        ConfirmStatus.objects.bulk_create([ConfirmStatus(id=i, confirm_status_value=str(i)) for i in range(1, 4)])
+        cls.like = Reaction.objects.create(reaction_name=reactions.LIKE)
+        cls.haha = Reaction.objects.create(reaction_name='Haha')
+        cls.account = User.objects.create(username='reader').account
+        cls.post = Post.objects.create(post_content='Hello')
+
+    def setUp(self):
+        self.addCleanup(reactions.flush_reactions)
+
+    def test_failed_flush_keeps_pending_reactions(self):
+        reactions.buffer_reaction(PostReaction, self.post.id, self.account.id, self.like.id)
+        with mock.patch.object(reactions, 'write_reactions', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                reactions.flush_reactions()
+        self.assertEqual(len(reactions.buffer), 1)
+
+        reactions.buffer_reaction(PostReaction, self.post.id, self.account.id, self.haha.id)
+        self.assertEqual(reactions.flush_reactions(), 1)
+        self.assertEqual(list(PostReaction.objects.values_list('reaction_id', flat=True)), [self.haha.id])
+        self.assertEqual(Post.objects.get(id=self.post.id).reaction_count, 1)
+
+    def test_write_reaction_updates_latest_duplicate(self):
+        first, latest = [PostReaction.objects.create(post=self.post, account=self.account, reaction=self.like)
+                         for _ in range(2)]
+        latest.active = False
+        latest.save()
+
+        reactions.write_reaction(PostReaction, self.post.id, self.account.id, self.haha.id)
+        latest.refresh_from_db()
+        self.assertTrue(latest.active)
+        self.assertEqual(latest.reaction_id, self.haha.id)
+        self.assertEqual(PostReaction.objects.get(id=first.id).reaction_id, self.like.id)
+        self.assertEqual(Post.objects.get(id=self.post.id).reaction_count, 2)
+
+
+class CastVoteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Role.objects.create(role_name='User')
+        ConfirmStatus.objects.bulk_create([ConfirmStatus(id=i, confirm_status_value=str(i)) for i in range(1, 4)])
+        cls.accounts = [User.objects.create(username='voter%d' % i).account for i in range(3)]
+        cls.poll = PostPoll.objects.create(title='Poll', start_time=date(2026, 1, 1), end_time=date(2026, 12, 31),
+                                           post=Post.objects.create(post_content='Poll'))
+        cls.first, cls.second = [PollOption.objects.create(poll=cls.poll, option_text=text) for text in 'ab']
+
+    def assertTallies(self, first, second):
+        counts = dict(PollOption.objects.filter(poll=self.poll).values_list('id', 'vote_count'))
+        self.assertEqual(counts, {self.first.id: first, self.second.id: second})
+        self.assertEqual(polls.tally_mismatches(self.poll.id), [])
+
+    def test_new_votes(self):
+        response, previous = polls.cast_vote(self.poll.id, self.first.id, self.accounts[0].id)
+        self.assertIsNone(previous)
+        self.assertEqual(response.option_id, self.first.id)
+        polls.cast_vote(self.poll.id, self.second.id, self.accounts[1].id)
+        polls.cast_vote(self.poll.id, self.first.id, self.accounts[2].id)
+        self.assertTallies(2, 1)
+
+    def test_change_vote(self):
+        polls.cast_vote(self.poll.id, self.first.id, self.accounts[0].id)
+
+        response, previous = polls.cast_vote(self.poll.id, self.second.id, self.accounts[0].id)
+        self.assertEqual(previous, self.first.id)
+        self.assertEqual(response.option_id, self.second.id)
+        self.assertTallies(0, 1)
+        self.assertEqual(PollResponse.objects.filter(poll=self.poll).count(), 1)
+
+    def test_same_vote_again(self):
+        polls.cast_vote(self.poll.id, self.first.id, self.accounts[0].id)
+
+        _, previous = polls.cast_vote(self.poll.id, self.first.id, self.accounts[0].id)
+        self.assertEqual(previous, self.first.id)
+        self.assertTallies(1, 0)
+
+    def test_vote_after_soft_delete(self):
+        response, _ = polls.cast_vote(self.poll.id, self.first.id, self.accounts[0].id)
+        response.active = False
+        response.save()
+        self.assertTallies(0, 0)
+
+        response, previous = polls.cast_vote(self.poll.id, self.second.id, self.accounts[0].id)
+        self.assertIsNone(previous)
+        self.assertTrue(response.active)
+        self.assertTallies(0, 1)
+
+
+class UploadBlobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Role.objects.create(role_name='User')
+        ConfirmStatus.objects.bulk_create([ConfirmStatus(id=i, confirm_status_value=str(i)) for i in range(1, 4)])
+        cls.user = User.objects.create(username='seller')
+        cls.post = ProductPost.objects.create(post_content='iPhone', account=cls.user.account)
+
+    def setUp(self):
+        media_root, chunk_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.addCleanup(shutil.rmtree, chunk_dir)
+        settings = override_settings(MEDIA_ROOT=media_root, CHUNKED_UPLOAD_DIR=chunk_dir,
+                                     IMAGE_VARIANTS_IN_BACKGROUND=False)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload_image(self):
+        data = io.BytesIO()
+        Image.new('RGB', (60, 40), (255, 0, 0)).save(data, 'PNG')
+        data = data.getvalue()
+        upload_id = self.client.post('/uploads/', {'file_name': 'photo.png', 'total_size': len(data)},
+                                     format='json').data['id']
+        self.client.generic('PUT', '/uploads/%s/chunk/?offset=0' % upload_id, data,
+                            content_type='application/octet-stream')
+        response = self.client.post('/uploads/%s/finalize/' % upload_id)
+        self.assertEqual(response.status_code, 200)
+        return upload_id, response.data['file']
+
+    def test_attached_upload_is_released(self):
+        upload_id, name = self.upload_image()
+        self.assertEqual(MediaBlob.objects.get(name=name).ref_count, 1)
+
+        response = self.client.post('/product-posts/%d/comments/' % self.post.id,
+                                    {'comment_content': 'photo', 'upload': upload_id}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(Upload.objects.filter(id=upload_id).exists())
+        self.assertEqual(MediaBlob.objects.get(name=name).ref_count, 1)
+
+        Comment.objects.get(comment_image_url=name).delete()
+        blobs.recount_refs()
+        self.assertEqual(blobs.collect_garbage(timedelta(0)), 1)
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+
+    def test_unattached_upload_expires(self):
+        upload_id, name = self.upload_image()
+
+        self.assertEqual(uploads.clean_stale_uploads(timezone.now(), timezone.now() + timedelta(seconds=1)), 1)
+        self.assertEqual(MediaBlob.objects.get(name=name).ref_count, 0)
+        self.assertEqual(blobs.collect_garbage(timedelta(0)), 1)
+
+
+class KeysetCursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Role.objects.create(role_name='User')
+        ConfirmStatus.objects.bulk_create([ConfirmStatus(id=i, confirm_status_value=str(i)) for i in range(1, 4)])
+        account = User.objects.create(username='seller').account
+        cls.posts = [ProductPost.objects.create(post_content='post %d' % i, account=account) for i in range(7)]
+        ProductPost.objects.filter(id__in=[post.id for post in cls.posts[1::2]]).update(created_date=None)
+        ProductPost.objects.filter(id__in=[post.id for post in cls.posts[:2]]).update(created_date=date(2026, 1, 1))
+
+    def paginate(self, ordering):
+        paginator, ids, url = KeysetCursorPagination(), [], '/product-posts/?page_size=2'
+        paginator.ordering = ordering
+        while url:
+            request = Request(APIRequestFactory().get(url))
+            ids += [post.id for post in paginator.paginate_queryset(ProductPost.objects.all(), request)]
+            url = paginator.get_next_link()
+        return ids
+
+    def test_null_created_date_is_paged_last_when_descending(self):
+        rows = sorted(ProductPost.objects.values_list('created_date', 'id'),
+                      key=lambda row: (row[0] is not None, row[0] or date.min, row[1]), reverse=True)
+        self.assertEqual(self.paginate(('-created_date', '-id')), [post_id for _, post_id in rows])
+
+    def test_null_created_date_is_paged_first_when_ascending(self):
+        rows = sorted(ProductPost.objects.values_list('created_date', 'id'),
+                      key=lambda row: (row[0] is not None, row[0] or date.min, row[1]))
+        self.assertEqual(self.paginate(('created_date', 'id')), [post_id for _, post_id in rows])
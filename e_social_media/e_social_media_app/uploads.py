@@ -0,0 +1,138 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q
+from PIL import Image
+
+from .models import Upload
+
+# Đọc / chép dữ liệu theo từng khối này, không giữ cả phần upload trong bộ nhớ
+READ_SIZE = 64 * 1024
+# Định dạng ảnh được nhận (Image.format) và đuôi file dùng khi lưu; đuôi file client gửi lên không được dùng
+IMAGE_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp'}
+
+
+class PartialFile(File):
+    # FileSystemStorage chuyển (rename) file có temporary_file_path() thay vì chép lại từng byte
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def chunk_dir():
+    path = getattr(settings, 'CHUNKED_UPLOAD_DIR', os.path.join(settings.BASE_DIR, 'upload_chunks'))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def partial_path(upload_id):
+    return os.path.join(chunk_dir(), '%s.part' % upload_id)
+
+
+def start_upload(account, file_name, total_size):
+    upload = Upload.objects.create(account=account, file_name=os.path.basename(file_name), total_size=total_size)
+    open(partial_path(upload.id), 'wb').close()
+    return upload
+
+
+def receive_chunk(stream, length):
+    """
+    Ghi body của request vào một file tạm riêng, đọc từng READ_SIZE byte.
+    Trả về (đường dẫn file tạm, số byte nhận được); mất kết nối giữa chừng thì giữ phần đã nhận.
+    """
+    fd, path = tempfile.mkstemp(suffix='.chunk', dir=chunk_dir())
+    received = 0
+    with os.fdopen(fd, 'wb') as f:
+        try:
+            while received < length:
+                data = stream.read(min(READ_SIZE, length - received))
+                if not data:
+                    break
+                f.write(data)
+                received += len(data)
+        except OSError:
+            # UnreadablePostError: client ngắt kết nối, phần đã ghi vẫn đúng vị trí nên vẫn được nối vào
+            pass
+    return path, received
+
+
+def append_chunk(upload_id, offset, chunk_path, size):
+    """
+    Nối phần đã nhận vào file tạm của upload nếu offset khớp với số byte đã có.
+    Trả về (Upload, đã nối hay chưa); file chunk_path luôn bị xoá.
+    """
+    try:
+        with transaction.atomic():
+            # Chỉ khoá dòng trong lúc chép trên đĩa, không khoá trong lúc đọc dữ liệu chậm từ mạng
+            upload = Upload.objects.select_for_update().get(id=upload_id)
+            if upload.completed or upload.received_size != offset or offset + size > upload.total_size:
+                return upload, False
+            with open(partial_path(upload.id), 'ab') as dst, open(chunk_path, 'rb') as src:
+                # Bỏ phần thừa của lần ghi bị ngắt trước đó (chưa được tính vào received_size)
+                dst.truncate(offset)
+                shutil.copyfileobj(src, dst, READ_SIZE)
+            upload.received_size = offset + size
+            upload.save(update_fields=['received_size', 'updated_date'])
+            return upload, True
+    finally:
+        os.remove(chunk_path)
+
+
+def finalize_upload(upload_id):
+    """Kiểm tra đủ dữ liệu và là ảnh hợp lệ rồi chuyển file tạm vào storage. Raise ValueError nếu không hợp lệ."""
+    with transaction.atomic():
+        upload = Upload.objects.select_for_update().get(id=upload_id)
+        if upload.completed:
+            return upload
+        if upload.received_size != upload.total_size:
+            raise ValueError('Upload is incomplete: %d of %d bytes received.' % (upload.received_size, upload.total_size))
+
+        path = partial_path(upload.id)
+        try:
+            # Upload chỉ dùng cho các ImageField; verify() không giải mã toàn bộ ảnh
+            with Image.open(path) as image:
+                image_format = image.format
+                image.verify()
+        except Exception:
+            raise ValueError('Uploaded file is not a valid image.')
+        if image_format not in IMAGE_EXTENSIONS:
+            raise ValueError('Unsupported image format: %s.' % image_format)
+
+        # Đuôi file theo định dạng thật của ảnh: 'avatar.html' chứa GIF được lưu thành '.gif'
+        name = os.path.splitext(upload.file_name)[0] + IMAGE_EXTENSIONS[image_format]
+        with open(path, 'rb') as f:
+            upload.file.save(name, PartialFile(f), save=False)
+        upload.save(update_fields=['file', 'updated_date'])
+    if os.path.exists(path):
+        # Storage không chuyển được file (khác ổ đĩa / storage từ xa) nên đã chép lại
+        os.remove(path)
+    return upload
+
+
+def clean_stale_uploads(before, finalized_before=None):
+    """
+    Xoá upload chưa finalize không được cập nhật từ `before` và file tạm của chúng, cùng upload đã finalize nhưng chưa
+    được gắn vào đâu từ `finalized_before` (bỏ tham chiếu để gc_media_blobs dọn blob). Trả về số upload đã xoá.
+    """
+    stale = list(Upload.objects.filter(Q(file__isnull=True) | Q(file=''), updated_date__lt=before)
+                 .values_list('id', flat=True))
+    for upload_id in stale:
+        if os.path.exists(partial_path(upload_id)):
+            os.remove(partial_path(upload_id))
+    Upload.objects.filter(id__in=stale).delete()
+    removed = len(stale)
+    if finalized_before is not None:
+        # delete() của queryset vẫn gửi post_delete cho từng dòng: signals bớt tham chiếu blob
+        _, deleted = Upload.objects.exclude(Q(file__isnull=True) | Q(file='')) \
+            .filter(updated_date__lt=finalized_before).delete()
+        removed += deleted.get(Upload._meta.label, 0)
+
+    # Phần nhận dở của các request bị kill trước khi kịp xoá
+    for name in os.listdir(chunk_dir()):
+        path = os.path.join(chunk_dir(), name)
+        if name.endswith('.chunk') and os.path.getmtime(path) < before.timestamp():
+            os.remove(path)
+    return removed
@@ -2,6 +2,7 @@ from django.urls import path, include
 from rest_framework import routers
 
 from .views import *
+from .polls import poll_results_stream
 
 router = routers.DefaultRouter()
 
@@ -21,6 +22,8 @@ router.register('accounts', AccountViewSet, basename='accounts')
 
 router.register('comment', CommentViewSet, basename='comment')
 
+router.register('uploads', UploadViewSet, basename='uploads')
+
 router.register('categories', CategoryViewSet, basename='categories')
 
 router.register('product-posts', ProductPostViewSet, basename='product-posts')
@@ -31,6 +34,8 @@ router.register(r'poll-options', PollOptionViewSet)
 
 router.register(r'poll-responses', PollResponseViewSet)
 
+router.register('rooms', RoomViewSet, basename='rooms')
+
 app_name = 'app'
 urlpatterns = [
     path('', include(router.urls)),
@@ -44,8 +49,9 @@ urlpatterns = [
     path('product-posts/<int:post_id>/like/', PostListView.as_view(), name='toggle-like'),
     path('product-posts/<int:post_id>/', PostListView.get_post_by_id, name='get_post_by_id'),
     path('product-posts/detail/<int:product_post_id>/', PostListView.as_view(), name='product-post-detail'),
-    path('product-posts/<int:post_id>/comments/', PostListView.add_comment),
+    path('product-posts/<int:post_id>/comments/', ProductPostCommentView.as_view(), name='product-post-comments'),
     path('posts/', PostViewSet.as_view({'create':'create_post'}), name='create_post'),
     path('polls/', PostPollViewSet.as_view({'create':'create_poll'}), name='create_poll'),
+    path('polls/<int:poll_id>/results/stream/', poll_results_stream, name='poll-results-stream'),
     path('productposts/statistics/', ProductPostStatisticsView.as_view(), name='productpost-statistics'),
 ]
@@ -1,28 +1,46 @@
 from django.contrib.auth import authenticate, get_user_model
 from django.contrib.auth.hashers import check_password
-from django.db import transaction
-from django.db.models import Q, Count
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q, Count, Sum
 from django.db.models.functions import ExtractMonth, ExtractYear
 from django.shortcuts import render
 from django.utils.decorators import method_decorator
 from rest_framework import viewsets, generics, permissions, status
 from rest_framework.decorators import action, api_view
 from rest_framework.exceptions import NotFound
-from rest_framework.parsers import MultiPartParser
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from . import dao
+from . import dao, caching, search, facets, reactions, reaction_buffer, uploads, polls
 from .models import *
 from .serializers import *
 from .paginators import *
 from .permisssions import *
 from .decorators import *
+from .renderers import streaming_json_response
+
+# ==== STREAMING ====
+class StreamingListMixin:
+    # List không phân trang: ghi từng phần tử JSON trong lúc đọc queryset thay vì dựng cả response trong bộ nhớ
+    stream_chunk_size = 500
+
+    def list(self, request, *args, **kwargs):
+        if self.paginator is not None or not isinstance(request.accepted_renderer, JSONRenderer):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        child = self.get_serializer(many=True).child
+        items = (child.to_representation(obj) for obj in queryset.iterator(chunk_size=self.stream_chunk_size))
+        return streaming_json_response(items, request=request, batch_size=self.stream_chunk_size)
 
-# ====ROLE====
 
 # ==== ROLE ====
+@method_decorator(conditional_get(table_version(Role)), name='list')
+@method_decorator(conditional_get(table_version(Role)), name='retrieve')
 class RoleViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAPIView):
     queryset = Role.objects.all()
     serializer_class = RoleSerializer
@@ -42,14 +60,13 @@ class UserViewSet(viewsets.ViewSet, generics.RetrieveAPIView, generics.ListAPIVi
     def get_queryset(self):
         name = self.request.query_params.get('name')
         if name:
-            queries = self.queryset
-            for name_part in name.split():
-                queries = queries.filter(Q(first_name__icontains=name_part) | Q(last_name__icontains=name_part))
-            return queries
+            user_ids = search.search_user_ids(name)
+            if user_ids is not None:
+                return self.queryset.filter(id__in=user_ids)
         return self.queryset
 
     def get_permissions(self):
-        if self.action in ['list', 'update', 'partial_update', 'destroy', 'current_user', 'get_account_by_user_id', 'search_user', 'get_user_by_status']:
+        if self.action in ['list', 'update', 'partial_update', 'destroy', 'current_user', 'get_account_by_user_id', 'search_user', 'get_user_by_status', 'autocomplete']:
             return [permissions.IsAuthenticated()]
         return [permissions.AllowAny()]
 
@@ -64,6 +81,16 @@ class UserViewSet(viewsets.ViewSet, generics.RetrieveAPIView, generics.ListAPIVi
     def current_user(self, request):
         return Response(UserSerializer(request.user).data, status=status.HTTP_200_OK)
 
+    @action(methods=['GET'], detail=False, url_path='autocomplete')
+    def autocomplete(self, request):
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            limit = 10
+        users = search.autocomplete_users(request.query_params.get('q', ''), limit)
+        return Response(UserSerializerForSearch(users, many=True, context={'request': request}).data,
+                        status=status.HTTP_200_OK)
+
     @action(methods=['GET'], detail=True, url_path='account')
     def get_account_by_user_id(self, request, pk):
         try:
@@ -75,7 +102,7 @@ class UserViewSet(viewsets.ViewSet, generics.RetrieveAPIView, generics.ListAPIVi
 # ==== POST ====
 @method_decorator(authorization, name='dispatch')
 class PostViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAPIView, generics.CreateAPIView, generics.UpdateAPIView, generics.DestroyAPIView):
-    queryset = Post.objects.filter(active=True)
+    queryset = Post.objects.filter(active=True).prefetch_related('reaction_summaries')
     serializer_class = PostSerializer
     pagination_class = MyPageSize
 
@@ -86,6 +113,26 @@ class PostViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAPIVi
             return [IsAdmin()]
         return [permissions.IsAuthenticated()]
 
+    def add_pending_reactions(self, payloads):
+        # PostReaction tạo ở chế độ ghi gộp chưa có trong reaction_count / reaction_summary của DB
+        return caching.add_pending_reactions([payload['id'] for payload in payloads], payloads,
+                                             self.get_serializer_context(), PostReaction)
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        self.add_pending_reactions(response.data['results'] if isinstance(response.data, dict) else response.data)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        self.add_pending_reactions([response.data])
+        return response
+
+    def update(self, request, *args, **kwargs):
+        response = super().update(request, *args, **kwargs)
+        self.add_pending_reactions([response.data])
+        return response
+
     @api_view(['POST'])
     def create_post(request):
         post_serializer = PostSerializer(data=request.data)
@@ -95,6 +142,8 @@ class PostViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAPIVi
         return Response(post_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 # ==== REACTION ====
+@method_decorator(conditional_get(table_version(Reaction)), name='list')
+@method_decorator(conditional_get(table_version(Reaction)), name='retrieve')
 class ReactionViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAPIView):
     queryset = Reaction.objects.filter(active=True)
     serializer_class = ReactionSerializer
@@ -103,9 +152,13 @@ class ReactionViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveA
 # ==== POST REACTION ====
 @method_decorator(authorization, name='dispatch')
 class PostReactionViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAPIView, generics.CreateAPIView, generics.UpdateAPIView, generics.DestroyAPIView):
-    queryset = PostReaction.objects.select_related('account', 'post', 'reaction').filter(active=True)
+    queryset = PostReaction.objects.filter(active=True)
     serializer_class = PostReactionSerializer
-    pagination_class = MyPageSize
+    pagination_class = KeysetCursorPagination
+
+    def get_queryset(self):
+        return dao.select_related_for(self.queryset, self.get_serializer(),
+                                      ['account', 'account.user', 'account.role', 'post', 'reaction'])
 
     def get_permissions(self):
         if self.action in ['partial_update', 'destroy']:
@@ -119,13 +172,32 @@ class PostReactionViewSet(viewsets.ViewSet, generics.ListAPIView, generics.Retri
             return UpdatePostReactionSerializer
         return self.serializer_class
 
+    def create(self, request, *args, **kwargs):
+        if not reaction_buffer.enabled():
+            return super().create(request, *args, **kwargs)
+
+        # Ghi gộp: chỉ giữ reaction cuối cùng của mỗi (bài, account), ghi xuống DB ở lần flush sau
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        if data.get('account') is None:
+            # Không có account thì không gộp theo (bài, account) được: ghi ngay như cũ
+            self.perform_create(serializer)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        reactions.buffer_reaction(PostReaction, data['post'].id, data['account'].id, data['reaction'].id)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
 # ==== ACCOUNT ====
 @method_decorator(authorization, name='dispatch')
 class AccountViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAPIView, generics.CreateAPIView, generics.UpdateAPIView, generics.DestroyAPIView):
-    queryset = Account.objects.select_related('role', 'user').filter(active=True)
+    queryset = Account.objects.filter(active=True)
     serializer_class = AccountSerializer
     pagination_class = MyPageSize
-    parser_classes = [MultiPartParser]
+    # JSON: gán avatar bằng id upload chia nhỏ ({"upload": "<id>"}) thay vì gửi cả file qua multipart
+    parser_classes = [MultiPartParser, JSONParser]
+
+    def get_queryset(self):
+        return dao.select_related_for(self.queryset, self.get_serializer(), ['role', 'user'])
 
     def create(self, request, *args, **kwargs):
         phone_number = self.request.data.get('phone_number')
@@ -145,6 +217,7 @@ class AccountViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAP
 
         return super().update(request, *args, **kwargs)
 
+    @method_decorator(conditional_get(current_account_version))
     @action(methods=['GET'], detail=False, url_path='current-account')
     def current_account(self, request):
         try:
@@ -156,19 +229,68 @@ class AccountViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAP
 
     @action(methods=['GET'], detail=False, url_path='current-product-posts')
     def get_current_posts(self, request):
-        product_posts = request.user.account.productpost_set.filter(active=True).order_by('-created_date')
-        paginator = MyPageSize()
+        product_posts = request.user.account.productpost_set.filter(active=True).only('id', 'created_date')
+        paginator = KeysetCursorPagination()
         paginated = paginator.paginate_queryset(product_posts, request)
-        serializer = ProductPostSerializer(paginated, many=True, context={'request': request})
-        return paginator.get_paginated_response(serializer.data)
+        data = caching.render_product_posts([post.id for post in paginated], {'request': request})
+        return paginator.get_paginated_response(data)
+
+# ==== UPLOAD ====
+@method_decorator(authorization, name='dispatch')
+class UploadViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.RetrieveAPIView):
+    """
+    Upload chia nhỏ, gửi tiếp được sau khi mất kết nối:
+    POST uploads/ {file_name, total_size} -> PUT uploads/<id>/chunk/?offset=<n> (body là dữ liệu thô của phần)
+    -> POST uploads/<id>/finalize/ -> gửi {"upload": "<id>"} khi tạo / sửa account, bài, comment.
+    GET uploads/<id>/ trả về received_size là offset để gửi tiếp.
+    """
+    serializer_class = UploadSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Upload.objects.filter(account__user=self.request.user, active=True)
+
+    def perform_create(self, serializer):
+        data = serializer.validated_data
+        serializer.instance = uploads.start_upload(self.request.user.account, data['file_name'], data['total_size'])
+
+    @action(methods=['PUT'], detail=True, url_path='chunk')
+    def chunk(self, request, pk):
+        upload = self.get_object()
+        try:
+            offset = int(request.query_params['offset'])
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            return Response({'offset': ['This field is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        if length <= 0 or length > settings.CHUNKED_UPLOAD_MAX_CHUNK_SIZE:
+            return Response({'error': f'Chunk size must be between 1 and {settings.CHUNKED_UPLOAD_MAX_CHUNK_SIZE} bytes.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if offset != upload.received_size or offset + length > upload.total_size or upload.completed:
+            # Client gửi lại từ received_size
+            return Response(self.get_serializer(upload).data, status=status.HTTP_409_CONFLICT)
+
+        # Đọc body trực tiếp từ stream (không qua request.data) và ghi ra đĩa từng khối
+        chunk_path, received = uploads.receive_chunk(request.stream, length)
+        upload, appended = uploads.append_chunk(upload.id, offset, chunk_path, received)
+        return Response(self.get_serializer(upload).data,
+                        status=status.HTTP_200_OK if appended else status.HTTP_409_CONFLICT)
+
+    @action(methods=['POST'], detail=True, url_path='finalize')
+    def finalize(self, request, pk):
+        upload = self.get_object()
+        try:
+            upload = uploads.finalize_upload(upload.id)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(upload).data)
 
 @method_decorator(authorization, name='dispatch')
 class CommentViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAPIView, generics.CreateAPIView,
                      generics.UpdateAPIView, generics.DestroyAPIView):
     queryset = Comment.objects.filter(active=True).all()
     serializer_class = CommentSerializer
-    pagination_class = MyPageSize
-    parser_classes = [MultiPartParser, ]
+    pagination_class = KeysetCursorPagination
+    parser_classes = [MultiPartParser, JSONParser]
 
     def get_permissions(self):
         if self.action in ['update', 'partial_update']:
@@ -185,8 +307,17 @@ class CommentViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAP
             return UpdateCommentSerializer
         return self.serializer_class
 
+    @action(methods=['GET'], detail=True, url_path='thread')
+    def thread(self, request, pk):
+        # Cả cây trả lời của comment (kể cả chính nó), theo thứ tự path
+        comment = self.get_object()
+        paginator = self.pagination_class()
+        paginator.ordering = ('path',)
+        page = paginator.paginate_queryset(dao.load_comment_thread(comment, self.get_queryset()), request)
+        return paginator.get_paginated_response(self.get_serializer(page, many=True).data)
+
 @method_decorator(decorator=authorization, name='dispatch')
-class PostPollViewSet(viewsets.ModelViewSet):
+class PostPollViewSet(StreamingListMixin, viewsets.ModelViewSet):
     queryset = PostPoll.objects.all()
     serializer_class = PostPollSerializer
 
@@ -206,9 +337,31 @@ class PostPollViewSet(viewsets.ModelViewSet):
 
         return Response(poll_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def retrieve(self, request, *args, **kwargs):
+        # get_object vẫn kiểm tra quyền như mọi request; poll đã đóng lấy payload từ cache, không serialize lại
+        # option / kết quả
+        poll = self.get_object()
+        data = caching.get_closed_poll(poll.id) if poll.is_closed else None
+        if data is None:
+            data = self.get_serializer(poll).data
+            if poll.is_closed:
+                caching.set_closed_poll(poll.id, data)
+        return Response(data)
+
+    @action(methods=['POST'], detail=True, url_path='vote', permission_classes=[permissions.IsAuthenticated])
+    def vote(self, request, pk):
+        # Bỏ phiếu / đổi phiếu: {"option": <id>}; 201 khi là phiếu mới, 200 khi đổi (hoặc giữ nguyên) phiếu
+        poll = self.get_object()
+        serializer = PollVoteSerializer(data=request.data, context={'request': request, 'poll': poll})
+        serializer.is_valid(raise_exception=True)
+        response, previous = polls.cast_vote(poll.id, serializer.validated_data['option'].id, request.user.account.id)
+        data = PollResponseSerializer(response).data
+        data['previous_option'] = previous
+        return Response(data, status=status.HTTP_201_CREATED if previous is None else status.HTTP_200_OK)
+
 
 @method_decorator(decorator=authorization, name='dispatch')
-class PollResponseViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAPIView, generics.CreateAPIView,
+class PollResponseViewSet(StreamingListMixin, viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAPIView, generics.CreateAPIView,
                           generics.UpdateAPIView, generics.DestroyAPIView):
     queryset = PollResponse.objects.all()
     serializer_class = PollResponseSerializer
@@ -226,7 +379,7 @@ class PollResponseViewSet(viewsets.ViewSet, generics.ListAPIView, generics.Retri
         return self.serializer_class
 
 @method_decorator(decorator=authorization, name='dispatch')
-class PollOptionViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAPIView, generics.CreateAPIView,
+class PollOptionViewSet(StreamingListMixin, viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAPIView, generics.CreateAPIView,
                         generics.UpdateAPIView, generics.DestroyAPIView):
     queryset = PollOption.objects.all()
     serializer_class = PollOptionSerializer
@@ -243,6 +396,51 @@ class PollOptionViewSet(viewsets.ViewSet, generics.ListAPIView, generics.Retriev
             return UpdatePollOptionSerializer
         return self.serializer_class
 
+# ==== CHAT ====
+@method_decorator(decorator=authorization, name='dispatch')
+class RoomViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAPIView):
+    # Tin nhắn gửi / nhận qua WebSocket (chat.py); REST dùng để mở room và tải lịch sử
+    serializer_class = RoomSerializer
+    pagination_class = MyPageSize
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        account_id = self.request.user.account.id
+        return Room.objects.filter(Q(first_user_id=account_id) | Q(second_user_id=account_id), active=True) \
+            .select_related('first_user', 'second_user').order_by('-received_message_date')
+
+    def create(self, request):
+        # {"account": <id người kia>}: trả room của hai người, tạo nếu chưa có
+        me = request.user.account
+        try:
+            other = Account.objects.filter(id=int(request.data.get('account'))).first()
+        except (TypeError, ValueError):
+            other = None
+        if other is None or other.id == me.id:
+            return Response({'account': 'Invalid account.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        room = Room.objects.filter(Q(first_user=me, second_user=other) | Q(first_user=other, second_user=me)).first()
+        created = room is None
+        if created:
+            # Room mới luôn xếp account id nhỏ trước để unique_together chặn được hai room cho cùng một cặp
+            first, second = sorted([me, other], key=lambda account: account.id)
+            try:
+                with transaction.atomic():
+                    room = Room.objects.create(first_user=first, second_user=second)
+            except IntegrityError:
+                room = Room.objects.get(first_user=first, second_user=second)
+                created = False
+        return Response(RoomSerializer(room).data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    @action(methods=['GET'], detail=True, url_path='messages')
+    def messages(self, request, pk):
+        # Lịch sử tin nhắn, mới nhất trước; ?cursor= để tải tin cũ hơn
+        room = self.get_object()
+        paginator = KeysetCursorPagination()
+        paginator.ordering = ('-id',)
+        page = paginator.paginate_queryset(Message.objects.filter(room=room, active=True), request)
+        return paginator.get_paginated_response(MessageSerializer(page, many=True).data)
+
 #ANOTHER VIEW
 
 class LoginView(APIView):
@@ -288,6 +486,7 @@ class SignUpView(APIView):
 class CurrentAccountViewSet(viewsets.ViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
+    @method_decorator(conditional_get(current_account_version))
     def retrieve(self, request):
         account = Account.objects.get(user=request.user)
         serializer = CurrentAccountSerializer(account)
@@ -370,52 +569,112 @@ class ProductPostViewSet(viewsets.ViewSet, generics.ListAPIView, generics.Retrie
         self.perform_destroy(instance)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(methods=['GET'], detail=False, url_path='search')
+    def search_posts(self, request):
+        keyword = request.query_params.get('q', '').strip()
+        if not keyword:
+            return Response({'q': ['This field is required.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        post_ids = search.search_product_posts(keyword).values_list('post_id', flat=True)
+        paginator = MyPageSize()
+        page = paginator.paginate_queryset(post_ids, request)
+        return paginator.get_paginated_response(caching.render_product_posts(list(page), {'request': request}))
+
+    @action(methods=['GET'], detail=False, url_path='catalog')
+    def catalog(self, request):
+        params = ProductCatalogQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        filters = params.validated_data
+
+        # Catalog chỉ gồm bài có sản phẩm; các bộ lọc đi theo index (category, active, ...) của ProductPost
+        q = ProductPost.objects.filter(category__isnull=False, account__isnull=False)
+        if filters.get('category'):
+            q = q.filter(category_id__in=filters['category'])
+        if filters.get('min_price') is not None:
+            q = q.filter(price__gte=filters['min_price'])
+        if filters.get('max_price') is not None:
+            q = q.filter(price__lte=filters['max_price'])
+        if filters['active'] is not None:
+            q = q.filter(active=filters['active'])
+        if filters.get('owner'):
+            q = q.filter(account_id=filters['owner'])
+
+        paginator = KeysetCursorPagination()
+        paginator.ordering = GetPostsByCategoryView.sort_orderings[filters['sort']]
+        page = paginator.paginate_queryset(q.only(*[field.lstrip('-') for field in paginator.ordering]), request)
+        response = paginator.get_paginated_response(
+            caching.render_product_posts([post.id for post in page], {'request': request}))
+        # Số đếm facet đọc từ ProductPostCatalogFacet / ProductPostFacet, không GROUP BY trên ProductPost
+        response.data['facets'] = facets.get_facets(category_ids=filters.get('category'),
+                                                    min_price=filters.get('min_price'),
+                                                    max_price=filters.get('max_price'),
+                                                    active=filters['active'], account_id=filters.get('owner'))
+        return response
+
     @api_view(['GET'])
     def get_post_by_id(request, post_id):
         print("Request ", request)
-        try:
-            post = ProductPost.objects.get(id=post_id)
-            serializer = ProductPostSerializer(post)
-            print(serializer.data)
-            return Response(serializer.data)
-        except ProductPost.DoesNotExist:
+        data = caching.render_product_post(post_id, {'request': request})
+        if data is None:
             return Response(status=status.HTTP_404_NOT_FOUND)
+        return Response(data)
 
 
+@method_decorator(conditional_get(table_version(Category)), name='list')
+@method_decorator(conditional_get(table_version(Category)), name='retrieve')
 class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
 class GetPostsByCategoryView(APIView):
+    pagination_class = KeysetCursorPagination
+    # Mỗi kiểu sắp xếp khớp với một index (category, active, ...) của ProductPost
+    sort_orderings = {
+        'newest': ('-created_date', '-id'),
+        'price': ('price', 'id'),
+        'popular': ('-reaction_count', '-id'),
+    }
+
     def get(self, request, category_id):
-        productposts = ProductPost.objects.filter(product__category_id=category_id)
-        serializer = ProductPostSerializer(productposts, many=True)
-        return Response(serializer.data)
+        sort = request.query_params.get('sort', 'newest')
+        if sort not in self.sort_orderings:
+            return Response({'sort': [f'Must be one of: {", ".join(self.sort_orderings)}.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = self.pagination_class()
+        paginator.ordering = self.sort_orderings[sort]
+        product_posts = ProductPost.objects.filter(category_id=category_id, active=True) \
+            .only(*[field.lstrip('-') for field in paginator.ordering])
+        page = paginator.paginate_queryset(product_posts, request)
+        data = caching.render_product_posts([post.id for post in page], {'request': request})
+        return paginator.get_paginated_response(data)
 
 class PostListView(APIView):
     serializer_class = ProductPostSerializer
-    pagination_class = MyPageSize
+    pagination_class = KeysetCursorPagination
 
     def get_queryset(self):
-        return ProductPost.objects.all().order_by('-created_date')
+        # Chỉ cần id/created_date để phân trang, nội dung bài lấy từ caching.render_product_posts
+        return ProductPost.objects.only('id', 'created_date')
+
+    def get_serializer_context(self):
+        return {'request': self.request}
 
+    @method_decorator(conditional_get(product_post_version))
     def get(self, request, *args, **kwargs):
         print("Request2 ", request)
         product_post_id = kwargs.get('product_post_id', None)
         if product_post_id:
-            try:
-                post = self.get_queryset().get(id=product_post_id)
-                serializer = self.serializer_class(post)
-                return Response(serializer.data)
-            except ProductPost.DoesNotExist:
+            data = caching.render_product_post(product_post_id, self.get_serializer_context())
+            if data is None:
                 return Response({"detail": "ProductPost not found"}, status=status.HTTP_404_NOT_FOUND)
+            return Response(data)
 
         paginator = self.pagination_class()
         queryset = self.get_queryset()
         page = paginator.paginate_queryset(queryset, request)
-        serializer = self.serializer_class(page, many=True)
-        print(serializer.data)
-        return paginator.get_paginated_response(serializer.data)
+        data = caching.render_product_posts([post.id for post in page], self.get_serializer_context())
+        return paginator.get_paginated_response(data)
 
     def post(self, request, *args, **kwargs):
         print("Request data:", request.data)  # In dữ liệu gửi lên để kiểm tra
@@ -428,37 +687,66 @@ class PostListView(APIView):
 
     def patch(self, request, post_id):
         account_id = request.data.get("account", {}).get("id")
-        print(account_id)
+        if not account_id:
+            return Response({"account": ["This field is required."]}, status=status.HTTP_400_BAD_REQUEST)
 
         return self.toggle_like(request, post_id, account_id)
 
     def toggle_like(self, request, post_id, account_id):
+        if reaction_buffer.enabled():
+            # Ghi gộp: trả về trạng thái mới ngay, dòng reaction được ghi ở lần flush sau
+            try:
+                new_id = reactions.buffered_toggle_like(post_id, account_id)
+            except ProductPostReaction.DoesNotExist:
+                return Response({"detail": "ProductPost or account not found"}, status=status.HTTP_404_NOT_FOUND)
+            detail = "Liked" if new_id == reactions.reaction_id(reactions.LIKE) else "Unliked"
+            return Response({"detail": detail}, status=status.HTTP_202_ACCEPTED)
 
-        existing_reaction = ProductPostReaction.objects.filter(
-            product_post_id=post_id,
-            account_id=account_id
-        ).first()
-
-        if existing_reaction:
-            if existing_reaction.reaction_id == 1:
-                existing_reaction.reaction_id = 2
-                existing_reaction.save()
-                return Response({"detail": "Unliked"}, status=status.HTTP_200_OK)
-            else:
-                existing_reaction.reaction_id = 1
-                existing_reaction.save()
-                return Response({"detail": "Liked"}, status=status.HTTP_200_OK)
-        else:
-            reaction = ProductPostReaction.objects.create(
-                product_post_id=post_id,
-                account_id=account_id,
-                reaction_id=1
-            )
+        try:
+            reaction, created = reactions.toggle_like(post_id, account_id)
+        except (IntegrityError, ProductPostReaction.DoesNotExist):
+            # Khoá ngoại không hợp lệ: bài hoặc account không tồn tại
+            return Response({"detail": "ProductPost or account not found"}, status=status.HTTP_404_NOT_FOUND)
+        if created:
             serializer = ProductPostReactionSerializer(reaction)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
+        if reaction.reaction_id == reactions.reaction_id(reactions.LIKE):
+            return Response({"detail": "Liked"}, status=status.HTTP_200_OK)
+        return Response({"detail": "Unliked"}, status=status.HTTP_200_OK)
 
-    @api_view(['POST'])
-    def add_comment(request, post_id):
+    @api_view(['GET'])
+    def get_post_by_id(request, post_id):
+        print("Request ", request)
+        data = caching.render_product_post(post_id, {'request': request})
+        if data is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return Response(data)
+
+class ProductPostCommentView(APIView):
+    pagination_class = KeysetCursorPagination
+
+    def get(self, request, post_id):
+        # Mặc định là trang comment gốc (kèm reply_count); ?parent=<id> trả về cả cây trả lời của comment đó
+        comments = Comment.objects.filter(post_id=post_id, active=True).select_related('account__user')
+        paginator = self.pagination_class()
+        parent_id = request.query_params.get('parent')
+        if parent_id:
+            try:
+                parent_id = int(parent_id)
+            except ValueError:
+                return Response({'parent': ['A valid integer is required.']}, status=status.HTTP_400_BAD_REQUEST)
+            parent = Comment.objects.filter(id=parent_id, post_id=post_id, active=True).only('post_id', 'path').first()
+            if parent is None:
+                raise NotFound()
+            comments = dao.load_comment_thread(parent, comments).exclude(id=parent.id)
+            paginator.ordering = ('path',)
+        else:
+            comments = comments.filter(parent__isnull=True)
+        page = paginator.paginate_queryset(comments, request)
+        serializer = CommentSerializerForPostProduct(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    def post(self, request, post_id):
         post = ProductPost.objects.get(id=post_id)
 
         comment_content = request.data.get("comment_content")
@@ -469,7 +757,9 @@ class PostListView(APIView):
         data = {
             "comment_content": comment_content,
             "post": post.id,
-            "account": request.user.account.id
+            "account": request.user.account.id,
+            "parent": request.data.get("parent"),
+            "upload": request.data.get("upload")
         }
 
         serializer = CommentSerializerForPost(data=data, context={'request': request})
@@ -480,17 +770,6 @@ class PostListView(APIView):
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    @api_view(['GET'])
-    def get_post_by_id(request, post_id):
-        print("Request ", request)
-        try:
-            post = ProductPost.objects.get(id=post_id)
-            serializer = ProductPostSerializer(post)
-            print(serializer.data)
-            return Response(serializer.data)
-        except Post.DoesNotExist:
-            return Response(status=status.HTTP_404_NOT_FOUND)
-
 class ProductPostStatisticsView(APIView):
     def get(self, request, *args, **kwargs):
         month = request.query_params.get('month')
@@ -503,12 +782,18 @@ class ProductPostStatisticsView(APIView):
             ).annotate(
                 month=ExtractMonth('created_date'),
                 year=ExtractYear('created_date')
-            ).values('month', 'year').annotate(productpost_count=Count('id'))
+            ).values('month', 'year').annotate(productpost_count=Count('id'),
+                                                  reaction_total=Sum('reaction_count'),
+                                                  comment_total=Sum('comment_count'))
 
         else:
             statistics = ProductPost.objects.annotate(
                 month=ExtractMonth('created_date'),
                 year=ExtractYear('created_date')
-            ).values('month', 'year').annotate(productpost_count=Count('id'))
+            ).values('month', 'year').annotate(productpost_count=Count('id'),
+                                                  reaction_total=Sum('reaction_count'),
+                                                  comment_total=Sum('comment_count'))
 
-        return Response(statistics)
+        if not isinstance(request.accepted_renderer, JSONRenderer):
+            return Response(statistics)
+        return streaming_json_response(statistics.iterator(), request=request)